@@ -10,6 +10,7 @@ import ftplib
 import os
 import tarfile
 import gzip
+import zlib
 from osgeo import gdal
 import csv
 import logging
@@ -20,9 +21,12 @@ from osgeo import ogr
 import fileinput
 import datetime as dt
 import configparser
+import copy
 import sys
 import argparse
 import urllib.request
+import urllib.error
+import email.utils
 import requests
 from requests.auth import HTTPDigestAuth
 import time
@@ -36,10 +40,14 @@ import geopandas as gpd
 from lxml import etree
 import fiona
 import rasterio
-from rasterio.warp import calculate_default_transform, reproject, Resampling
+from rasterio.warp import calculate_default_transform, reproject, transform_bounds, Resampling
+from rasterio.transform import from_origin, Affine
+from rasterio.features import geometry_mask
 from pyproj import Transformer
 import base64
 import itertools
+import math
+import re
 import ssl
 import pytz
 import xarray as xr
@@ -47,7 +55,19 @@ import rioxarray
 from tzlocal import get_localzone
 import pygrib
 import shutil
-from joblib import Parallel,delayed
+import tempfile
+import contextlib
+import sqlite3
+import hashlib
+import asyncio
+import functools
+import threading
+import socket
+import subprocess
+import collections
+import multiprocessing
+import multiprocessing.connection
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 
 from getpass import getpass
 try:
@@ -58,7 +78,9 @@ except ImportError:
     from urlparse import urlparse
     from urllib2 import urlopen, Request, HTTPError, URLError, build_opener, HTTPCookieProcessor
 
-def main(config_path, start_date, end_date, time_int, prod_str):
+def main(config_path, start_date, end_date, time_int, prod_str, force_flag = False, chunk_str = None, daemon_flag = False,
+         n_io = None, n_cpu = None, jobs_str = None, backend_str = None, queue_flag = False, worker_flag = False,
+         plan_flag = False, latest_flag = False):
     """SHREAD main function
 
     Parameters
@@ -66,7 +88,8 @@ def main(config_path, start_date, end_date, time_int, prod_str):
     config_path : string
         relative file path to config file
     start_date : string
-        first day of data in %Y%m%d format
+        first day of data in %Y%m%d format, or number of days before today
+        (e.g. -3), the number of days checked in daemon mode
     end_date : string
         last day of data in %Y%m%d format
     time_int : string
@@ -85,6 +108,36 @@ def main(config_path, start_date, end_date, time_int, prod_str):
             - srpt
             - modscag
             - modis # not yet supported
+    force_flag : boolean
+        True : ignore run ledger and reprocess tasks completed by previous runs
+    chunk_str : string
+        backfill chunk size, None to run the date range at once
+        Accepted:
+            - wy: water year
+            - month: calendar month
+    daemon_flag : boolean
+        True : keep running, processing new data as soon as it is posted
+    n_io : integer
+        number of download threads, overrides [performance] section
+    n_cpu : integer
+        number of organize workers, overrides [performance] section
+    jobs_str : string
+        per-product and per-stage task limits, e.g. 'snodas=4,snodas:org=2',
+        added to [performance] 'jobs'
+    backend_str : string
+        per-product organize backend, e.g. 'srpt=thread', added to
+        [performance] 'backends'
+    queue_flag : boolean
+        True : publish (product, date) items to the work queue instead of
+        processing them
+    worker_flag : boolean
+        True : process items from the work queue until it is finished
+    plan_flag : boolean
+        True : report files to download with byte, disk, and time estimates
+        without downloading or processing anything
+    latest_flag : boolean
+        True : process the newest date posted for each product, start and
+        end dates are not needed
 
     Returns
     -------
@@ -97,6 +150,17 @@ def main(config_path, start_date, end_date, time_int, prod_str):
     -e, --end : end date in %Y%m%d format
     -t, --time : time interval
     -p, --prod : product list
+    -f, --force : reprocess completed tasks
+    -b, --backfill : run date range in water year or month chunks
+    -d, --daemon : poll sources and process new data until interrupted
+    --n-io : number of download threads
+    --n-cpu : number of organize workers
+    --jobs : per-product and per-stage task limits
+    --backends : per-product organize backend, thread or process
+    --queue : publish tasks to the shared work queue
+    --worker : process tasks from the shared work queue
+    --plan : dry run, report files to download and estimates
+    --latest : process the newest available date of each product
 
     """
 
@@ -104,6 +168,52 @@ def main(config_path, start_date, end_date, time_int, prod_str):
     cfg = config_params()
     cfg.read_config(config_path)
     cfg.proc_config()
+
+    # command line performance settings override the config file
+    if n_io is not None:
+        cfg.n_io = n_io
+    if n_cpu is not None:
+        cfg.n_cpu = n_cpu
+    if jobs_str is not None:
+        cfg.prod_jobs.update(parse_jobs(jobs_str))
+    if backend_str is not None:
+        cfg.prod_backends.update(parse_backends(backend_str))
+
+    # worker processing items published to the shared work queue
+    if worker_flag:
+        ledger = run_ledger(cfg.ledger_path)
+        run_worker(cfg, work_queue(cfg.queue_path), ledger, time_int or 'D')
+        ledger.close()
+        return
+
+    # resident service polling sources for new data, start_date sets the
+    # number of days checked for missing data, e.g. -3
+    if daemon_flag:
+        if start_date and (len(start_date) == 8 or not start_date.lstrip('-').isdigit()):
+            logger.error("main: daemon mode takes a number of days as start date (e.g. -3), not '{}'".format(start_date))
+            return
+        lookback = abs(int(start_date)) if start_date else 3
+        ledger = run_ledger(cfg.ledger_path)
+        run_daemon(cfg, prod_str.split(','), ledger, lookback)
+        ledger.close()
+        return
+
+    # newest date posted for each product, for near-real-time runs
+    if latest_flag:
+        prod_list = prod_str.split(',')
+        ledger = run_ledger(cfg.ledger_path)
+        graph = {}
+        for prod, date_dn in latest_dates(cfg, prod_list).items():
+            graph.update(build_task_graph(cfg, [date_dn], [prod], time_int or 'D'))
+        if not force_flag:
+            graph = prune_task_graph(graph, ledger)
+        run_task_graph(graph, n_io=cfg.n_io, n_cpu=cfg.n_cpu, max_prefetch=cfg.max_prefetch,
+                       dir_work=cfg.dir_work, min_free_gb=cfg.min_free_gb, ledger=ledger,
+                       jobs=cfg.prod_jobs, backends=cfg.prod_backends,
+                       timeouts=cfg.stage_timeouts, attempts=cfg.task_attempts, backoff_s=cfg.retry_backoff_s)
+        ledger.close()
+        return
+
     # develop date list
     if len(start_date) == 8:
         start_date = dt.datetime.strptime(start_date, '%Y%m%d')
@@ -122,117 +232,40 @@ def main(config_path, start_date, end_date, time_int, prod_str):
     # create list of products
     prod_list = prod_str.split(',')
 
-    # download data
-
-    # snodas
-    
-     # snodas function
-    def snodas_func(date_dn,cfg=cfg,logger=logger):
-        error_flag = False
-        print(f"trying {date_dn}")
-        try:
-            download_snodas(cfg, date_dn)
-        except:
-            logger.info("download_ndfd: error downloading ndfd {} for '{}'".format(parameter))
-            error_flag = True
-            print("fail!")
-        if error_flag is False:
-            try:
-                org_snodas(cfg, date_dn)
-            except:
-                logger.info("org_snodas: error processing snodas for '{}'".format(date_dn))
-
-    if 'snodas' in prod_list:
-        Parallel(n_jobs=6)(delayed(snodas_func)(d) for d in date_list)
-
-    # srpt
-    if 'srpt' in prod_list:
-        for date_dn in date_list:
-            error_flag = False
-            try:
-                download_srpt(cfg, date_dn)
-            except:
-                logger.info("download_srpt: error downloading srpt for '{}'".format(date_dn))
-                error_flag = True
-            if error_flag is False:
-                try:
-                    org_srpt(cfg, date_dn)
-                except:
-                    logger.info("org_srpt: error processing srpt for '{}'".format(date_dn))
-    # modscag
-    if 'modscag' in prod_list:
-        for date_dn in date_list:
-            error_flag = False
-            try:
-                download_modscag(cfg, date_dn)
-            except:
-                logger.info("download_modscag: error downloading modscag for '{}'".format(date_dn))
-                error_flag = True
-            if error_flag is False:
-                try:
-                    org_modscag(cfg, date_dn)
-                except:
-                    logger.info("org_modscag: error processing modscag for '{}'".format(date_dn))
+    # publish to the shared work queue for 'shread.py --worker' processes
+    if queue_flag:
+        queue = work_queue(cfg.queue_path)
+        n_new = queue.publish(queue_items(cfg, date_list, prod_list), force_flag)
+        logger.info("main: published {} items to {}, queue {}".format(n_new, cfg.queue_path, queue.counts()))
+        return
 
-    # moddrfs
-    if 'moddrfs' in prod_list:
-        for date_dn in date_list:
-            error_flag = False
-            try:
-                download_moddrfs(cfg, date_dn)
-            except:
-                logger.info("download_moddrfs: error downloading moddrfs for '{}'".format(date_dn))
-                error_flag = True
-            if error_flag is False:
-                try:
-                    org_moddrfs(cfg, date_dn)
-                except:
-                    logger.info("org_moddrfs: error processing moddrfs for '{}'".format(date_dn))
+    ledger = run_ledger(cfg.ledger_path)
 
-    # modis
-    if 'modis' in prod_list:
-        for date_dn in date_list:
-            error_flag = False
-            try:
-                download_modis(cfg, date_dn)
-            except:
-                logger.info("download_modis: error downloading modis for '{}'".format(date_dn))
-                error_flag = True
-            # if error_flag is False:
-            #     try:
-            #         org_modis(cfg, date_dn)
-            #     except:
-            #         logger.info("org_modis: error processing modis for '{}'".format(date_dn))
-    # swann
-    if 'swann' in prod_list:
-        try:
-            batch_swann(cfg, date_list, time_int)
-        except:
-            logger.info("batch_swann: error downloading swann")
+    # dry run
+    if plan_flag:
+        plan_run(cfg, date_list, prod_list, time_int, ledger, force_flag)
+        ledger.close()
+        return
 
-    # ndfd
-    
-    # ndfd function
-    def ndfd_func(parameter,flen=3,crs_out=cfg.proj,cfg=cfg,overwrite_flag=False,logger=logger):
+    # long date ranges are run as a sequence of checkpointed chunks
+    if chunk_str is not None:
+        run_backfill(cfg, date_list, prod_list, time_int, chunk_str, ledger, force_flag)
+        ledger.close()
+        return
 
-        print(f"trying {parameter}")
-        try:
-            # forecast length hard-coded to 3 for now # TJC changed from 7 to 3.
-            download_ndfd(parameter,flen,crs_out,cfg,overwrite_flag=False)
-        except:
-            logger.info("download_ndfd: error downloading ndfd {} for '{}'".format(parameter))
-            error_flag = True
-            print("fail!")
+    # build task graph of (product, date, stage) tasks and run it, allowing
+    # tasks from different products to overlap
+    graph = build_task_graph(cfg, date_list, prod_list, time_int)
 
-    
-    if 'ndfd' in prod_list:
-        import_flag = True
-        error_flag = False
-        if import_flag:
-            Parallel(n_jobs=6)(delayed(ndfd_func)(p) for p in cfg.ndfd_parameters)
-            import_flag = False
-        else:
-            print("Importing ndfd only once...skipping")
+    # skip tasks completed by previous runs, and dates known to be missing
+    if not force_flag:
+        graph = prune_task_graph(graph, ledger)
+    graph = prune_unavailable(cfg, graph)
+    run_task_graph(graph, n_io=cfg.n_io, n_cpu=cfg.n_cpu, max_prefetch=cfg.max_prefetch,
+                   dir_work=cfg.dir_work, min_free_gb=cfg.min_free_gb, ledger=ledger,
+                   jobs=cfg.prod_jobs, backends=cfg.prod_backends,
+                   timeouts=cfg.stage_timeouts, attempts=cfg.task_attempts, backoff_s=cfg.retry_backoff_s)
+    ledger.close()
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -249,6 +282,41 @@ def parse_args():
         '-t', '--time', metavar='time_interval', help='time interval')
     parser.add_argument(
         '-p', '--prod', metavar='product_list', help='product list')
+    parser.add_argument(
+        '-f', '--force', action='store_true',
+        help='reprocess tasks completed by previous runs')
+    parser.add_argument(
+        '-b', '--backfill', metavar='chunk', choices=['wy', 'month'],
+        help='run date range in water year (wy) or month chunks')
+    parser.add_argument(
+        '-d', '--daemon', action='store_true',
+        help='poll sources and process new data until interrupted, '
+             'start date sets days checked (e.g. -3)')
+    parser.add_argument(
+        '--n-io', type=int, metavar='threads',
+        help='number of download threads, default from cpu count')
+    parser.add_argument(
+        '--n-cpu', type=int, metavar='workers',
+        help='number of organize workers, default from cpu count and memory')
+    parser.add_argument(
+        '--jobs', metavar='job_list',
+        help='per-product and per-stage task limits, e.g. snodas=4,snodas:org=2')
+    parser.add_argument(
+        '--backends', metavar='backend_list',
+        help='per-product organize backend, e.g. srpt=thread,snodas=process')
+    parser.add_argument(
+        '--queue', action='store_true',
+        help='publish tasks to the shared work queue instead of running them')
+    parser.add_argument(
+        '--worker', action='store_true',
+        help='process tasks from the shared work queue until it is finished')
+    parser.add_argument(
+        '--plan', action='store_true',
+        help='report files to download with byte, disk, and time estimates, '
+             'without downloading anything')
+    parser.add_argument(
+        '--latest', action='store_true',
+        help='process the newest date posted for each product')
     args = parser.parse_args()
     return args
 
@@ -318,6 +386,8 @@ class config_params:
         jpl_sec = "jpl"
         noaa_sec = "noaa"
         swann_sec = "swann"
+        basins_sec = "basins"
+        performance_sec = "performance"
         # ADD SECTIONS AS NEW SNOW PRODUCTS ARE ADDED
 
         cfg_secs = config.sections()
@@ -388,8 +458,10 @@ class config_params:
                 error_flag = True
 
             #- arch_flag
+            # read as a boolean, the string was compared to True before so
+            # tars were never archived, configs with 'T' now archive
             try:
-                self.arch_flag = config.get(wd_sec, "arch_flag")
+                self.arch_flag = config.get(wd_sec, "arch_flag") in ['T', 'True', 'true', '1']
                 logger.info("read config: reading 'arch_flag' {}".format(self.arch_flag))
             except:
                 logger.error("read_config: '{}' missing from [{}] section".format("arch_flag", wd_sec))
@@ -460,6 +532,32 @@ class config_params:
                 logger.error("read_config: '{}' missing from [{}] section".format("output_format", wd_sec))
                 error_flag = True
 
+            #- ledger_path - optional
+            try:
+                self.ledger_path = config.get(wd_sec, "ledger_path")
+                logger.info("read config: reading 'ledger_path' {}".format(self.ledger_path))
+            except:
+                self.ledger_path = getattr(self, 'dir_work', '') + 'shread_ledger.sqlite'
+                logger.info("read config: 'ledger_path' not set, using {}".format(self.ledger_path))
+
+            #- queue_path - optional, must be on a filesystem shared by all
+            #  worker hosts
+            try:
+                self.queue_path = config.get(wd_sec, "queue_path")
+                logger.info("read config: reading 'queue_path' {}".format(self.queue_path))
+            except:
+                self.queue_path = getattr(self, 'dir_work', '') + 'shread_queue.sqlite'
+                logger.info("read config: 'queue_path' not set, using {}".format(self.queue_path))
+
+            #- cache_path - optional, index of downloaded files, see
+            #  'download_cache'
+            try:
+                self.cache_path = config.get(wd_sec, "cache_path")
+                logger.info("read config: reading 'cache_path' {}".format(self.cache_path))
+            except:
+                self.cache_path = getattr(self, 'dir_work', '') + 'shread_cache.sqlite'
+                logger.info("read config: 'cache_path' not set, using {}".format(self.cache_path))
+
         # earthdata section
         logger.info("[earthdata]")
         if error_earthdata_sec_flag == False:
@@ -522,6 +620,29 @@ class config_params:
                 logger.error("read_config: '{}' missing from [{}] section".format("null_value_snodas", snodas_sec))
                 error_flag = True
 
+            #- vars_snodas, optional
+            try:
+                vars_snodas = snodas_vars_default
+                if config.has_option(snodas_sec, "vars_snodas"):
+                    vars_snodas = config.get(snodas_sec, "vars_snodas")
+                    logger.info("read config: reading 'vars_snodas' {}".format(vars_snodas))
+                self.snodas_vars = parse_snodas_vars(vars_snodas)
+            except Exception as e:
+                logger.error("read_config: '{}' in [{}] section {}".format("vars_snodas", snodas_sec, e))
+                error_flag = True
+
+            #- dir_dat_snodas, optional
+            self.dir_dat_snodas = None
+            if config.has_option(snodas_sec, "dir_dat_snodas"):
+                self.dir_dat_snodas = config.get(snodas_sec, "dir_dat_snodas") or None
+                logger.info("read config: reading 'dir_dat_snodas' {}".format(self.dir_dat_snodas))
+
+            #- stream_flag, optional
+            self.snodas_stream = False
+            if config.has_option(snodas_sec, "stream_flag"):
+                self.snodas_stream = config.get(snodas_sec, "stream_flag") in ['T', 'True', 'true', '1']
+                logger.info("read config: reading 'stream_flag' {}".format(self.snodas_stream))
+
         # modis section
         # logger.info("[modis]")
         # if error_modis_sec_flag == False:
@@ -656,6 +777,171 @@ class config_params:
                 logger.error("read_config: '{}' missing from [{}] section".format("ndfd_parameters", noaa_sec))
                 error_flag = True
 
+        # basins section - optional
+        # name = basin_poly_path,basin_points_path
+        self.basin_sets = []
+        if basins_sec in cfg_secs:
+            logger.info("[basins]")
+            for basin_name, basin_paths in config.items(basins_sec):
+                try:
+                    basin_poly_path, basin_points_path = [p.strip() for p in basin_paths.split(',')]
+                    self.basin_sets.append([basin_poly_path, basin_points_path])
+                    logger.info("read config: reading basin '{}' {}".format(basin_name, basin_paths))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be 'basin_poly_path,basin_points_path'".format(basin_name, basins_sec))
+                    error_flag = True
+
+        # performance section - optional
+        # worker counts not set are derived from cpu count and memory
+        mem_per_worker_gb = 2.0
+        self.n_io = None
+        self.n_cpu = None
+        self.max_prefetch = 4
+        self.min_free_gb = 1.0
+        self.prod_jobs = {}
+        self.prod_backends = {}
+        self.stage_timeouts = dict(stage_timeouts)
+        self.task_attempts = 2
+        self.retry_backoff_s = 60.0
+        self.host_limit = 8
+        self.download_timeout = 600
+        self.download_segments = 1
+        self.segment_min_mb = 64.0
+        if performance_sec in cfg_secs:
+            logger.info("[performance]")
+            #- mem_per_worker_gb
+            if config.has_option(performance_sec, "mem_per_worker_gb"):
+                try:
+                    mem_per_worker_gb = float(config.get(performance_sec, "mem_per_worker_gb"))
+                    logger.info("read config: reading 'mem_per_worker_gb' {}".format(mem_per_worker_gb))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be a number".format("mem_per_worker_gb", performance_sec))
+                    error_flag = True
+
+            #- n_io
+            if config.has_option(performance_sec, "n_io"):
+                try:
+                    self.n_io = int(config.get(performance_sec, "n_io"))
+                    logger.info("read config: reading 'n_io' {}".format(self.n_io))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be an integer".format("n_io", performance_sec))
+                    error_flag = True
+
+            #- n_cpu
+            if config.has_option(performance_sec, "n_cpu"):
+                try:
+                    self.n_cpu = int(config.get(performance_sec, "n_cpu"))
+                    logger.info("read config: reading 'n_cpu' {}".format(self.n_cpu))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be an integer".format("n_cpu", performance_sec))
+                    error_flag = True
+
+            #- max_prefetch
+            if config.has_option(performance_sec, "max_prefetch"):
+                try:
+                    self.max_prefetch = int(config.get(performance_sec, "max_prefetch"))
+                    logger.info("read config: reading 'max_prefetch' {}".format(self.max_prefetch))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be an integer".format("max_prefetch", performance_sec))
+                    error_flag = True
+
+            #- min_free_gb
+            if config.has_option(performance_sec, "min_free_gb"):
+                try:
+                    self.min_free_gb = float(config.get(performance_sec, "min_free_gb"))
+                    logger.info("read config: reading 'min_free_gb' {}".format(self.min_free_gb))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be a number".format("min_free_gb", performance_sec))
+                    error_flag = True
+
+            #- host_limit
+            if config.has_option(performance_sec, "host_limit"):
+                try:
+                    self.host_limit = int(config.get(performance_sec, "host_limit"))
+                    logger.info("read config: reading 'host_limit' {}".format(self.host_limit))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be an integer".format("host_limit", performance_sec))
+                    error_flag = True
+
+            #- download_timeout
+            if config.has_option(performance_sec, "download_timeout"):
+                try:
+                    self.download_timeout = float(config.get(performance_sec, "download_timeout"))
+                    logger.info("read config: reading 'download_timeout' {}".format(self.download_timeout))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be a number".format("download_timeout", performance_sec))
+                    error_flag = True
+
+            #- download_segments
+            if config.has_option(performance_sec, "download_segments"):
+                try:
+                    self.download_segments = int(config.get(performance_sec, "download_segments"))
+                    logger.info("read config: reading 'download_segments' {}".format(self.download_segments))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be an integer".format("download_segments", performance_sec))
+                    error_flag = True
+
+            #- segment_min_mb
+            if config.has_option(performance_sec, "segment_min_mb"):
+                try:
+                    self.segment_min_mb = float(config.get(performance_sec, "segment_min_mb"))
+                    logger.info("read config: reading 'segment_min_mb' {}".format(self.segment_min_mb))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be a number".format("segment_min_mb", performance_sec))
+                    error_flag = True
+
+            #- jobs
+            if config.has_option(performance_sec, "jobs"):
+                try:
+                    self.prod_jobs = parse_jobs(config.get(performance_sec, "jobs"))
+                    logger.info("read config: reading 'jobs' {}".format(config.get(performance_sec, "jobs")))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be 'product=n' or 'product:stage=n' list".format("jobs", performance_sec))
+                    error_flag = True
+
+            #- backends
+            if config.has_option(performance_sec, "backends"):
+                try:
+                    self.prod_backends = parse_backends(config.get(performance_sec, "backends"))
+                    logger.info("read config: reading 'backends' {}".format(config.get(performance_sec, "backends")))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be 'product=thread' or 'product=process' list".format("backends", performance_sec))
+                    error_flag = True
+
+            #- timeouts
+            if config.has_option(performance_sec, "timeouts"):
+                try:
+                    self.stage_timeouts.update(parse_timeouts(config.get(performance_sec, "timeouts")))
+                    logger.info("read config: reading 'timeouts' {}".format(config.get(performance_sec, "timeouts")))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be 'stage=s' or 'product:stage=s' list".format("timeouts", performance_sec))
+                    error_flag = True
+
+            #- task_attempts
+            if config.has_option(performance_sec, "task_attempts"):
+                try:
+                    self.task_attempts = int(config.get(performance_sec, "task_attempts"))
+                    logger.info("read config: reading 'task_attempts' {}".format(self.task_attempts))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be an integer".format("task_attempts", performance_sec))
+                    error_flag = True
+
+            #- retry_backoff_s
+            if config.has_option(performance_sec, "retry_backoff_s"):
+                try:
+                    self.retry_backoff_s = float(config.get(performance_sec, "retry_backoff_s"))
+                    logger.info("read config: reading 'retry_backoff_s' {}".format(self.retry_backoff_s))
+                except:
+                    logger.error("read_config: '{}' in [{}] section must be a number".format("retry_backoff_s", performance_sec))
+                    error_flag = True
+
+        n_io_default, n_cpu_default = default_workers(mem_per_worker_gb)
+        if self.n_io is None:
+            self.n_io = n_io_default
+        if self.n_cpu is None:
+            self.n_cpu = n_cpu_default
+        logger.info("read config: using {} download threads and {} organize workers".format(self.n_io, self.n_cpu))
+
         # swann section
         logger.info("[swann]")
         if error_swann_sec_flag == False:
@@ -686,12 +972,11 @@ class config_params:
                 sys.exit()
 
     def proc_config(self):
-        """Read and parse config file
+        """Process config file, opening basin files and finding modis tiles
 
         Parameters
         ---------
-        config_path : string
-            relative file path to config file
+        None
 
         Returns
         -------
@@ -699,6 +984,9 @@ class config_params:
 
         Notes
         -----
+        Sets 'basin_cfgs', a list of config_params copies, one for each basin
+        in [wd] and [basins]. Bounding box and modis tiles of this object
+        cover all basins so products are downloaded once for all basins.
 
         """
 
@@ -706,6 +994,49 @@ class config_params:
         sys.path.append(self.gdal_path)
         # add error checking
 
+        # basin from wd section
+        self.set_basin(self.basin_poly_path, self.basin_points_path)
+        self.basin_cfgs = [copy.copy(self)]
+
+        # basins from basins section
+        basin_poly_paths = [self.basin_poly_path]
+        for basin_poly_path, basin_points_path in getattr(self, 'basin_sets', []):
+            if basin_poly_path in basin_poly_paths:
+                continue
+            basin_poly_paths.append(basin_poly_path)
+            basin_cfg = copy.copy(self)
+            basin_cfg.set_basin(basin_poly_path, basin_points_path)
+            self.basin_cfgs.append(basin_cfg)
+
+        # bounding box and modis tiles covering all basins
+        bbox_list = [basin_cfg.basin_poly_bbox for basin_cfg in self.basin_cfgs]
+        self.basin_poly_bbox = [min(b[0] for b in bbox_list), min(b[1] for b in bbox_list),
+                                max(b[2] for b in bbox_list), max(b[3] for b in bbox_list)]
+        tile_list = []
+        for basin_cfg in self.basin_cfgs:
+            tile_list = tile_list + [t for t in basin_cfg.singrd_tile_list if t not in tile_list]
+        self.singrd_tile_list = tile_list
+        for basin_cfg in self.basin_cfgs:
+            basin_cfg.basin_cfgs = [basin_cfg]
+
+    def set_basin(self, basin_poly_path, basin_points_path):
+        """Open basin files and find bounding box and modis tiles
+
+        Parameters
+        ---------
+        basin_poly_path : string
+            file path of basin polygons
+        basin_points_path : string
+            file path of basin points
+
+        Returns
+        -------
+        None
+
+        """
+        self.basin_poly_path = basin_poly_path
+        self.basin_points_path = basin_points_path
+
         # open basin_poly
         self.basin_poly = gpd.read_file(self.basin_poly_path)
 
@@ -744,12 +1075,18 @@ def download_snodas(cfg, date_dn, overwrite_flag = False):
     -------
         None
 
+    Notes
+    -----
+    Uses the pooled ftp connections from 'get_snodas_pool', the month
+    directory is listed once and dates not in the listing are skipped
+    without a transfer. Tars in the download cache or 'dir_arch' are used
+    without a transfer, see 'download_cache'.
+
     """
-    site_url = cfg.host_snodas + cfg.dir_ftp_snodas
+    dir_ftp = urlparse(cfg.host_snodas).path.rstrip('/') + cfg.dir_ftp_snodas + date_dn.strftime('%Y') + "/" \
+    + date_dn.strftime('%m') + "_" + date_dn.strftime('%b') + '/'
     dir_work_snodas = cfg.dir_work + 'snodas/'
     zip_name = "SNODAS_" + ("{}.tar".format(date_dn.strftime('%Y%m%d')))
-    zip_url = site_url + date_dn.strftime('%Y') + "/" + date_dn.strftime('%m') + "_" \
-    + date_dn.strftime('%b') + '/' + zip_name
     zip_path = dir_work_snodas + zip_name
 
     if not os.path.isdir(cfg.dir_work):
@@ -760,218 +1097,752 @@ def download_snodas(cfg, date_dn, overwrite_flag = False):
 
     if os.path.isfile(zip_path) and overwrite_flag:
         os.remove(zip_path)
-    if not os.path.isfile(zip_path):
+    # grids kept decompressed by 'org_snodas' do not need the tar
+    if not overwrite_flag and getattr(cfg, 'dir_dat_snodas', None) and \
+            len(snodas_dat_paths(cfg.dir_dat_snodas, date_dn.strftime('%Y%m%d'), snodas_codes(cfg))) == len(cfg.snodas_vars):
+        logger.info("download_snodas: grids for {} kept in {}".format(date_dn.strftime('%Y-%m-%d'), cfg.dir_dat_snodas))
+    elif not os.path.isfile(zip_path):
         logger.info("download_snodas: downloading {}".format(date_dn.strftime('%Y-%m-%d')))
-        logger.info("download_snodas: downloading from {}".format(zip_url))
+        logger.info("download_snodas: downloading from {}".format(dir_ftp + zip_name))
         logger.info("download_snodas: downloading to {}".format(zip_path))
+        pool = get_snodas_pool(cfg)
+
+        def download_tar(url, path):
+            if zip_name not in pool.listing(dir_ftp):
+                raise IOError("{} not posted in {}".format(zip_name, dir_ftp))
+            pool.download(dir_ftp + zip_name, path, timeout=cfg.download_timeout)
+
         try:
-            urllib.request.urlretrieve(zip_url, zip_path)
-        except IOError as e:
+            # tars already archived by 'org_snodas' are copied back, not downloaded
+            hit = get_download_cache(cfg).fetch(cfg.host_snodas.rstrip('/') + dir_ftp + zip_name, zip_path,
+                                                download_tar, tiers=[cfg.dir_arch + 'snodas/' + zip_name],
+                                                refresh=overwrite_flag)
+            if not hit:
+                add_download_bytes('snodas', zip_path)
+        except ftplib.all_errors as e:
             logger.error("download_snodas: error downloading {}".format(date_dn.strftime('%Y-%m-%d')))
             logging.error(e)
+            raise
+        finally:
+            logger.debug("download_snodas: {} {}".format(pool, pool.stats))
+
+# snodas grid, values from the header of the NSIDC user guide, ulxmap and
+# ulymap are the centers of the upper left cell
+snodas_nrows = 3351
+snodas_ncols = 6935
+snodas_cell = 0.00833333333333333
+snodas_transform = from_origin(-124.729583333333 - snodas_cell / 2, 52.8704166666666 + snodas_cell / 2,
+                               snodas_cell, snodas_cell)
+snodas_crs = 'EPSG:4326'
+snodas_nodata = -9999
+
+# snodas variables, output names can not contain '_'
+# name : [member code, scale to mm or K, quantity]
+# swe : 1034 [m *1000]
+# snow depth : 1036 [m *1000]
+# snow melt runoff at base of snowpack : 1044 [m *100,000]
+# sublimation from snowpack : 1050 [m *100,000]
+# sublimation of blowing snow: 1039 [m *100,000]
+# solid precipitation: 1025(v code = IL01) [kg m-2 *10]
+# liquid precipitation: 1025(v code = IL00) [kg m-2 *10]
+# snowpack average temperature: 1038 [K *1]
+snodas_vars = {
+    'swe': ['1034', 1., 'depth'],
+    'snowdepth': ['1036', 1., 'depth'],
+    'melt': ['1044', .01, 'depth'],
+    'sublimation': ['1050', .01, 'depth'],
+    'blowsublimation': ['1039', .01, 'depth'],
+    'solidprecip': ['1025L01', .1, 'depth'],
+    'liquidprecip': ['1025L00', .1, 'depth'],
+    'packtemp': ['1038', 1., 'temperature'],
+}
+
+# variables kept by 'org_snodas', overridden by 'vars_snodas' in the
+# [snodas] section
+snodas_vars_default = 'swe,snowdepth'
+
+def parse_snodas_vars(vars_str):
+    """Parse the snodas variables to keep
 
-def org_snodas(cfg, date_dn):
+    Parameters
+    ---------
+        vars_str: string
+            comma separated list of 'name' or 'name=scale', names from
+                'snodas_vars', e.g. 'swe,snowdepth,melt=0.01'
 
-    dir_work_snodas = cfg.dir_work + 'snodas/'
-    dir_arch_snodas = cfg.dir_arch + 'snodas/'
-    date_str = str(date_dn.strftime('%Y%m%d'))
-    chr_rm = [":"]
-    proj_str = ''.join(i for i in cfg.proj if not i in chr_rm)
-    crs_raw = 'EPSG:4326'
-    dtype_out = 'float64' # convert snodas raster from int16 to float64 to perform
-        # unit conversion.
-    basin_str = os.path.splitext(os.path.basename(cfg.basin_poly_path))[0]
+    Returns
+    -------
+        vars_dict: dict
+            name mapped to scale factor to mm, or K for temperature
 
-    # clean up working directory
-    for file in glob.glob("{0}/*.tif".format(dir_work_snodas)):
-        file_path = dir_work_snodas + file
-        try:
-            os.remove(file_path)
-            logger.info("org_snodas: removing {}".format(file_path))
-        except:
-            logger.error("org_snodas: error removing {}".format(file_path))
+    """
+    vars_dict = {}
+    for item in [i.strip() for i in vars_str.split(',') if i.strip()]:
+        name, sep, scale = item.partition('=')
+        name = name.strip()
+        if name not in snodas_vars:
+            raise ValueError("snodas variable '{}' not supported".format(name))
+        vars_dict[name] = float(scale) if sep else snodas_vars[name][1]
+    return vars_dict
+
+def snodas_codes(cfg):
+    """Return the member codes of the snodas variables kept, see 'parse_snodas_vars'"""
+    return [snodas_vars[name][0] for name in cfg.snodas_vars]
+
+def snodas_member_code(name, date_str):
+    """Return the variable code of a snodas tar member, None if it is not a daily grid for date_str
+
+    precipitation codes include the v code, '1025L01' solid and '1025L00'
+    liquid
+    """
+    match = re.match(r'us_ssmv\d(\d{4})(?:\w\w(L0\d))?\w*TTNATS' + date_str + r'05\w*\.dat\.gz$', os.path.basename(name))
+    if match is None:
+        return None
+    if match.group(1) == '1025':
+        return match.group(1) + (match.group(2) or '')
+    return match.group(1)
 
-    # untar files
-    zip_name = "SNODAS_" + ("{}.tar".format(date_dn.strftime('%Y%m%d')))
-    zip_path = dir_work_snodas + zip_name
-    zip_arch = dir_arch_snodas + zip_name
+def snodas_window(basin_cfgs, margin = 2):
+    """Return the snodas (row_start, row_end, col_start, col_end) window covering basins
 
-    try:
-        tar_con = tarfile.open(zip_path)
-        tar_con.extractall(path=dir_work_snodas)
-        tar_con.close()
-        logger.info("org_snodas: untaring {0}".format(zip_path))
-    except:
-        logger.error("download_snodas: error untaring {0}".format(zip_path))
-    if cfg.arch_flag == True:
-        os.rename(zip_path, zip_arch)
-        logger.info("org_snodas: archiving {0} to {1}".format(zip_path, zip_arch))
-    else:
-        os.remove(zip_path)
-        logger.info("org_snodas: removing {0}".format(zip_path))
+    Parameters
+    ---------
+        basin_cfgs: list
+            config_params Class objects of the basins
+        margin: integer
+            cells added on each side for reprojection
 
-    # ungz files
-    for file_gz in os.listdir(dir_work_snodas):
-        if file_gz.endswith('.gz'):
-            file_path = dir_work_snodas + file_gz
-            file_out = os.path.splitext(file_path)[0]
+    Returns
+    -------
+        window: tuple of integers
+            end rows and columns are exclusive, the whole grid if there are
+            no basins
 
-            # currently only keeping swe (1034) and snow depth (1036)
-            if '1034' in str(file_gz) or '1036' in str(file_gz):
-                try:
-                    gz_con = gzip.GzipFile(file_path, 'rb')
-                    gz_in = gz_con.read()
-                    gz_con.close()
+    """
+    if not basin_cfgs:
+        return 0, snodas_nrows, 0, snodas_ncols
+    row_start, row_end, col_start, col_end = snodas_nrows, 0, snodas_ncols, 0
+    for basin_cfg in basin_cfgs:
+        xmin, ymin, xmax, ymax = transform_bounds(basin_cfg.proj, snodas_crs, *basin_cfg.basin_poly.total_bounds,
+                                                  densify_pts=21)
+        col_min, row_min = ~snodas_transform * (xmin, ymax)
+        col_max, row_max = ~snodas_transform * (xmax, ymin)
+        row_start = min(row_start, int(math.floor(row_min)) - margin)
+        row_end = max(row_end, int(math.ceil(row_max)) + margin)
+        col_start = min(col_start, int(math.floor(col_min)) - margin)
+        col_end = max(col_end, int(math.ceil(col_max)) + margin)
+    row_start, row_end = max(row_start, 0), min(row_end, snodas_nrows)
+    col_start, col_end = max(col_start, 0), min(col_end, snodas_ncols)
+    if row_start >= row_end or col_start >= col_end:
+        raise ValueError("snodas_window: basins do not overlap the snodas grid")
+    return row_start, row_end, col_start, col_end
+
+def decode_snodas(gz_con, window = None):
+    """Decompress the rows of a gzipped snodas .dat needed for a window
 
-                    gz_out = open(file_out, 'wb')
-                    gz_out.write(gz_in)
-                    gz_out.close()
+    Parameters
+    ---------
+        gz_con: file object
+            gzipped .dat member, e.g. from 'tarfile.extractfile'
+        window: tuple of integers
+            (row_start, row_end, col_start, col_end), see 'snodas_window',
+            Default - None, the whole grid
 
-                    logger.info("org_snodas: unzipping {}".format(file_path))
-                    os.remove(file_path)
-                    logger.info("org_snodas: removing {}".format(file_path))
-                except:
-                    logger.error("org_snodas: error unzipping {}".format(file_path))
-            else:
-                os.remove(file_path)
-                logger.info("org_snodas: removing {}".format(file_path))
+    Returns
+    -------
+        grid: list
+            [big-endian int16 array of the window, affine transform of the
+            window]
 
-    # convert dat to bil
-    for file_dat in os.listdir(dir_work_snodas):
-        if file_dat.endswith('.dat'):
-            try:
-                file_path = dir_work_snodas + file_dat
-                file_out = file_path.replace('.dat', '.bil')
-                os.rename(file_path, file_out)
-                logger.info("org_snodas: converting {} to {}".format(file_path, file_out))
-            except:
-                logger.error("org_snodas: error converting {} to {}".format(file_path, file_out))
-
-    # create header file - ADD NSIDC LINK
-    for file_bil in os.listdir(dir_work_snodas):
-        if file_bil.endswith('.bil'):
-            try:
-                file_path = dir_work_snodas + file_bil
-                file_out = file_path.replace('.bil', '.hdr')
-                file_con = open(file_out, 'w')
-
-                file_con.write('units dd\n')
-                file_con.write('nbands 1\n')
-                file_con.write('nrows 3351\n')
-                file_con.write('ncols 6935\n')
-                file_con.write('nbits 16\n')
-                file_con.write('pixeltype signedint')
-                file_con.write('byteorder M\n')
-                file_con.write('layout bil\n')
-                file_con.write('ulxmap -124.729583333333\n')
-                file_con.write('ulymap 52.8704166666666\n')
-                file_con.write('xdim 0.00833333333333333\n')
-                file_con.write('ydim 0.00833333333333333\n')
-                file_con.close()
-
-                logger.info("org_snodas: creating header file {}".format(file_out))
-            except:
-                logger.error("org_snodas: error creating header file {}".format(file_out))
+    Notes
+    -----
+    The .dat is a row-major grid of big-endian int16, so rows before the
+    window are inflated and dropped without being kept, and inflating stops
+    after the last row of the window without reading the rest of the
+    member.
 
-    # convert bil to geotif
-    for file_bil in os.listdir(dir_work_snodas):
-        if file_bil.endswith('.bil'):
-            try:
-                file_path = dir_work_snodas + file_bil
-                file_out = file_path.replace('.bil', '.tif')
-                gdal.Translate(file_out, file_path, format = 'GTiff')
-                logger.info("org_snodas: converting {} to {}".format(file_path, file_out))
-            except:
-                logger.error("org_snodas: error converting {} to {}".format(file_path, file_out))
+    """
+    row_start, row_end, col_start, col_end = window or (0, snodas_nrows, 0, snodas_ncols)
+    row_bytes = snodas_ncols * 2
+    skip = row_start * row_bytes
+    need = (row_end - row_start) * row_bytes
+    inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    rows = bytearray()
+    pos = 0
+    data_in = b''
+    while len(rows) < need and not inflate.eof:
+        if not data_in:
+            data_in = gz_con.read(65536)
+            if not data_in:
+                break
+        data = inflate.decompress(data_in, download_chunk_bytes)
+        data_in = inflate.unconsumed_tail
+        if pos + len(data) > skip:
+            rows += data[max(skip - pos, 0):max(skip - pos, 0) + need - len(rows)]
+        pos += len(data)
+    if len(rows) < need:
+        raise ValueError("decode_snodas: grid ended after {} bytes".format(pos))
+    grid = np.frombuffer(bytes(rows), dtype='>i2').reshape(row_end - row_start, snodas_ncols)[:, col_start:col_end]
+    return [grid, snodas_transform * Affine.translation(col_start, row_start)]
+
+def store_snodas_dat(gz_con, path):
+    """Decompress a gzipped snodas .dat to a .bil with an ESRI header, written atomically in steps"""
+    dir_dat = os.path.dirname(path)
+    if not os.path.isdir(dir_dat):
+        os.makedirs(dir_dat)
+    fd, part_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.part', dir=dir_dat)
+    try:
+        with os.fdopen(fd, 'wb') as part_con:
+            inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            for data_in in iter(functools.partial(gz_con.read, 65536), b''):
+                part_con.write(inflate.decompress(data_in))
+            part_con.write(inflate.flush())
+        if os.path.getsize(part_path) != snodas_nrows * snodas_ncols * 2:
+            raise ValueError("store_snodas_dat: {} is not a snodas grid".format(path))
+        hdr_con = open(os.path.splitext(path)[0] + '.hdr', 'w')
+        hdr_con.write('byteorder M\n')
+        hdr_con.write('layout bil\n')
+        hdr_con.write('nbands 1\n')
+        hdr_con.write('nbits 16\n')
+        hdr_con.write('pixeltype signedint\n')
+        hdr_con.write('nrows {}\n'.format(snodas_nrows))
+        hdr_con.write('ncols {}\n'.format(snodas_ncols))
+        hdr_con.write('ulxmap -124.729583333333\n')
+        hdr_con.write('ulymap 52.8704166666666\n')
+        hdr_con.write('xdim {}\n'.format(snodas_cell))
+        hdr_con.write('ydim {}\n'.format(snodas_cell))
+        hdr_con.write('nodata {}\n'.format(snodas_nodata))
+        hdr_con.close()
+        os.replace(part_path, path)
+    except:
+        if os.path.isfile(part_path):
+            os.remove(part_path)
+        raise
 
-    # remove unneeded files
-    for file in os.listdir(dir_work_snodas):
-        if not file.endswith('.tif'):
-            file_path = dir_work_snodas + file
-            try:
-                os.remove(file_path)
-                logger.info("org_snodas: removing {}".format(file_path))
-            except:
-                logger.error("org_snodas: error removing {}".format(file_path))
+def open_snodas_dat(path, window = None):
+    """Return a decompressed snodas grid as a read only memory map
 
-    # reproject geotif
-    tif_list = glob.glob("{0}/*{1}{2}*.tif".format(dir_work_snodas, date_str, "05"))
-    for tif in tif_list:
-        tif_out = os.path.splitext(tif)[0] + "_" + proj_str + ".tif"
-        try:
-            gdal_raster_reproject(tif, tif_out, cfg.proj, crs_raw)
-            # rasterio_raster_reproject(tif, tif_out, cfg.proj)
-            logger.info("org_snodas: reprojecting {} to {}".format(tif, tif_out))
-        except:
-            logger.error("org_snodas: error reprojecting {} to {}".format(tif, tif_out))
-    if not tif_list:
-        logger.error("org_snodas: error finding tifs to reproject")
+    Parameters
+    ---------
+        path: string
+            file path of .bil written by 'store_snodas_dat'
+        window: tuple of integers
+            (row_start, row_end, col_start, col_end), see 'snodas_window',
+            Default - None, the whole grid
 
-    # clip to basin polygon
-    tif_list = glob.glob("{0}/*{1}{2}*{3}.tif".format(dir_work_snodas, date_str, "05", proj_str))
-    for tif in tif_list:
-        tif_out = os.path.splitext(tif)[0] + "_" + basin_str + ".tif"
-        try:
-            gdal_raster_clip(cfg.basin_poly_path, tif, tif_out, cfg.proj, cfg.proj, -9999)
-            logger.info("org_snodas: clipping {} to {}".format(tif, tif_out))
-        except:
-            logger.error("org_snodas: error clipping {} to {}".format(tif, tif_out))
-    if not tif_list:
-        logger.error("org_snodas: error finding tifs to clip")
+    Returns
+    -------
+        grid: list
+            [big-endian int16 np.memmap view of the window, affine transform
+            of the window], the same form as 'decode_snodas'
 
-    # convert units
-    if cfg.unit_sys == 'english':
-        calc_exp = '(* .0393701 (read 1))' # inches
-    if cfg.unit_sys == 'metric':
-        calc_exp = '(read 1)' # keep units in mm
-    # SWE
-    tif_list = glob.glob("{0}/*{1}*{2}{3}*{4}*{5}.tif".format(dir_work_snodas, '1034', date_str, "05", proj_str, basin_str))
+    Notes
+    -----
+    Only the pages of the window are read from disk when the view is used,
+    and processes mapping the same file share one copy in the page cache.
 
-    for tif in tif_list:
-        tif_int = os.path.splitext(tif)[0] + "_" + dtype_out + ".tif"
-        tif_out = cfg.dir_db + "snodas_swe_" + date_str + "_" + basin_str + "_" + cfg.unit_sys + ".tif"
-        try:
-            rio_dtype_conversion(tif, tif_int, dtype_out)
-            rio_calc(tif_int, tif_out, calc_exp)
-            logger.info("org_snodas: calc {} {} to {}".format(calc_exp, tif, tif_out))
-        except:
-            logger.error("org_snodas: error calc {} to {}".format(tif, tif_out))
-    if not tif_list:
-        logger.error("org_snodas: error finding tifs to calc")
+    """
+    row_start, row_end, col_start, col_end = window or (0, snodas_nrows, 0, snodas_ncols)
+    grid = np.memmap(path, dtype='>i2', mode='r', shape=(snodas_nrows, snodas_ncols))
+    return [grid[row_start:row_end, col_start:col_end], snodas_transform * Affine.translation(col_start, row_start)]
+
+def snodas_dat_paths(dir_dat, date_str, codes):
+    """Return code mapped to the path of each decompressed snodas grid in dir_dat for date_str"""
+    paths = {}
+    for path in glob.glob(os.path.join(dir_dat, '*' + date_str + '05*.bil')):
+        code = snodas_member_code(os.path.basename(path)[:-len('.bil')] + '.dat.gz', date_str)
+        if code in codes:
+            paths[code] = path
+    return paths
+
+def read_snodas_dats(dir_dat, date_str, codes, window = None):
+    """Return code mapped to memory mapped grids kept in dir_dat, None unless all codes are there"""
+    if dir_dat is None:
+        return None
+    paths = snodas_dat_paths(dir_dat, date_str, codes)
+    if len(paths) < len(codes):
+        return None
+    logger.info("read_snodas_dats: reading {} from {}".format(','.join(sorted(paths)), dir_dat))
+    return {code: open_snodas_dat(path, window) for code, path in paths.items()}
+
+def snodas_stack(dir_dat, date_list, code, window = None):
+    """Stack memory mapped windows of one snodas variable over dates
 
-    # Snow Depth
-    tif_list = glob.glob("{0}/*{1}*{2}{3}*{4}*{5}.tif".format(dir_work_snodas, '1036', date_str, "05", proj_str, basin_str))
+    Returns
+    -------
+        stack: np.ndarray
+            (date, row, col) int16 array, dates without a grid in dir_dat are
+            filled with nodata
+        transform: affine transform of the window
 
-    for tif in tif_list:
-        tif_int = os.path.splitext(tif)[0] + "_" + dtype_out + ".tif"
-        tif_out = cfg.dir_db + "snodas_snowdepth_" + date_str + "_" + basin_str + "_" + cfg.unit_sys + ".tif"
-        try:
-            rio_dtype_conversion(tif, tif_int, dtype_out)
-            rio_calc(tif_int, tif_out, calc_exp)
-            logger.info("org_snodas: calc {} {} to {}".format(calc_exp, tif, tif_out))
-        except:
-            logger.error("org_snodas: error calc {} to {}".format(tif, tif_out))
-    if not tif_list:
-        logger.error("org_snodas: error finding tifs to calc")
+    """
+    row_start, row_end, col_start, col_end = window or (0, snodas_nrows, 0, snodas_ncols)
+    stack = np.full((len(date_list), row_end - row_start, col_end - col_start), snodas_nodata, dtype='int16')
+    for i, date_dn in enumerate(date_list):
+        paths = snodas_dat_paths(dir_dat, date_dn.strftime('%Y%m%d'), [code])
+        if code in paths:
+            stack[i] = open_snodas_dat(paths[code], window)[0]
+    return stack, snodas_transform * Affine.translation(col_start, row_start)
 
-# swe : 1034 [m *1000]
-# snow depth : 1036 [m *1000]
-# snow melt runoff at base of snowpack : 1044 [m *100,000]
-# sublimation from snowpack : 1050 [m *100,000]
-# sublimation of blowing snow: 1039 [m *100,000]
-# solid precipitation: 1025(v code = IL01) [kg m-2 *10]
-# liquid precipitation: 1025(v code = IL00) [kg m-2 *10]
-# snowpack average temperature: 1038 [K *1]
+def read_snodas_tar(tar_path, date_str, codes, window = None, dir_dat = None):
+    """Decode snodas grids from a daily tar without extracting it
 
-    # calculate zonal statistics and export data
-    tif_list = glob.glob("{0}/{1}*{2}*{3}*{4}.tif".format(cfg.dir_db, 'snodas', date_str, basin_str, cfg.unit_sys))
+    Parameters
+    ---------
+        tar_path: string
+            file path of snodas tar
+        date_str: string
+            date in '%Y%m%d' format
+        codes: list of strings
+            variable codes to decode, see 'snodas_codes'
+        window: tuple of integers
+            rows and columns to decode, see 'snodas_window'
+            Default - None, the whole grid
+        dir_dat: string
+            directory to keep decompressed grids in, see 'store_snodas_dat'
+            Default - None, grids are only decoded in memory
 
-    for tif in tif_list:
+    Returns
+    -------
+        grids: dict
+            code mapped to [array, transform], see 'decode_snodas' and
+            'open_snodas_dat'
+
+    """
+    grids = {}
+    with tarfile.open(tar_path) as tar_con:
+        for member in tar_con:
+            code = snodas_member_code(member.name, date_str)
+            if code not in codes:
+                continue
+            gz_con = tar_con.extractfile(member)
+            if dir_dat is not None:
+                path = os.path.join(dir_dat, os.path.basename(member.name)[:-len('.dat.gz')] + '.bil')
+                store_snodas_dat(gz_con, path)
+                grids[code] = open_snodas_dat(path, window)
+            else:
+                grids[code] = decode_snodas(gz_con, window)
+            gz_con.close()
+            logger.info("read_snodas_tar: decoding {} from {}".format(member.name, tar_path))
+    return grids
+
+class tee_reader:
+    """Read only file object over a stream, copying the bytes read to a file
+
+    Attributes
+    ----------
+        nbytes: integer
+            number of bytes read
+        sha: hashlib object
+            sha256 of the bytes read
+
+    Notes
+    -----
+    Lets 'tarfile' stream mode read a socket while the same bytes are
+    written to an archive copy, see 'stream_snodas'.
+
+    """
+
+    def __init__(self, fileobj, copy_con = None, deadline = None):
+        """ """
+        self.fileobj = fileobj
+        self.copy_con = copy_con
+        self.deadline = deadline
+        self.nbytes = 0
+        self.sha = hashlib.sha256()
+
+    def read(self, size = -1):
+        """ """
+        if self.deadline is not None and time.time() > self.deadline:
+            raise IOError("tee_reader: transfer did not finish in time")
+        data = self.fileobj.read(size)
+        self.nbytes += len(data)
+        self.sha.update(data)
+        if self.copy_con is not None:
+            self.copy_con.write(data)
+        return data
+
+    def drain(self):
+        """Read to the end of the stream, e.g. the padding after a tar"""
+        while self.read(download_chunk_bytes):
+            pass
+
+def stream_snodas(cfg, date_dn, codes, window = None, dir_dat = None):
+    """Decode snodas grids straight from the ftp data stream
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        date_dn: datetime
+            date
+        codes: list of strings
+            variable codes to decode, see 'snodas_codes'
+        window: tuple of integers
+            rows and columns to decode, see 'snodas_window'
+            Default - None, the whole grid
+        dir_dat: string
+            directory to keep decompressed grids in, see 'store_snodas_dat'
+            Default - None, grids are only decoded in memory
+
+    Returns
+    -------
+        grids: dict
+            code mapped to [array, transform], see 'decode_snodas' and
+            'open_snodas_dat'
+
+    Notes
+    -----
+    The tar is read with 'tarfile' stream mode over a pooled connection, so
+    members not in codes are read past without being kept and wanted
+    members are decompressed as they arrive. Nothing is written to
+    'dir_work'. When 'cfg.arch_flag' is set the same bytes are written to
+    'dir_arch' and recorded in the download cache. A tar already in the
+    download cache or archive is decoded from disk with 'read_snodas_tar',
+    and grids kept in dir_dat are used without reading the tar.
+
+    """
+    dir_ftp = urlparse(cfg.host_snodas).path.rstrip('/') + cfg.dir_ftp_snodas + date_dn.strftime('%Y') + "/" \
+    + date_dn.strftime('%m') + "_" + date_dn.strftime('%b') + '/'
+    date_str = date_dn.strftime('%Y%m%d')
+    zip_name = "SNODAS_" + ("{}.tar".format(date_str))
+    zip_arch = cfg.dir_arch + 'snodas/' + zip_name
+    url = cfg.host_snodas.rstrip('/') + dir_ftp + zip_name
+    cache = get_download_cache(cfg)
+
+    grids = read_snodas_dats(dir_dat, date_str, codes, window)
+    if grids is not None:
+        return grids
+    location, _ = cache.lookup(url, [cfg.dir_work + 'snodas/' + zip_name, zip_arch])
+    if location is not None:
+        return read_snodas_tar(location, date_str, codes, window, dir_dat)
+
+    pool = get_snodas_pool(cfg)
+    if zip_name not in pool.listing(dir_ftp):
+        raise IOError("{} not posted in {}".format(zip_name, dir_ftp))
+    deadline = time.time() + cfg.download_timeout
+
+    def transfer():
+        copy_con = None
+        if cfg.arch_flag == True:
+            if not os.path.isdir(os.path.dirname(zip_arch)):
+                os.makedirs(os.path.dirname(zip_arch))
+            fd, copy_path = tempfile.mkstemp(prefix='.' + zip_name + '.', suffix='.part', dir=os.path.dirname(zip_arch))
+            copy_con = os.fdopen(fd, 'wb')
+        try:
+            grids = {}
+            with pool.connection() as ftp:
+                conn, size = ftp.ntransfercmd('RETR ' + dir_ftp + zip_name)
+                with conn:
+                    reader = tee_reader(conn.makefile('rb'), copy_con, deadline)
+                    with tarfile.open(fileobj=reader, mode='r|') as tar_con:
+                        for member in tar_con:
+                            code = snodas_member_code(member.name, date_str)
+                            if code not in codes:
+                                continue
+                            if dir_dat is not None:
+                                path = os.path.join(dir_dat, os.path.basename(member.name)[:-len('.dat.gz')] + '.bil')
+                                store_snodas_dat(tar_con.extractfile(member), path)
+                                grids[code] = open_snodas_dat(path, window)
+                            else:
+                                grids[code] = decode_snodas(tar_con.extractfile(member), window)
+                            logger.info("stream_snodas: decoding {} from {}".format(member.name, url))
+                    reader.drain()
+                ftp.voidresp()
+            if size is not None and reader.nbytes != size:
+                raise IOError("stream_snodas: {} ended after {} of {} bytes".format(url, reader.nbytes, size))
+            if copy_con is not None:
+                copy_con.close()
+                os.replace(copy_path, zip_arch)
+                cache.record(url, zip_arch, sha256=reader.sha.hexdigest())
+                logger.info("stream_snodas: archiving {0} to {1}".format(url, zip_arch))
+            with download_bytes_lock:
+                download_bytes['snodas'] = download_bytes.get('snodas', 0) + reader.nbytes
+            return grids
+        except:
+            if copy_con is not None:
+                copy_con.close()
+                os.remove(copy_path)
+            raise
+
+    grids = host_call(url, transfer, limit_max=pool.size)
+    with pool.lock:
+        pool.stats['transfers'] += 1
+    return grids
+
+def snodas_plan(cfg):
+    """Return the plan for warping and clipping snodas grids to a basin
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object for the basin
+
+    Returns
+    -------
+        plan: tuple
+            (transform, shape, mask) of the basin grid in 'cfg.proj', mask is
+            True outside the basin polygons
+
+    Notes
+    -----
+    The basin grid is aligned to the grid gdalwarp would choose for all of
+    snodas, and cropped to the basin polygon bounds.
+
+    """
+    bounds = rasterio.transform.array_bounds(snodas_nrows, snodas_ncols, snodas_transform)
+    full_transform, _, _ = calculate_default_transform(snodas_crs, cfg.proj, snodas_ncols, snodas_nrows, *bounds)
+    res_x = full_transform.a
+    res_y = -full_transform.e
+    xmin, ymin, xmax, ymax = cfg.basin_poly.total_bounds
+    x0 = full_transform.c + math.floor((xmin - full_transform.c) / res_x) * res_x
+    y0 = full_transform.f - math.floor((full_transform.f - ymax) / res_y) * res_y
+    width = max(1, int(math.ceil((xmax - x0) / res_x)))
+    height = max(1, int(math.ceil((y0 - ymin) / res_y)))
+    transform = Affine(res_x, 0, x0, 0, -res_y, y0)
+    mask = geometry_mask(cfg.basin_poly.geometry, (height, width), transform)
+    return transform, (height, width), mask
+
+def warp_snodas(grid, plan, crs_out):
+    """Reproject and clip a snodas grid from 'decode_snodas' in memory with a plan from 'snodas_plan', returns float64 array"""
+    transform, shape, mask = plan
+    rast = np.full(shape, snodas_nodata, dtype='float64')
+    reproject(
+        source=grid[0].astype('int16'),
+        destination=rast,
+        src_transform=grid[1],
+        src_crs=snodas_crs,
+        src_nodata=snodas_nodata,
+        dst_transform=transform,
+        dst_crs=crs_out,
+        dst_nodata=snodas_nodata,
+        resampling=Resampling.nearest)
+    rast[mask] = snodas_nodata
+    return rast
+
+def org_snodas(cfg, date_dn):
+    """Organize downloaded snodas data
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        date_dn: datetime
+            date
+
+    Returns
+    -------
+        None
+
+    Notes
+    -----
+    Decodes the grids in 'cfg.snodas_vars' from the tar in memory once, then
+    calls 'agg_snodas' for each basin in 'cfg.basin_cfgs'. Nothing is
+    extracted to disk. Only the rows and columns covering the basins are
+    decoded, see 'snodas_window'. When 'dir_dat_snodas' is set the grids
+    are kept decompressed there and read through memory maps, see
+    'open_snodas_dat'.
+
+    """
+
+    dir_work_snodas = cfg.dir_work + 'snodas/'
+    dir_arch_snodas = cfg.dir_arch + 'snodas/'
+    date_str = str(date_dn.strftime('%Y%m%d'))
+
+    # decode grids
+    zip_name = "SNODAS_" + ("{}.tar".format(date_dn.strftime('%Y%m%d')))
+    zip_path = dir_work_snodas + zip_name
+    zip_arch = dir_arch_snodas + zip_name
+
+    try:
+        window = snodas_window(cfg.basin_cfgs)
+        grids = read_snodas_dats(cfg.dir_dat_snodas, date_str, snodas_codes(cfg), window)
+        if grids is None:
+            grids = read_snodas_tar(zip_path, date_str, snodas_codes(cfg), window, cfg.dir_dat_snodas)
+    except:
+        # the tar is kept for the next run
+        logger.error("org_snodas: error decoding {0}".format(zip_path))
+        raise
+    missing = [code for code in snodas_codes(cfg) if code not in grids]
+    if missing:
+        raise IOError("org_snodas: {} missing from {}".format(','.join(missing), zip_path))
+    # the tar is not downloaded when the grids are kept in 'dir_dat_snodas'
+    if os.path.isfile(zip_path) and cfg.arch_flag == True:
+        os.rename(zip_path, zip_arch)
+        get_download_cache(cfg).moved(zip_path, zip_arch)
+        logger.info("org_snodas: archiving {0} to {1}".format(zip_path, zip_arch))
+    elif os.path.isfile(zip_path):
+        os.remove(zip_path)
+        logger.info("org_snodas: removing {0}".format(zip_path))
+
+    # warp, clip, convert units, and compute zonal statistics for each basin
+    for basin_cfg in cfg.basin_cfgs:
+        agg_snodas(basin_cfg, date_dn, grids)
+
+def ingest_snodas(cfg, date_dn):
+    """Download and organize snodas in one pass without writing the tar to 'dir_work'
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        date_dn: datetime
+            date
+
+    Returns
+    -------
+        None
+
+    Notes
+    -----
+    Used in place of 'download_snodas' and 'org_snodas' when 'stream_flag'
+    is set in the [snodas] section, see 'stream_snodas'.
+
+    """
+    try:
+        grids = stream_snodas(cfg, date_dn, snodas_codes(cfg), snodas_window(cfg.basin_cfgs), cfg.dir_dat_snodas)
+    except Exception as e:
+        logger.error("ingest_snodas: error streaming {}".format(date_dn.strftime('%Y-%m-%d')))
+        logger.error(e)
+        raise
+    missing = [code for code in snodas_codes(cfg) if code not in grids]
+    if missing:
+        raise IOError("ingest_snodas: {} missing for {}".format(','.join(missing), date_dn.strftime('%Y-%m-%d')))
+
+    # warp, clip, convert units, and compute zonal statistics for each basin
+    for basin_cfg in cfg.basin_cfgs:
+        agg_snodas(basin_cfg, date_dn, grids)
+
+def snodas_zones(geoms, plan):
+    """Return the flat indices of the plan grid cells touched by each geometry, see 'zone_stats'"""
+    transform, shape, _ = plan
+    zones = []
+    for geom in geoms:
+        if geom is None or geom.is_empty:
+            zones.append(np.array([], dtype='int64'))
+            continue
+        touched = geometry_mask([geom], shape, transform, all_touched=True, invert=True)
+        zones.append(np.flatnonzero(touched))
+    return zones
+
+def zone_stats(rasts, zones, nodata):
+    """Compute min, max, mean, and median of rasters sharing a grid for each zone
+
+    Parameters
+    ---------
+        rasts: list of arrays
+            rasters on the grid of the zones
+        zones: list of arrays
+            flat cell indices of each zone, see 'snodas_zones'
+        nodata:
+            nodata value of the rasters
+
+    Returns
+    -------
+        stats: list
+            one list per raster of one dict per zone, like 'zonal_stats',
+            values are None for zones without data
+
+    Notes
+    -----
+    Each zone is rasterized once and its cells are gathered for all rasters
+    at the same time.
+
+    """
+    stack = np.stack([rast.ravel() for rast in rasts])
+    stats = [[] for rast in rasts]
+    for cells in zones:
+        vals_zone = stack[:, cells]
+        for i in range(len(rasts)):
+            vals = vals_zone[i][vals_zone[i] != nodata]
+            if vals.size:
+                stats[i].append({'min': float(vals.min()), 'max': float(vals.max()),
+                                 'mean': float(vals.mean()), 'median': float(np.median(vals))})
+            else:
+                stats[i].append({'min': None, 'max': None, 'mean': None, 'median': None})
+    return stats
+
+def agg_snodas(cfg, date_dn, grids):
+    """Warp, clip, convert units, and compute zonal statistics of snodas for a basin
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object for the basin
+        date_dn: datetime
+            date
+        grids: dict
+            code mapped to snodas grid, see 'read_snodas_tar'
+
+    Returns
+    -------
+        None
+
+    Notes
+    -----
+    called from 'org_snodas', only the basin outputs are written to disk
+
+    """
+
+    date_str = str(date_dn.strftime('%Y%m%d'))
+    basin_str = os.path.splitext(os.path.basename(cfg.basin_poly_path))[0]
+
+    # warp and clip to basin polygon, all variables share the plan
+    try:
+        plan = snodas_plan(cfg)
+    except:
+        logger.error("org_snodas: error planning warp to {}".format(basin_str))
+        return
+    rast_list = []
+    for name, scale in cfg.snodas_vars.items():
+        code, _, quantity = snodas_vars[name]
+        if code not in grids:
+            logger.error("org_snodas: error finding {} grid".format(code))
+            continue
+        tif_out = cfg.dir_db + "snodas_" + name + "_" + date_str + "_" + basin_str + "_" + cfg.unit_sys + ".tif"
+        try:
+            rast = warp_snodas(grids[code], plan, cfg.proj)
+            valid = rast != snodas_nodata
+            # convert units, mm and degC for metric, inches and degF for english
+            vals = rast[valid] * scale
+            if quantity == 'temperature':
+                vals = vals - 273.15
+                if cfg.unit_sys == 'english':
+                    vals = vals * 9. / 5. + 32.
+            elif cfg.unit_sys == 'english':
+                vals = vals * .0393701
+            rast[valid] = vals
+            with rasterio.open(tif_out, 'w', driver='GTiff', height=rast.shape[0], width=rast.shape[1], count=1,
+                               dtype=rast.dtype, crs=cfg.proj, transform=plan[0], nodata=snodas_nodata) as dst:
+                dst.write(rast, 1)
+            rast_list.append([tif_out, rast])
+            logger.info("org_snodas: warping {} to {}".format(code, tif_out))
+        except:
+            logger.error("org_snodas: error warping {} to {}".format(code, tif_out))
+
+    # calculate zonal statistics of all variables in one pass
+    poly_stats = None
+    points_stats = None
+    if rast_list and 'poly' in cfg.output_type:
+        try:
+            poly_stats = zone_stats([rast for tif, rast in rast_list], snodas_zones(cfg.basin_poly.geometry, plan),
+                                    snodas_nodata)
+        except:
+            logger.error("org_snodas: error computing poly zonal statistics")
+    if rast_list and 'points' in cfg.output_type:
+        try:
+            points_stats = zone_stats([rast for tif, rast in rast_list], snodas_zones(cfg.basin_points.geometry, plan),
+                                      snodas_nodata)
+        except:
+            logger.error("org_snodas: error computing points zonal statistics")
+
+    # export data
+    for i, (tif, rast) in enumerate(rast_list):
         file_meta = os.path.basename(tif).replace('.', '_').split('_')
 
         if 'poly' in cfg.output_type:
             try:
-                tif_stats = zonal_stats(cfg.basin_poly_path, tif, stats=['min', 'max', 'median', 'mean'], all_touched=True)
+                tif_stats = poly_stats[i]
                 tif_stats_df = pd.DataFrame(tif_stats)
                 logger.info("org_snodas: computing zonal statistics")
             except:
@@ -1004,7 +1875,7 @@ def org_snodas(cfg, date_dn):
 
         if 'points' in cfg.output_type:
             try:
-                tif_stats = zonal_stats(cfg.basin_points_path, tif, stats=['min', 'max', 'median', 'mean'], all_touched=True)
+                tif_stats = points_stats[i]
                 tif_stats_df = pd.DataFrame(tif_stats)
                 logger.info("org_snodas: computing points zonal statistics")
             except:
@@ -1034,16 +1905,6 @@ def org_snodas(cfg, date_dn):
                 except:
                     logger.error("org_snodas: error writing {0}".format(csv_out))
 
-    # clean up working directory
-    for file in os.listdir(dir_work_snodas):
-        file_path = dir_work_snodas + file
-        try:
-            os.remove(file_path)
-            logger.info("org_snodas: removing {}".format(file_path))
-        except:
-            logger.error("org_snodas: error removing {}".format(file_path))
-
-
 def download_srpt(cfg, date_dn, overwrite_flag = False):
     """Download snow reports from nohrsc
 
@@ -1079,11 +1940,13 @@ def download_srpt(cfg, date_dn, overwrite_flag = False):
         logger.info("download_srpt: downloading {} {}".format('snow reports', date_dn.strftime('%Y-%m-%d')))
         logger.info("download_srpt: downloading from {}".format(kmz_srpt_url))
         logger.info("download_srpt: downloading to {}".format(kmz_srpt_path))
+        # reports are added through the day, revalidate cached copies
         try:
-            urllib.request.urlretrieve(kmz_srpt_url, kmz_srpt_path)
-        except IOError as e:
-            logger.error("download_srpt: error downloading {} {}".format('snow reports', date_dn.strftime('%Y-%m-%d')))
-            logging.error(e)
+            get_download_cache(cfg).fetch(kmz_srpt_url, kmz_srpt_path, engine_download(cfg, 'srpt'), mutable=True)
+        except Exception as e:
+            logger.error("download_srpt: error downloading {}".format(kmz_srpt_url))
+            logger.error(e)
+            raise
 
 def org_srpt(cfg, date_dn):
     """Downloads daily snow reporters KMZ from NOHRSC
@@ -1109,7 +1972,6 @@ def org_srpt(cfg, date_dn):
     #  OPTION TO SPECIFY AN ALTERNATE BOUNDARY?
     # https://stackoverflow.com/questions/55586376/how-to-obtain-element-values-from-a-kml-by-using-lmxl
 
-    basin_str = os.path.splitext(os.path.basename(cfg.basin_poly_path))[0]
     dir_work_srpt = cfg.dir_work + 'srpt/'
 
     # snow reports (stations)
@@ -1206,19 +2068,24 @@ def org_srpt(cfg, date_dn):
         srpt_gpd.loc[:, 'latestDepthin'] = srpt_gpd.loc[:, 'latestDepthCm'].values * 0.393701
         srpt_gpd = srpt_gpd.drop(columns=['elevationMeters', 'latestSWEcm', 'latestDepthCm'])
 
-    # clip to basin
-    srpt_gpd_clip = gpd.clip(srpt_gpd.to_crs(cfg.proj), cfg.basin_poly, keep_geom_type = False)
-
-    # write out data
-    geojson_out = cfg.dir_db + 'snowreporters_obs_' + date_dn.strftime('%Y%m%d') + '_' + basin_str + '.geojson'
-    srpt_gpd_clip.to_file(geojson_out, driver = 'GeoJSON')
-    csv_out = cfg.dir_db + 'snowreporters_obs_' + date_dn.strftime('%Y%m%d') + '_' + basin_str + '.csv'
-    srpt_gpd_clip_df = pd.DataFrame(srpt_gpd_clip.drop(columns = 'geometry'))
-    srpt_gpd_clip_df.insert(1, 'Source', 'NOHRSCSnowReporters')
-    srpt_gpd_clip_df.to_csv(csv_out, index=False)
-
-    # clean up working directory
+    # clip to each basin
+    for basin_cfg in cfg.basin_cfgs:
+        basin_str = os.path.splitext(os.path.basename(basin_cfg.basin_poly_path))[0]
+        srpt_gpd_clip = gpd.clip(srpt_gpd.to_crs(basin_cfg.proj), basin_cfg.basin_poly, keep_geom_type = False)
+
+        # write out data
+        geojson_out = basin_cfg.dir_db + 'snowreporters_obs_' + date_dn.strftime('%Y%m%d') + '_' + basin_str + '.geojson'
+        srpt_gpd_clip.to_file(geojson_out, driver = 'GeoJSON')
+        csv_out = basin_cfg.dir_db + 'snowreporters_obs_' + date_dn.strftime('%Y%m%d') + '_' + basin_str + '.csv'
+        srpt_gpd_clip_df = pd.DataFrame(srpt_gpd_clip.drop(columns = 'geometry'))
+        srpt_gpd_clip_df.insert(1, 'Source', 'NOHRSCSnowReporters')
+        srpt_gpd_clip_df.to_csv(csv_out, index=False)
+
+    # clean up working directory, files for other dates may still be
+    # waiting to be organized
     for file in os.listdir(dir_work_srpt):
+        if date_dn.strftime('%Y%m%d') not in file:
+            continue
         file_path = dir_work_srpt + file
         try:
             os.remove(file_path)
@@ -1270,10 +2137,10 @@ def download_nsa(cfg, date_dn, overwrite_flag = False):
         logger.info("download_nsa: downloading from {}".format(tif_24hr_url))
         logger.info("download_nsa: downloading to {}".format(tif_24hr_path))
         try:
-            urllib.request.urlretrieve(tif_24hr_url, tif_24hr_path)
-        except IOError as e:
-            logger.error("download_nsa: error downloading {} {}".format('24hr', date_dn.strftime('%Y-%m-%d')))
-            logging.error(e)
+            get_download_cache(cfg).fetch(tif_24hr_url, tif_24hr_path, engine_download(cfg, 'nsa'))
+        except Exception as e:
+            logger.error("download_nsa: error downloading {}".format(tif_24hr_url))
+            logger.error(e)
 
 def download_modscag(cfg, date_dn, overwrite_flag = False):
     """Download modscag from JPL
@@ -1301,64 +2168,40 @@ def download_modscag(cfg, date_dn, overwrite_flag = False):
     """
 
     site_url = cfg.host_jpl + cfg.dir_http_modscag + date_dn.strftime('%Y') + "/" + date_dn.strftime('%j')
-    r = requests.get(site_url, auth=HTTPDigestAuth(cfg.username_jpl, cfg.password_jpl), verify=cfg.ssl_verify)
+    session = get_jpl_session(cfg)
+    r = host_call(site_url, lambda: raise_for_throttle(session.get(site_url, timeout=60)), limit_max=cfg.host_limit)
     if r.status_code == 200:
         dir_work_d = cfg.dir_work + 'modscag/'
         if not os.path.isdir(dir_work_d):
             os.makedirs(dir_work_d)
 
-        # loop through modis sinusodial tiles
+        # submit snow_fraction and vegetation_fraction for all modis sinusodial tiles
+        # to the download engine so they transfer concurrently
+        engine = get_download_engine(cfg)
+        futures = []
         for tile in cfg.singrd_tile_list:
-
-            # snow fraction (fsca)
-            tif_fsca_name = "MOD09GA.A" + date_dn.strftime('%Y') + date_dn.strftime('%j') + "." + tile + ".006.NRT.snow_fraction.tif"
-            tif_fsca_url = site_url + "/" + tif_fsca_name
-            tif_fsca_path = dir_work_d + tif_fsca_name
-
-            if os.path.isfile(tif_fsca_path) and overwrite_flag:
-                os.remove(tif_fsca_path)
-            if os.path.isfile(tif_fsca_path) and overwrite_flag == False:
-                logger.info("download_modscag: skipping {} {}, {} exists".format(date_dn.strftime('%Y-%m-%d'), tile, tif_fsca_path))
-            if not os.path.isfile(tif_fsca_path):
-                logger.info("download_modscag: downloading {} {} {}".format('snow_fraction', date_dn.strftime('%Y-%m-%d'), tile))
-                logger.info("download_modscag: downloading from {}".format(tif_fsca_url))
-                logger.info("download_modscag: downloading to {}".format(tif_fsca_path))
-                try:
-                    r = requests.get(tif_fsca_url, auth = HTTPDigestAuth(cfg.username_jpl, cfg.password_jpl), verify=cfg.ssl_verify)
-                    if r.status_code == 200:
-                        with open(tif_fsca_path, 'wb') as rfile:
-                            rfile.write(r.content)
-                    else:
-                        logger.error("download_modscag: error downloading {} {} {}".format('snow_fraction', date_dn.strftime('%Y-%m-%d'), tile))
-                except IOError as e:
-                    logger.error("download_modscag: error downloading {} {} {}".format(date_dn.strftime('snow_fraction', '%Y-%m-%d'), tile))
-                    logging.error(e)
-
-                # vegetation fraction (vfrac)
-                tif_vfrac_name = "MOD09GA.A" + date_dn.strftime('%Y') + date_dn.strftime('%j') + "." + tile + ".006.NRT.vegetation_fraction.tif"
-                tif_vfrac_url = site_url + "/" + tif_vfrac_name
-                tif_vfrac_path = dir_work_d + tif_vfrac_name
-
-                if os.path.isfile(tif_vfrac_path) and overwrite_flag:
-                    os.remove(tif_vfrac_path)
-                if os.path.isfile(tif_vfrac_path) and overwrite_flag == False:
-                    logger.info("download_modscag: skipping {} {}, {} exists".format(date_dn.strftime('%Y-%m-%d'), tile, tif_vfrac_path))
-                if not os.path.isfile(tif_vfrac_path):
-                    logger.info("download_modscag: downloading {} {} {}".format('vegetation_fraction', date_dn.strftime('%Y-%m-%d'), tile))
-                    logger.info("download_modscag: downloading from {}".format(tif_vfrac_url))
-                    logger.info("download_modscag: downloading to {}".format(tif_vfrac_path))
-                    try:
-                        r = requests.get(tif_vfrac_url, auth = HTTPDigestAuth(cfg.username_jpl, cfg.password_jpl), verify=cfg.ssl_verify)
-                        if r.status_code == 200:
-                            with open(tif_vfrac_path, 'wb') as rfile:
-                                rfile.write(r.content)
-                        else:
-                            logger.error("download_modscag: error downloading {} {} {}".format('vegetation_fraction', date_dn.strftime('%Y-%m-%d'), tile))
-                    except IOError as e:
-                        logger.error("download_modscag: error downloading {} {} {}".format(date_dn.strftime('vegetation_fraction', '%Y-%m-%d'), tile))
-                        logging.error(e)
+            for var in ['snow_fraction', 'vegetation_fraction']:
+                tif_name = "MOD09GA.A" + date_dn.strftime('%Y') + date_dn.strftime('%j') + "." + tile + ".006.NRT." + var + ".tif"
+                tif_url = site_url + "/" + tif_name
+                tif_path = dir_work_d + tif_name
+
+                if os.path.isfile(tif_path) and overwrite_flag:
+                    os.remove(tif_path)
+                if os.path.isfile(tif_path) and overwrite_flag == False:
+                    logger.info("download_modscag: skipping {} {}, {} exists".format(date_dn.strftime('%Y-%m-%d'), tile, tif_path))
+                if not os.path.isfile(tif_path):
+                    logger.info("download_modscag: downloading {} {} {}".format(var, date_dn.strftime('%Y-%m-%d'), tile))
+                    logger.info("download_modscag: downloading from {}".format(tif_url))
+                    logger.info("download_modscag: downloading to {}".format(tif_path))
+                    futures.append(engine.submit(tif_url, tif_path, session=session,
+                                                 callback=download_callback('modscag')))
+        wait_downloads(futures, 'modscag')
+        stats = session_stats(session)
+        logger.info("download_modscag: jpl session {} requests over {} connections, {} digest challenges".format(
+            stats['requests'], stats['connections'], stats['challenges']))
     else:
         logger.error("download_modscag: error connecting {}".format(site_url))
+        raise IOError("download_modscag: {} returned {}".format(site_url, r.status_code))
 
 def org_modscag(cfg, date_dn):
     """ Organize downloaded modscag data
@@ -1386,61 +2229,106 @@ def org_modscag(cfg, date_dn):
     date_str = str(date_dn.strftime('%Y%m%d'))
     chr_rm = [":"]
     proj_str = ''.join(i for i in cfg.proj if not i in chr_rm)
-    basin_str = os.path.splitext(os.path.basename(cfg.basin_poly_path))[0]
 
-    # merge and reproject snow fraction (fsca) files
-    tif_list_fsca = glob.glob("{0}/*{1}*{2}.tif".format(dir_work_modscag, date_dn.strftime('%Y%j'), "snow_fraction"))
-    tif_out_fsca = 'data\working\modscag\MOD09GA_' + date_str + '_{0}_fsca.tif'
+    # merge and reproject once in a scratch directory only used by this task,
+    # then clip and summarize for each basin
+    with task_scratch_dir(cfg, 'modscag', date_str) as dir_scratch:
+        # merge and reproject snow fraction (fsca) files
+        tif_list_fsca = glob.glob("{0}/*{1}*{2}.tif".format(dir_work_modscag, date_dn.strftime('%Y%j'), "snow_fraction"))
+        tif_out_fsca = dir_scratch + 'MOD09GA_' + date_str + '_{0}_fsca.tif'
 
-    try:
-        rasterio_raster_merge(tif_list_fsca, tif_out_fsca.format("ext"))
-        logger.info("org_modscag: merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'snow_fraction'))
-    except:
-        logger.error("org_modscag: error merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'snow_fraction'))
-    try:
-        rasterio_raster_reproject(tif_out_fsca.format("ext"), tif_out_fsca.format(proj_str), cfg.proj, nodata=250)
-        logger.info("org_modscag: reprojecting {} to {}".format('snow_fraction', date_dn.strftime('%Y-%m-%d')))
-    except:
-        logger.error("org_modscag: error reprojecting {} to {}".format(tif_out_fsca.format("ext"), tif_out_fsca.format(proj_str), cfg.proj))
+        try:
+            rasterio_raster_merge(tif_list_fsca, tif_out_fsca.format("ext"))
+            logger.info("org_modscag: merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'snow_fraction'))
+        except:
+            logger.error("org_modscag: error merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'snow_fraction'))
+        try:
+            rasterio_raster_reproject(tif_out_fsca.format("ext"), tif_out_fsca.format(proj_str), cfg.proj, nodata=250)
+            logger.info("org_modscag: reprojecting {} to {}".format('snow_fraction', date_dn.strftime('%Y-%m-%d')))
+        except:
+            logger.error("org_modscag: error reprojecting {} to {}".format(tif_out_fsca.format("ext"), tif_out_fsca.format(proj_str), cfg.proj))
 
-    # merge and reproject vegetation fraction files (vfrac)
-    tif_list_vfrac = glob.glob("{0}/*{1}*{2}.tif".format(dir_work_modscag, date_dn.strftime('%Y%j'), "vegetation_fraction"))
-    tif_out_vfrac = 'data\working\modscag\MOD09GA_' + date_str + '_{0}_vfrac.tif'
+        # merge and reproject vegetation fraction files (vfrac)
+        tif_list_vfrac = glob.glob("{0}/*{1}*{2}.tif".format(dir_work_modscag, date_dn.strftime('%Y%j'), "vegetation_fraction"))
+        tif_out_vfrac = dir_scratch + 'MOD09GA_' + date_str + '_{0}_vfrac.tif'
 
-    try:
-        rasterio_raster_merge(tif_list_vfrac, tif_out_vfrac.format("ext"))
-        logger.info("org_modscag: merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'vegetation_fraction'))
-    except:
-        logger.error("org_modscag: error merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'vegetation_fraction'))
-    try:
-        rasterio_raster_reproject(tif_out_vfrac.format("ext"), tif_out_vfrac.format(proj_str), cfg.proj, nodata=250)
-        logger.info("org_modscag: reprojecting {} to {}".format('vegetation_fraction', date_dn.strftime('%Y-%m-%d')))
-    except:
-        logger.error("org_modscag: error reprojecting {} to {}".format(tif_out_vfrac.format("ext"), tif_out_vfrac.format(proj_str), cfg.proj))
+        try:
+            rasterio_raster_merge(tif_list_vfrac, tif_out_vfrac.format("ext"))
+            logger.info("org_modscag: merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'vegetation_fraction'))
+        except:
+            logger.error("org_modscag: error merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'vegetation_fraction'))
+        try:
+            rasterio_raster_reproject(tif_out_vfrac.format("ext"), tif_out_vfrac.format(proj_str), cfg.proj, nodata=250)
+            logger.info("org_modscag: reprojecting {} to {}".format('vegetation_fraction', date_dn.strftime('%Y-%m-%d')))
+        except:
+            logger.error("org_modscag: error reprojecting {} to {}".format(tif_out_vfrac.format("ext"), tif_out_vfrac.format(proj_str), cfg.proj))
+
+        # clip, mask, and compute zonal statistics for each basin
+        for basin_cfg in cfg.basin_cfgs:
+            agg_modscag(basin_cfg, date_dn, dir_scratch)
+
+    # clean up working directory, files for other dates may still be
+    # waiting to be organized
+    for file in os.listdir(dir_work_modscag):
+        if date_str not in file and date_dn.strftime('%Y%j') not in file:
+            continue
+        file_path = dir_work_modscag + file
+        try:
+            os.remove(file_path)
+            logger.info("org_modscag: removing {}".format(file_path))
+        except:
+            logger.error("org_modscag: error removing {}".format(file_path))
+
+def agg_modscag(cfg, date_dn, dir_scratch):
+    """Clip, mask, and compute zonal statistics of modscag for a basin
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object for the basin
+        date_dn: datetime
+            date
+        dir_scratch: string
+            scratch directory with merged and reprojected modscag geotifs
+
+    Returns
+    -------
+        None
+
+    Notes
+    -----
+    called from 'org_modscag'
+
+    """
+
+    date_str = str(date_dn.strftime('%Y%m%d'))
+    chr_rm = [":"]
+    proj_str = ''.join(i for i in cfg.proj if not i in chr_rm)
+    basin_str = os.path.splitext(os.path.basename(cfg.basin_poly_path))[0]
 
     # clip to basin polygon (fsca)
-    tif_list = glob.glob("{0}/*{1}*{2}*{3}.tif".format(dir_work_modscag, date_str, proj_str, "fsca"))
+    tif_list = glob.glob("{0}/*{1}*{2}*{3}.tif".format(dir_scratch, date_str, proj_str, "fsca"))
     for tif in tif_list:
-        tif_out = dir_work_modscag + "modscag_fsca_" + date_str + "_" + basin_str + ".tif"
+        tif_out = dir_scratch + "modscag_fsca_" + date_str + "_" + basin_str + ".tif"
         try:
             gdal_raster_clip(cfg.basin_poly_path, tif, tif_out, cfg.proj, cfg.proj, 250)
-            logger.info("org_modscag: clipping {} to {}".format(tif, tif_out))
+            logger.info("agg_modscag: clipping {} to {}".format(tif, tif_out))
         except:
-            logger.error("org_modscag: error clipping {} to {}".format(tif, tif_out))
+            logger.error("agg_modscag: error clipping {} to {}".format(tif, tif_out))
     if not tif_list:
-        logger.error("org_modscag: error finding tifs to clip")
+        logger.error("agg_modscag: error finding tifs to clip")
 
     # clip to basin polygon (vfrac)
-    tif_list = glob.glob("{0}/*{1}*{2}*{3}.tif".format(dir_work_modscag, date_str, proj_str, "vfrac"))
+    tif_list = glob.glob("{0}/*{1}*{2}*{3}.tif".format(dir_scratch, date_str, proj_str, "vfrac"))
     for tif in tif_list:
-        tif_out = dir_work_modscag + "modscag_vfrac_" + date_str + "_" + basin_str + ".tif"
+        tif_out = dir_scratch + "modscag_vfrac_" + date_str + "_" + basin_str + ".tif"
         try:
             gdal_raster_clip(cfg.basin_poly_path, tif, tif_out, cfg.proj, cfg.proj, 250)
-            logger.info("org_modscag: clipping {} to {}".format(tif, tif_out))
+            logger.info("agg_modscag: clipping {} to {}".format(tif, tif_out))
         except:
-            logger.error("org_modscag: error clipping {} to {}".format(tif, tif_out))
+            logger.error("agg_modscag: error clipping {} to {}".format(tif, tif_out))
     if not tif_list:
-        logger.error("org_modscag: error finding tifs to clip")
+        logger.error("agg_modscag: error finding tifs to clip")
 
     # set filenames
     file_fsca = "modscag_fsca_" + date_str + "_" + basin_str + ".tif"
@@ -1448,8 +2336,8 @@ def org_modscag(cfg, date_dn):
     file_fscavegcor = "modscag_fscavegcor_" + date_str + "_" + basin_str + ".tif"
 
     # open connection to rasters
-    rast_fsca = rasterio.open(dir_work_modscag + file_fsca)
-    rast_vfrac = rasterio.open(dir_work_modscag + file_vfrac)
+    rast_fsca = rasterio.open(dir_scratch + file_fsca)
+    rast_vfrac = rasterio.open(dir_scratch + file_vfrac)
 
     # read in raster data to np array
     fsca = rast_fsca.read(1)
@@ -1509,30 +2397,30 @@ def org_modscag(cfg, date_dn):
     rast_vfrac.close()
 
     # calculate zonal statistics and export data
-    tif_list = glob.glob("{0}/{1}*{2}*{3}*.tif".format(cfg.dir_db, 'modscag', date_str, basin_str))
+    tif_list = glob.glob("{0}/{1}_*_{2}_{3}.tif".format(cfg.dir_db, 'modscag', date_str, basin_str))
     for tif in tif_list:
         file_meta = os.path.basename(tif).replace('.', '_').split('_')
         if 'poly' in cfg.output_type:
             try:
                 tif_stats = zonal_stats(cfg.basin_poly_path, tif, stats=['median', 'mean'], all_touched=True)
                 tif_stats_df = pd.DataFrame(tif_stats)
-                logger.info("org_modscag: computing zonal statistics")
+                logger.info("agg_modscag: computing zonal statistics")
             except:
-                logger.error("org_modscag: error computing poly zonal statistics")
+                logger.error("agg_modscag: error computing poly zonal statistics")
             try:
                 frames = [cfg.basin_poly, tif_stats_df]
                 basin_poly_stats = pd.concat(frames, axis=1)
-                logger.info("org_modscag: merging poly zonal statistics")
+                logger.info("agg_modscag: merging poly zonal statistics")
             except:
-                logger.error("org_modscag: error merging zonal statistics")
+                logger.error("agg_modscag: error merging zonal statistics")
 
             if 'geojson' in cfg.output_format:
                 try:
                     geojson_out = os.path.splitext(tif)[0] + "_poly.geojson"
                     basin_poly_stats.to_file(geojson_out, driver='GeoJSON')
-                    logger.info("org_modscag: writing {0}".format(geojson_out))
+                    logger.info("agg_modscag: writing {0}".format(geojson_out))
                 except:
-                    logger.error("org_modscag: error writing {0}".format(geojson_out))
+                    logger.error("agg_modscag: error writing {0}".format(geojson_out))
             if 'csv' in cfg.output_format:
                 try:
                     csv_out = os.path.splitext(tif)[0] + "_poly.csv"
@@ -1541,23 +2429,23 @@ def org_modscag(cfg, date_dn):
                     basin_poly_stats_df.insert(0, 'Type', file_meta[1])
                     basin_poly_stats_df.insert(0, 'Date', dt.datetime.strptime(file_meta[2], '%Y%m%d').strftime('%Y-%m-%d %H:%M'))
                     basin_poly_stats_df.to_csv(csv_out, index=False)
-                    logger.info("org_modscag: writing {0}".format(csv_out))
+                    logger.info("agg_modscag: writing {0}".format(csv_out))
                 except:
-                    logger.error("org_modscag: error writing {0}".format(csv_out))
+                    logger.error("agg_modscag: error writing {0}".format(csv_out))
 
         if 'points' in cfg.output_type:
             try:
                 tif_stats = zonal_stats(cfg.basin_points_path, tif, stats=['median', 'mean'], all_touched=True)
                 tif_stats_df = pd.DataFrame(tif_stats)
-                logger.info("org_modscag: computing points zonal statistics")
+                logger.info("agg_modscag: computing points zonal statistics")
             except:
-                logger.error("org_modscag: error computing points zonal statistics")
+                logger.error("agg_modscag: error computing points zonal statistics")
             try:
                 frames = [cfg.basin_points, tif_stats_df]
                 basin_points_stats = pd.concat(frames, axis=1)
-                logger.info("org_modscag: merging zonal statistics")
+                logger.info("agg_modscag: merging zonal statistics")
             except:
-                logger.error("org_modscag: error merging zonal statistics")
+                logger.error("agg_modscag: error merging zonal statistics")
             if 'geojson' in cfg.output_format:
                 try:
                     geojson_out = os.path.splitext(tif)[0] + "_points.geojson"
@@ -1573,19 +2461,9 @@ def org_modscag(cfg, date_dn):
                     basin_points_stats_df.insert(0, 'Type', file_meta[1])
                     basin_points_stats_df.insert(0, 'Date', dt.datetime.strptime(file_meta[2], '%Y%m%d').strftime('%Y-%m-%d %H:%M'))
                     basin_points_stats_df.to_csv(csv_out, index=False)
-                    logger.info("org_modscag: writing {0}".format(csv_out))
+                    logger.info("agg_modscag: writing {0}".format(csv_out))
                 except:
-                    logger.error("org_modscag: error writing {0}".format(csv_out))
-
-    # clean up working directory
-    for file in os.listdir(dir_work_modscag):
-        file_path = dir_work_modscag + file
-        try:
-            os.remove(file_path)
-            logger.info("org_modscag: removing {}".format(file_path))
-        except:
-            logger.error("org_modscag: error removing {}".format(file_path))
-
+                    logger.error("agg_modscag: error writing {0}".format(csv_out))
 
 def download_moddrfs(cfg, date_dn, overwrite_flag = False):
     """Download moddrfs from JPL
@@ -1615,65 +2493,40 @@ def download_moddrfs(cfg, date_dn, overwrite_flag = False):
     """
 
     site_url = cfg.host_jpl + cfg.dir_http_moddrfs + date_dn.strftime('%Y') + "/" + date_dn.strftime('%j')
-    r = requests.get(site_url, auth=HTTPDigestAuth(cfg.username_jpl, cfg.password_jpl), verify=cfg.ssl_verify)
+    session = get_jpl_session(cfg)
+    r = host_call(site_url, lambda: raise_for_throttle(session.get(site_url, timeout=60)), limit_max=cfg.host_limit)
     if r.status_code == 200:
         dir_work_d = cfg.dir_work + 'moddrfs/'
         if not os.path.isdir(dir_work_d):
             os.makedirs(dir_work_d)
 
-        # loop through modis sinusodial tiles
+        # submit forcing and drfs.grnsz for all modis sinusodial tiles
+        # to the download engine so they transfer concurrently
+        engine = get_download_engine(cfg)
+        futures = []
         for tile in cfg.singrd_tile_list:
-
-            # forcing (forc)
-            tif_forc_name = "MOD09GA.A" + date_dn.strftime('%Y') + date_dn.strftime('%j') + "." + tile + ".006.NRT.forcing.tif"
-            tif_forc_url = site_url + "/" + tif_forc_name
-            tif_forc_path = dir_work_d + tif_forc_name
-
-            if os.path.isfile(tif_forc_path) and overwrite_flag:
-                os.remove(tif_forc_path)
-            if os.path.isfile(tif_forc_path) and overwrite_flag == False:
-                logger.info("download_moddrfs: skipping {} {}, {} exists".format(date_dn.strftime('%Y-%m-%d'), tile, tif_forc_path))
-            if not os.path.isfile(tif_forc_path):
-                logger.info("download_moddrfs: downloading {} {} {}".format('forcing', date_dn.strftime('%Y-%m-%d'), tile))
-                logger.info("download_moddrfs: downloading from {}".format(tif_forc_url))
-                logger.info("download_moddrfs: downloading to {}".format(tif_forc_path))
-                try:
-                    r = requests.get(tif_forc_url, auth = HTTPDigestAuth(cfg.username_jpl, cfg.password_jpl), verify=cfg.ssl_verify)
-                    if r.status_code == 200:
-                        with open(tif_forc_path, 'wb') as rfile:
-                            rfile.write(r.content)
-                    else:
-                        logger.error("download_moddrfs: error downloading {} {} {}".format('forcing', date_dn.strftime('%Y-%m-%d'), tile))
-                except IOError as e:
-                    logger.error("download_moddrfs: error downloading {} {} {}".format(date_dn.strftime('forcing', '%Y-%m-%d'), tile))
-                    logging.error(e)
-
-                # grain size (grnsz)
-                tif_grnsz_name = "MOD09GA.A" + date_dn.strftime('%Y') + date_dn.strftime('%j') + "." + tile + ".006.NRT.drfs.grnsz.tif"
-                tif_grnsz_url = site_url + "/" + tif_grnsz_name
-                tif_grnsz_path = dir_work_d + tif_grnsz_name
-
-                if os.path.isfile(tif_grnsz_path) and overwrite_flag:
-                    os.remove(tif_grnsz_path)
-                if os.path.isfile(tif_grnsz_path) and overwrite_flag == False:
-                    logger.info("download_moddrfs: skipping {} {}, {} exists".format(date_dn.strftime('%Y-%m-%d'), tile, tif_grnsz_path))
-                if not os.path.isfile(tif_grnsz_path):
-                    logger.info("download_moddrfs: downloading {} {} {}".format('drfs.grnsz', date_dn.strftime('%Y-%m-%d'), tile))
-                    logger.info("download_moddrfs: downloading from {}".format(tif_grnsz_url))
-                    logger.info("download_moddrfs: downloading to {}".format(tif_grnsz_path))
-                    try:
-                        r = requests.get(tif_grnsz_url, auth = HTTPDigestAuth(cfg.username_jpl, cfg.password_jpl), verify=cfg.ssl_verify)
-                        if r.status_code == 200:
-                            with open(tif_grnsz_path, 'wb') as rfile:
-                                rfile.write(r.content)
-                        else:
-                            logger.error("download_moddrfs: error downloading {} {} {}".format('drfs.grnsz', date_dn.strftime('%Y-%m-%d'), tile))
-                    except IOError as e:
-                        logger.error("download_moddrfs: error downloading {} {} {}".format(date_dn.strftime('drfs.grnsz', '%Y-%m-%d'), tile))
-                        logging.error(e)
+            for var in ['forcing', 'drfs.grnsz']:
+                tif_name = "MOD09GA.A" + date_dn.strftime('%Y') + date_dn.strftime('%j') + "." + tile + ".006.NRT." + var + ".tif"
+                tif_url = site_url + "/" + tif_name
+                tif_path = dir_work_d + tif_name
+
+                if os.path.isfile(tif_path) and overwrite_flag:
+                    os.remove(tif_path)
+                if os.path.isfile(tif_path) and overwrite_flag == False:
+                    logger.info("download_moddrfs: skipping {} {}, {} exists".format(date_dn.strftime('%Y-%m-%d'), tile, tif_path))
+                if not os.path.isfile(tif_path):
+                    logger.info("download_moddrfs: downloading {} {} {}".format(var, date_dn.strftime('%Y-%m-%d'), tile))
+                    logger.info("download_moddrfs: downloading from {}".format(tif_url))
+                    logger.info("download_moddrfs: downloading to {}".format(tif_path))
+                    futures.append(engine.submit(tif_url, tif_path, session=session,
+                                                 callback=download_callback('moddrfs')))
+        wait_downloads(futures, 'moddrfs')
+        stats = session_stats(session)
+        logger.info("download_moddrfs: jpl session {} requests over {} connections, {} digest challenges".format(
+            stats['requests'], stats['connections'], stats['challenges']))
     else:
         logger.error("download_moddrfs: error connecting {}".format(site_url))
-
+        raise IOError("download_moddrfs: {} returned {}".format(site_url, r.status_code))
 
 def org_moddrfs(cfg, date_dn):
     """ Organize downloaded moddrfs data
@@ -1700,69 +2553,114 @@ def org_moddrfs(cfg, date_dn):
     date_str = str(date_dn.strftime('%Y%m%d'))
     chr_rm = [":"]
     proj_str = ''.join(i for i in cfg.proj if not i in chr_rm)
-    basin_str = os.path.splitext(os.path.basename(cfg.basin_poly_path))[0]
-
-    # merge and reproject radiative forcing (forc) files
-    tif_list_forc = glob.glob("{0}/*{1}*{2}.tif".format(dir_work_moddrfs, date_dn.strftime('%Y%j'), "forcing"))
-    tif_out_forc = 'data\working\moddrfs\MOD09GA_' + date_str + '_{0}_forc.tif'
 
-    try:
-        rasterio_raster_merge(tif_list_forc, tif_out_forc.format("ext"))
-        logger.info("org_moddrfs: merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'forcing'))
-    except:
-        logger.error("org_moddrfs: error merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'forcing'))
-    try:
-        rasterio_raster_reproject(tif_out_forc.format("ext"), tif_out_forc.format(proj_str), cfg.proj, nodata=2500)
-        logger.info("org_moddrfs: reprojecting {} to {}".format('forcing', date_dn.strftime('%Y-%m-%d')))
-    except:
-        logger.error("org_moddrfs: error reprojecting {} to {}".format(tif_out_forc.format("ext"), tif_out_forc.format(proj_str), cfg.proj))
+    # merge and reproject once in a scratch directory only used by this task,
+    # then clip and summarize for each basin
+    with task_scratch_dir(cfg, 'moddrfs', date_str) as dir_scratch:
+        # merge and reproject radiative forcing (forc) files
+        tif_list_forc = glob.glob("{0}/*{1}*{2}.tif".format(dir_work_moddrfs, date_dn.strftime('%Y%j'), "forcing"))
+        tif_out_forc = dir_scratch + 'MOD09GA_' + date_str + '_{0}_forc.tif'
 
-    # merge and reproject grain size files (grnsz)
-    tif_list_grnsz = glob.glob("{0}/*{1}*{2}.tif".format(dir_work_moddrfs, date_dn.strftime('%Y%j'), "drfs.grnsz"))
-    tif_out_grnsz = 'data\working\moddrfs\MOD09GA_' + date_str + '_{0}_grnsz.tif'
+        try:
+            rasterio_raster_merge(tif_list_forc, tif_out_forc.format("ext"))
+            logger.info("org_moddrfs: merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'forcing'))
+        except:
+            logger.error("org_moddrfs: error merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'forcing'))
+        try:
+            rasterio_raster_reproject(tif_out_forc.format("ext"), tif_out_forc.format(proj_str), cfg.proj, nodata=2500)
+            logger.info("org_moddrfs: reprojecting {} to {}".format('forcing', date_dn.strftime('%Y-%m-%d')))
+        except:
+            logger.error("org_moddrfs: error reprojecting {} to {}".format(tif_out_forc.format("ext"), tif_out_forc.format(proj_str), cfg.proj))
 
-    try:
-        rasterio_raster_merge(tif_list_grnsz, tif_out_grnsz.format("ext"))
-        logger.info("org_moddrfs: merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'drfs.grnsz'))
-    except:
-        logger.error("org_moddrfs: error merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'drfs.grnsz'))
-    try:
-        rasterio_raster_reproject(tif_out_grnsz.format("ext"), tif_out_grnsz.format(proj_str), cfg.proj, nodata=2500)
-        logger.info("org_moddrfs: reprojecting {} to {}".format('drfs.grnsz', date_dn.strftime('%Y-%m-%d')))
-    except:
-        logger.error("org_moddrfs: error reprojecting {} to {}".format(tif_out_grnsz.format("ext"), tif_out_grnsz.format(proj_str), cfg.proj))
+        # merge and reproject grain size files (grnsz)
+        tif_list_grnsz = glob.glob("{0}/*{1}*{2}.tif".format(dir_work_moddrfs, date_dn.strftime('%Y%j'), "drfs.grnsz"))
+        tif_out_grnsz = dir_scratch + 'MOD09GA_' + date_str + '_{0}_grnsz.tif'
+
+        try:
+            rasterio_raster_merge(tif_list_grnsz, tif_out_grnsz.format("ext"))
+            logger.info("org_moddrfs: merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'drfs.grnsz'))
+        except:
+            logger.error("org_moddrfs: error merging {} {} tiles".format(date_dn.strftime('%Y-%m-%d'), 'drfs.grnsz'))
+        try:
+            rasterio_raster_reproject(tif_out_grnsz.format("ext"), tif_out_grnsz.format(proj_str), cfg.proj, nodata=2500)
+            logger.info("org_moddrfs: reprojecting {} to {}".format('drfs.grnsz', date_dn.strftime('%Y-%m-%d')))
+        except:
+            logger.error("org_moddrfs: error reprojecting {} to {}".format(tif_out_grnsz.format("ext"), tif_out_grnsz.format(proj_str), cfg.proj))
+
+        # clip, mask, and compute zonal statistics for each basin
+        for basin_cfg in cfg.basin_cfgs:
+            agg_moddrfs(basin_cfg, date_dn, dir_scratch)
+
+    # clean up working directory, files for other dates may still be
+    # waiting to be organized
+    for file in os.listdir(dir_work_moddrfs):
+        if date_str not in file and date_dn.strftime('%Y%j') not in file:
+            continue
+        file_path = dir_work_moddrfs + file
+        try:
+            os.remove(file_path)
+            logger.info("org_moddrfs: removing {}".format(file_path))
+        except:
+            logger.error("org_moddrfs: error removing {}".format(file_path))
+
+def agg_moddrfs(cfg, date_dn, dir_scratch):
+    """Clip, mask, and compute zonal statistics of moddrfs for a basin
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object for the basin
+        date_dn: datetime
+            date
+        dir_scratch: string
+            scratch directory with merged and reprojected moddrfs geotifs
+
+    Returns
+    -------
+        None
+
+    Notes
+    -----
+    called from 'org_moddrfs'
+
+    """
+
+    date_str = str(date_dn.strftime('%Y%m%d'))
+    chr_rm = [":"]
+    proj_str = ''.join(i for i in cfg.proj if not i in chr_rm)
+    basin_str = os.path.splitext(os.path.basename(cfg.basin_poly_path))[0]
 
     # clip to basin polygon (forc)
-    tif_list = glob.glob("{0}/*{1}*{2}*{3}.tif".format(dir_work_moddrfs, date_str, proj_str, "forc"))
+    tif_list = glob.glob("{0}/*{1}*{2}*{3}.tif".format(dir_scratch, date_str, proj_str, "forc"))
     for tif in tif_list:
-        tif_out = dir_work_moddrfs + "moddrfs_forc_" + date_str + "_" + basin_str + ".tif"
+        tif_out = dir_scratch + "moddrfs_forc_" + date_str + "_" + basin_str + ".tif"
         try:
             gdal_raster_clip(cfg.basin_poly_path, tif, tif_out, cfg.proj, cfg.proj, 2500)
-            logger.info("org_moddrfs: clipping {} to {}".format(tif, tif_out))
+            logger.info("agg_moddrfs: clipping {} to {}".format(tif, tif_out))
         except:
-            logger.error("org_moddrfs: error clipping {} to {}".format(tif, tif_out))
+            logger.error("agg_moddrfs: error clipping {} to {}".format(tif, tif_out))
     if not tif_list:
-        logger.error("org_moddrfs: error finding tifs to clip")
+        logger.error("agg_moddrfs: error finding tifs to clip")
 
     # clip to basin polygon (grnsz)
-    tif_list = glob.glob("{0}/*{1}*{2}*{3}.tif".format(dir_work_moddrfs, date_str, proj_str, "grnsz"))
+    tif_list = glob.glob("{0}/*{1}*{2}*{3}.tif".format(dir_scratch, date_str, proj_str, "grnsz"))
     for tif in tif_list:
-        tif_out = dir_work_moddrfs + "moddrfs_grnsz_" + date_str + "_" + basin_str + ".tif"
+        tif_out = dir_scratch + "moddrfs_grnsz_" + date_str + "_" + basin_str + ".tif"
         try:
             gdal_raster_clip(cfg.basin_poly_path, tif, tif_out, cfg.proj, cfg.proj, 2500)
-            logger.info("org_moddrfs: clipping {} to {}".format(tif, tif_out))
+            logger.info("agg_moddrfs: clipping {} to {}".format(tif, tif_out))
         except:
-            logger.error("org_moddrfs: error clipping {} to {}".format(tif, tif_out))
+            logger.error("agg_moddrfs: error clipping {} to {}".format(tif, tif_out))
     if not tif_list:
-        logger.error("org_moddrfs: error finding tifs to clip")
+        logger.error("agg_moddrfs: error finding tifs to clip")
 
     # set filenames
     file_forc = "moddrfs_forc_" + date_str + "_" + basin_str + ".tif"
     file_grnsz = "moddrfs_grnsz_" + date_str + "_" + basin_str + ".tif"
 
     # open connection to rasters
-    rast_forc = rasterio.open(dir_work_moddrfs + file_forc)
-    rast_grnsz = rasterio.open(dir_work_moddrfs + file_grnsz)
+    rast_forc = rasterio.open(dir_scratch + file_forc)
+    rast_grnsz = rasterio.open(dir_scratch + file_grnsz)
 
     # read in raster data to np array
     forc = rast_forc.read(1)
@@ -1805,30 +2703,30 @@ def org_moddrfs(cfg, date_dn):
     rast_grnsz.close()
 
     # calculate zonal statistics and export data
-    tif_list = glob.glob("{0}/{1}*{2}*{3}*.tif".format(cfg.dir_db, 'moddrfs', date_str, basin_str))
+    tif_list = glob.glob("{0}/{1}_*_{2}_{3}.tif".format(cfg.dir_db, 'moddrfs', date_str, basin_str))
     for tif in tif_list:
         file_meta = os.path.basename(tif).replace('.', '_').split('_')
         if 'poly' in cfg.output_type:
             try:
                 tif_stats = zonal_stats(cfg.basin_poly_path, tif, stats=['median', 'mean'], all_touched=True)
                 tif_stats_df = pd.DataFrame(tif_stats)
-                logger.info("org_moddrfs: computing zonal statistics")
+                logger.info("agg_moddrfs: computing zonal statistics")
             except:
-                logger.error("org_moddrfs: error computing poly zonal statistics")
+                logger.error("agg_moddrfs: error computing poly zonal statistics")
             try:
                 frames = [cfg.basin_poly, tif_stats_df]
                 basin_poly_stats = pd.concat(frames, axis=1)
-                logger.info("org_moddrfs: merging poly zonal statistics")
+                logger.info("agg_moddrfs: merging poly zonal statistics")
             except:
-                logger.error("org_moddrfs: error merging zonal statistics")
+                logger.error("agg_moddrfs: error merging zonal statistics")
 
             if 'geojson' in cfg.output_format:
                 try:
                     geojson_out = os.path.splitext(tif)[0] + "_poly.geojson"
                     basin_poly_stats.to_file(geojson_out, driver='GeoJSON')
-                    logger.info("org_moddrfs: writing {0}".format(geojson_out))
+                    logger.info("agg_moddrfs: writing {0}".format(geojson_out))
                 except:
-                    logger.error("org_moddrfs: error writing {0}".format(geojson_out))
+                    logger.error("agg_moddrfs: error writing {0}".format(geojson_out))
             if 'csv' in cfg.output_format:
                 try:
                     csv_out = os.path.splitext(tif)[0] + "_poly.csv"
@@ -1837,23 +2735,23 @@ def org_moddrfs(cfg, date_dn):
                     basin_poly_stats_df.insert(0, 'Type', file_meta[1])
                     basin_poly_stats_df.insert(0, 'Date', dt.datetime.strptime(file_meta[2], '%Y%m%d').strftime('%Y-%m-%d %H:%M'))
                     basin_poly_stats_df.to_csv(csv_out, index=False)
-                    logger.info("org_moddrfs: writing {0}".format(csv_out))
+                    logger.info("agg_moddrfs: writing {0}".format(csv_out))
                 except:
-                    logger.error("org_moddrfs: error writing {0}".format(csv_out))
+                    logger.error("agg_moddrfs: error writing {0}".format(csv_out))
 
         if 'points' in cfg.output_type:
             try:
                 tif_stats = zonal_stats(cfg.basin_points_path, tif, stats=['median', 'mean'], all_touched=True)
                 tif_stats_df = pd.DataFrame(tif_stats)
-                logger.info("org_moddrfs: computing points zonal statistics")
+                logger.info("agg_moddrfs: computing points zonal statistics")
             except:
-                logger.error("org_moddrfs: error computing points zonal statistics")
+                logger.error("agg_moddrfs: error computing points zonal statistics")
             try:
                 frames = [cfg.basin_points, tif_stats_df]
                 basin_points_stats = pd.concat(frames, axis=1)
-                logger.info("org_moddrfs: merging zonal statistics")
+                logger.info("agg_moddrfs: merging zonal statistics")
             except:
-                logger.error("org_moddrfs: error merging zonal statistics")
+                logger.error("agg_moddrfs: error merging zonal statistics")
             if 'geojson' in cfg.output_format:
                 try:
                     geojson_out = os.path.splitext(tif)[0] + "_points.geojson"
@@ -1869,18 +2767,9 @@ def org_moddrfs(cfg, date_dn):
                     basin_points_stats_df.insert(0, 'Type', file_meta[1])
                     basin_points_stats_df.insert(0, 'Date', dt.datetime.strptime(file_meta[2], '%Y%m%d').strftime('%Y-%m-%d %H:%M'))
                     basin_points_stats_df.to_csv(csv_out, index=False)
-                    logger.info("org_moddrfs: writing {0}".format(csv_out))
+                    logger.info("agg_moddrfs: writing {0}".format(csv_out))
                 except:
-                    logger.error("org_moddrfs: error writing {0}".format(csv_out))
-
-    # clean up working directory
-    for file in os.listdir(dir_work_moddrfs):
-        file_path = dir_work_moddrfs + file
-        try:
-            os.remove(file_path)
-            logger.info("org_moddrfs: removing {}".format(file_path))
-        except:
-            logger.error("org_moddrfs: error removing {}".format(file_path))
+                    logger.error("agg_moddrfs: error writing {0}".format(csv_out))
 
 def download_modis(cfg, date_dn):
     """ Download modis snow data
@@ -1946,25 +2835,20 @@ def download_modis(cfg, date_dn):
     url_list = url_list_aqua + url_list_terra
     print(url_list)
     if len(url_list) > 0:
-        credentials = '{0}:{1}'.format(cfg.username_earthdata, cfg.password_earthdata)
-        credentials = base64.b64encode(credentials.encode('ascii')).decode('ascii')
-
+        # granules redirect to earthdata login, the session keeps the
+        # credentials and login cookies across redirects
+        session = earthdata_session()
+        session.auth = (cfg.username_earthdata, cfg.password_earthdata)
+        engine = get_download_engine(cfg)
+        futures = []
         for index, url in enumerate(url_list, start=1):
             file_name = url.split('/')[-1]
             file_path = dir_work_d + file_name
-            try:
-                req = Request(url)
-                if credentials:
-                    req.add_header('Authorization', 'Basic {0}'.format(credentials))
-                opener = build_opener(HTTPCookieProcessor())
-                data = opener.open(req).read()
-                open(file_path, 'wb').write(data)
-            except HTTPError as e:
-                logger.info(('HTTP error {0}, {1}'.format(e.code, e.reason)))
-            except URLError as e:
-                logger.info(('URL error: {0}'.format(e.reason)))
-            except IOError:
-                raise
+            futures.append(engine.submit(url, file_path, session=session, callback=download_callback('modis')))
+        try:
+            wait_downloads(futures, 'modis')
+        finally:
+            session.close()
     else:
         logger.info("download_modis: no data found")
 
@@ -1991,19 +2875,9 @@ def batch_swann(cfg, date_list, time_int):
     # NSIDC short name for dataset
     short_name = 'NSIDC-0719'
 
-    # look at data avaiable through NSIDC archive
-    params = {
-        'short_name': short_name
-    }
-
-    cmr_collections_url = 'https://cmr.earthdata.nasa.gov/search/collections.json'
-    response = requests.get(cmr_collections_url, params=params)
-    results = json.loads(response.content)
-    # start date of archive data
-    start_date_ds = dt.datetime.strptime([el['time_start'] for el in results['feed']['entry']][0][0:10], '%Y-%m-%d')
-
-    # end date of archive data
-    end_date_ds = dt.datetime.strptime([el['time_end'] for el in results['feed']['entry']][0][0:10], '%Y-%m-%d')
+    # look at data avaiable through NSIDC archive, the collection range is
+    # kept in the availability index for a day
+    start_date_ds, end_date_ds = get_avail_index(cfg).collection_range(short_name)
 
     # build list of data available
     date_list_ds = pd.date_range(start_date_ds, end_date_ds, freq=time_int).tolist()
@@ -2038,6 +2912,14 @@ def batch_swann(cfg, date_list, time_int):
                 except:
                     logger.info("org_swann: error processing swann for '{}'".format(date_dn))
 
+            # remove water year file
+            nc_path = cfg.dir_work + 'swann/' + "4km_SWE_Depth_WY" + ("{}_v01.nc".format(year_dn))
+            try:
+                os.remove(nc_path)
+                logger.info("batch_swann: removing {}".format(nc_path))
+            except:
+                logger.error("batch_swann: error removing {}".format(nc_path))
+
     # find dates requested available in real-time
     date_list_rt = ldif(date_list_arc, date_list)
 
@@ -2098,7 +2980,9 @@ def download_swann_arc(cfg, year_dn, overwrite_flag = False):
         logger.info("download_swann_arc: downloading from {}".format(nc_url))
         logger.info("download_swann_arc: downloading to {}".format(nc_path))
         try:
-            urllib.request.urlretrieve(nc_url, nc_path)
+            resume_download(nc_url, nc_path, timeout=cfg.download_timeout, segments=cfg.download_segments,
+                            segment_min_mb=cfg.segment_min_mb, host_limit=cfg.host_limit)
+            add_download_bytes('swann', nc_path)
         except IOError as e:
             logger.error("download_swann_arc: error downloading {}".format(year_dn))
             logging.error(e)
@@ -2123,6 +3007,9 @@ def org_swann(cfg, date_dn, ftype):
     -----
     called from 'batch_swann'
 
+    Extracts and reprojects swann once, then calls 'agg_swann' for each
+    basin in 'cfg.basin_cfgs'.
+
     """
 
     year_dn = wyear_dt(date_dn)
@@ -2139,8 +3026,6 @@ def org_swann(cfg, date_dn, ftype):
     date_str = str(date_dn.strftime('%Y%m%d'))
     chr_rm = [":"]
     proj_str = ''.join(i for i in cfg.proj if not i in chr_rm)
-    dtype_out = 'float64'
-    basin_str = os.path.splitext(os.path.basename(cfg.basin_poly_path))[0]
     crs_raw = 'EPSG:4326'
 
     # open dataset with xarray
@@ -2149,40 +3034,83 @@ def org_swann(cfg, date_dn, ftype):
         swann_xr = file_nc.rio.write_crs(4326, inplace=True)
     file_nc.close()
 
-    # extract swe data for 'date_dn' and save as geotif
-    swe_swann_xr = swann_xr["SWE"].sel(
-        time=np.datetime64(date_dn))
-    swe_swann_xr_date_dn = swe_swann_xr.rio.set_spatial_dims(x_dim='lon', y_dim='lat', inplace=True)
+    # organize in a scratch directory only used by this task
+    with task_scratch_dir(cfg, 'swann', date_str) as dir_scratch:
+        # extract swe data for 'date_dn' and save as geotif
+        swe_swann_xr = swann_xr["SWE"].sel(
+            time=np.datetime64(date_dn))
+        swe_swann_xr_date_dn = swe_swann_xr.rio.set_spatial_dims(x_dim='lon', y_dim='lat', inplace=True)
 
-    swe_file_path = dir_work_swann + 'swann_swe_' + date_str + '.tif'
-    swe_swann_xr_date_dn.rio.to_raster(swe_file_path)
+        swe_file_path = dir_scratch + 'swann_swe_' + date_str + '.tif'
+        swe_swann_xr_date_dn.rio.to_raster(swe_file_path)
 
-    # extract snow depth data for 'date_dn' and save as geotif
-    sd_swann_xr = swann_xr["DEPTH"].sel(
-        time=np.datetime64(date_dn))
-    sd_swann_xr_date_dn = swe_swann_xr.rio.set_spatial_dims(x_dim='lon', y_dim='lat', inplace=True)
+        # extract snow depth data for 'date_dn' and save as geotif
+        sd_swann_xr = swann_xr["DEPTH"].sel(
+            time=np.datetime64(date_dn))
+        sd_swann_xr_date_dn = swe_swann_xr.rio.set_spatial_dims(x_dim='lon', y_dim='lat', inplace=True)
 
-    sd_file_path = dir_work_swann + 'swann_sd_' + date_str + '.tif'
-    sd_swann_xr_date_dn.rio.to_raster(sd_file_path)
+        sd_file_path = dir_scratch + 'swann_sd_' + date_str + '.tif'
+        sd_swann_xr_date_dn.rio.to_raster(sd_file_path)
 
-    # close xr dataset
-    swann_xr.close()
+        # close xr dataset
+        swann_xr.close()
 
-    # reproject geotif
-    tif_list = glob.glob("{0}/*{1}*.tif".format(dir_work_swann, date_str))
-    for tif in tif_list:
-        tif_out = os.path.splitext(tif)[0] + "_" + proj_str + ".tif"
+        # reproject geotif
+        tif_list = glob.glob("{0}/*{1}*.tif".format(dir_scratch, date_str))
+        for tif in tif_list:
+            tif_out = os.path.splitext(tif)[0] + "_" + proj_str + ".tif"
+            try:
+                gdal_raster_reproject(tif, tif_out, cfg.proj, crs_raw)
+                # rasterio_raster_reproject(tif, tif_out, cfg.proj)
+                logger.info("org_swann: reprojecting {} to {}".format(tif, tif_out))
+            except:
+                logger.error("org_swann: error reprojecting {} to {}".format(tif, tif_out))
+        if not tif_list:
+            logger.error("org_swann: error finding tifs to reproject")
+
+        # clip, convert units, and compute zonal statistics for each basin
+        for basin_cfg in cfg.basin_cfgs:
+            agg_swann(basin_cfg, date_dn, dir_scratch)
+
+    # remove real-time file, archive files hold a full water year and are
+    # removed by 'batch_swann' once all dates are organized
+    if ftype == 'rt':
         try:
-            gdal_raster_reproject(tif, tif_out, cfg.proj, crs_raw)
-            # rasterio_raster_reproject(tif, tif_out, cfg.proj)
-            logger.info("org_swann: reprojecting {} to {}".format(tif, tif_out))
+            os.remove(nc_path)
+            logger.info("org_swann: removing {}".format(nc_path))
         except:
-            logger.error("org_swann: error reprojecting {} to {}".format(tif, tif_out))
-    if not tif_list:
-        logger.error("org_swann: error finding tifs to reproject")
+            logger.error("org_swann: error removing {}".format(nc_path))
+
+def agg_swann(cfg, date_dn, dir_scratch):
+    """Clip, convert units, and compute zonal statistics of swann for a basin
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object for the basin
+        date_dn: datetime
+            date
+        dir_scratch: string
+            scratch directory with reprojected swann geotifs
+
+    Returns
+    -------
+        None
+
+    Notes
+    -----
+    called from 'org_swann'
+
+    """
+
+    date_str = str(date_dn.strftime('%Y%m%d'))
+    chr_rm = [":"]
+    proj_str = ''.join(i for i in cfg.proj if not i in chr_rm)
+    dtype_out = 'float64'
+    basin_str = os.path.splitext(os.path.basename(cfg.basin_poly_path))[0]
 
     # clip to basin polygon
-    tif_list = glob.glob("{0}/*{1}*{2}.tif".format(dir_work_swann, date_str, proj_str))
+    tif_list = glob.glob("{0}/*{1}*{2}.tif".format(dir_scratch, date_str, proj_str))
     for tif in tif_list:
         tif_out = os.path.splitext(tif)[0] + "_" + basin_str + ".tif"
         try:
@@ -2199,7 +3127,7 @@ def org_swann(cfg, date_dn, ftype):
     if cfg.unit_sys == 'metric':
         calc_exp = '(read 1)' # keep units in mm
     # SWE
-    tif_list = glob.glob("{0}/*{1}*{2}*{3}*{4}.tif".format(dir_work_swann, 'swann_swe', date_str, proj_str, basin_str))
+    tif_list = glob.glob("{0}/*{1}*{2}*{3}_{4}.tif".format(dir_scratch, 'swann_swe', date_str, proj_str, basin_str))
 
     for tif in tif_list:
         tif_int = os.path.splitext(tif)[0] + "_" + dtype_out + ".tif"
@@ -2214,7 +3142,7 @@ def org_swann(cfg, date_dn, ftype):
         logger.error("org_swann: error finding tifs to calc")
 
     # Snow Depth
-    tif_list = glob.glob("{0}/*{1}*{2}*{3}*{4}.tif".format(dir_work_swann, 'swann_sd', date_str, proj_str, basin_str))
+    tif_list = glob.glob("{0}/*{1}*{2}*{3}_{4}.tif".format(dir_scratch, 'swann_sd', date_str, proj_str, basin_str))
 
     for tif in tif_list:
         tif_int = os.path.splitext(tif)[0] + "_" + dtype_out + ".tif"
@@ -2229,7 +3157,7 @@ def org_swann(cfg, date_dn, ftype):
         logger.error("org_swann: error finding tifs to calc")
 
     # calculate zonal statistics and export data
-    tif_list = glob.glob("{0}/{1}*{2}*{3}*{4}.tif".format(cfg.dir_db, 'swann', date_str, basin_str, cfg.unit_sys))
+    tif_list = glob.glob("{0}/{1}_*_{2}_{3}_{4}.tif".format(cfg.dir_db, 'swann', date_str, basin_str, cfg.unit_sys))
 
     for tif in tif_list:
         file_meta = os.path.basename(tif).replace('.', '_').split('_')
@@ -2299,15 +3227,6 @@ def org_swann(cfg, date_dn, ftype):
                 except:
                     logger.error("org_swann: error writing {0}".format(csv_out))
 
-    # clean up working directory
-    for file in os.listdir(dir_work_swann):
-        file_path = dir_work_swann + file
-        try:
-            os.remove(file_path)
-            logger.info("org_swann: removing {}".format(file_path))
-        except:
-            logger.error("org_swann: error removing {}".format(file_path))
-
 def download_swann_rt(cfg, year_dn):
     """ Download SWANN snow data from UA real-time
 
@@ -2345,11 +3264,8 @@ def download_swann_rt(cfg, year_dn):
         logger.info("download_swann_rt: downloading {}".format(date_dn.strftime('%Y-%m-%d')))
         logger.info("download_swann_rt: downloading from {}".format(nc_url))
         logger.info("download_swann_rt: downloading to {}".format(nc_path))
-        try:
-            urllib.request.urlretrieve(nc_url, nc_path)
-        except IOError as e:
-            logger.error("download_swann_rt: error downloading {}".format(date_dn.strftime('%Y-%m-%d')))
-            logging.error(e)
+        future = get_download_engine(cfg).submit(nc_url, nc_path, callback=download_callback('swann'))
+        wait([future])
 
 
 def download_ndfd(parameter, flen, crs_out, cfg, overwrite_flag=False):
@@ -2375,18 +3291,10 @@ def download_ndfd(parameter, flen, crs_out, cfg, overwrite_flag=False):
     -----
     function can only download latest forecast
     only valid right now for CONUS
-    """
 
-    dir_work_ndfd = cfg.dir_work + 'ndfd/'
-    
-    # create working directory if it doesn't exist
-    if os.path.isdir(dir_work_ndfd)==False:
-        print(dir_work_ndfd)
-        os.mkdir(dir_work_ndfd)
-    basin_str = os.path.splitext(os.path.basename(cfg.basin_poly_path))[0]
-    chr_rm = [":"]
-    proj_str = ''.join(i for i in crs_out if not i in chr_rm)
-    dtype_out = 'float64'
+    Reprojects each forecast once, then calls 'agg_ndfd' for each basin in
+    'cfg.basin_cfgs'.
+    """
 
     # retrieve data for forecast length desired
     # forecasts are stored in three files:
@@ -2406,251 +3314,4000 @@ def download_ndfd(parameter, flen, crs_out, cfg, overwrite_flag=False):
     if parameter == 'qpf'or parameter == 'snow':
         iflen = 1
 
-    for i in range(0,iflen):
-        grib_name_url = 'ds.' + parameter + '.bin'
-        grib_name_path = parameter + '_' + flen_dirs[i] + '.bin'
-        grib_url = cfg.host_ndfd + flen_dirs[i] + '/' + grib_name_url
-        grib_path = dir_work_ndfd + grib_name_path
-
-        if os.path.isfile(grib_path) and overwrite_flag:
-            os.remove(grib_path)
-
-        if not os.path.isfile(grib_path):
-            logger.info("download_ndfd: downloading from {}".format(grib_url))
-            logger.info("download_ndfd: downloading to {}".format(grib_path))
-            try:
-                urllib.request.urlretrieve(grib_url, grib_path)
-            except IOError as e:
-                logger.error("download_ndfd: error downloading")
-                logging.error(e)
-        # read grib with pygrib to get message info
-        grbs = pygrib.open(grib_path)
-         # read first message to get forcast init time
-        grb = grbs[1]
-        date_init_str = str(grb).split('from ',1)[1].split(':',1)[0]
-        date_init = dt.datetime.strptime(date_init_str, '%Y%m%d%H%M')
-
-
-        # read grib as raster; reproject, write out individual forecast tifs,
-        # clip data
-        tif_out_head = dir_work_ndfd + parameter + '_' + date_init_str + '_'
-        with rasterio.open(grib_path) as src:
-            transform, width, height = calculate_default_transform(
-                src.crs, crs_out, src.width, src.height, *src.bounds)
-            kwargs = src.meta.copy()
-            kwargs.update({
-                'crs': crs_out,
-                'transform': transform,
-                'width': width,
-                'height': height,
-                'count': 1
-            })
+    # download and organize in a scratch directory only used by this task
+    with task_scratch_dir(cfg, 'ndfd', parameter) as dir_scratch:
+        for i in range(0,iflen):
+            grib_name_url = 'ds.' + parameter + '.bin'
+            grib_name_path = parameter + '_' + flen_dirs[i] + '.bin'
+            grib_url = cfg.host_ndfd + flen_dirs[i] + '/' + grib_name_url
+            grib_path = dir_scratch + grib_name_path
+
+            if os.path.isfile(grib_path) and overwrite_flag:
+                os.remove(grib_path)
+
+            if not os.path.isfile(grib_path):
+                logger.info("download_ndfd: downloading from {}".format(grib_url))
+                logger.info("download_ndfd: downloading to {}".format(grib_path))
+                # partial files are kept outside the task scratch directory so
+                # a retried task resumes them, see 'resume_download'
+                def download_grib(url, path):
+                    resume_download(url, path, timeout=cfg.download_timeout,
+                                    segments=cfg.download_segments, segment_min_mb=cfg.segment_min_mb,
+                                    dir_part=cfg.dir_work + 'ndfd_part/', host_limit=cfg.host_limit)
+                try:
+                    # forecasts are replaced at the same url, revalidate cached copies
+                    hit = get_download_cache(cfg).fetch(grib_url, grib_path, download_grib, mutable=True,
+                                                        refresh=overwrite_flag)
+                    if not hit:
+                        add_download_bytes('ndfd', grib_path)
+                except IOError as e:
+                    logger.error("download_ndfd: error downloading")
+                    logging.error(e)
+            # read grib with pygrib to get message info
+            grbs = pygrib.open(grib_path)
+             # read first message to get forcast init time
+            grb = grbs[1]
+            date_init_str = str(grb).split('from ',1)[1].split(':',1)[0]
+            date_init = dt.datetime.strptime(date_init_str, '%Y%m%d%H%M')
+
+
+            # read grib as raster; reproject, write out individual forecast tifs,
+            # clip data
+            tif_out_head = dir_scratch + parameter + '_' + date_init_str + '_'
+            with rasterio.open(grib_path) as src:
+                transform, width, height = calculate_default_transform(
+                    src.crs, crs_out, src.width, src.height, *src.bounds)
+                kwargs = src.meta.copy()
+                kwargs.update({
+                    'crs': crs_out,
+                    'transform': transform,
+                    'width': width,
+                    'height': height,
+                    'count': 1
+                })
 
-            for bnd in range(1, src.count + 1):
-                grb = grbs[bnd]
+                for bnd in range(1, src.count + 1):
+                    grb = grbs[bnd]
 
-                # read valid date from grb message
-                valid_date_str = dt.datetime.strftime(grb.validDate, '%Y%m%d%H%M')
-                tif_out_band = tif_out_head + valid_date_str + '.tif'
-                with rasterio.open(tif_out_band, 'w', **kwargs) as dst:
-                    reproject(
-                        source=rasterio.band(src, bnd),
-                        destination=rasterio.band(dst, 1),
-                        src_transform=src.transform,
-                        src_crs=src.crs,
-                        dst_transform=transform,
-                        dst_crs=crs_out,
-                        resampling=Resampling.nearest)
-        grbs.close()
+                    # read valid date from grb message
+                    valid_date_str = dt.datetime.strftime(grb.validDate, '%Y%m%d%H%M')
+                    tif_out_band = tif_out_head + valid_date_str + '.tif'
+                    with rasterio.open(tif_out_band, 'w', **kwargs) as dst:
+                        reproject(
+                            source=rasterio.band(src, bnd),
+                            destination=rasterio.band(dst, 1),
+                            src_transform=src.transform,
+                            src_crs=src.crs,
+                            dst_transform=transform,
+                            dst_crs=crs_out,
+                            resampling=Resampling.nearest)
+            grbs.close()
 
-        # clip to basin polygon
-        tif_list = glob.glob("{0}/*{1}*{2}*.tif".format(dir_work_ndfd, parameter, date_init_str))
-        for tif in tif_list:
-            date_valid_str = tif.split("_")[2].split(".")[0]
-            tif_out = dir_work_ndfd + "ndfd_" + parameter + "_" + date_init_str + "_" + date_valid_str + "_" + basin_str + ".tif"
-            try:
-                gdal_raster_clip(cfg.basin_poly_path, tif, tif_out, crs_out, crs_out, -9999)
-                logger.info("download_ndfd: clipping {} to {}".format(tif, tif_out))
-            except:
-                logger.error("download_ndfd: error clipping {} to {}".format(tif, tif_out))
-        if not tif_list:
-            logger.error("download_ndfd: error finding tifs to clip")
-
-        # convert units
-        tif_list = glob.glob("{0}/*{1}*{2}*{3}*.tif".format(dir_work_ndfd, 'ndfd', parameter, date_init_str))
-        ct_flag = False
-        # mm to inches conversion
-        if parameter == 'snow':
-            if cfg.unit_sys == 'english':
-                calc_exp = '(* 39.3701 (read 1))' # inches
-            if cfg.unit_sys == 'metric':
-                calc_exp = '(/ 1000 (read 1))' # mm
-                
-        if parameter == "qpf":
-            if cfg.unit_sys == 'english':
-                calc_exp = '(* 0.04 (read 1))' # convert from kg/m2 to inches of water
-            if cfg.unit_sys == 'metric':
-                calc_exp = '(read 1)' # keep units in percentage
-                
-        if (parameter == 'pop12') or (parameter == "sky") or (parameter == "rhm"):
-            if cfg.unit_sys == 'english':
-                calc_exp = '(read 1)' # keep units in percentage
-            if cfg.unit_sys == 'metric':
-                calc_exp = '(read 1)' # keep units in percentage
-
-        # c to f conversion
-        if parameter == 'mint' or parameter == 'maxt':
-            if cfg.unit_sys == 'english':
-                ct_flag = True
-                calc_exp = '(* 1.8 (read 1))' # deg. F (mult)
-                calc_exp2 = '(+ 32 (read 1))' # deg. F (add)
-
-            if cfg.unit_sys == 'metric':
-                calc_exp = '(read 1)' # keep units in deg. C
-
-        tif_list = glob.glob("{0}/*{1}*{2}*{3}*{4}*.tif".format(dir_work_ndfd, 'ndfd', parameter, date_init_str, basin_str))
+            # clip, convert units, and compute zonal statistics for each basin
+            for basin_cfg in cfg.basin_cfgs:
+                agg_ndfd(basin_cfg, parameter, date_init_str, dir_scratch)
 
-        for tif in tif_list:
-            tif_int = os.path.splitext(tif)[0] + "_" + dtype_out + ".tif"
+            # save grib file for archiving - currently saved to the database directory with init date appended to filename
+            grib_db = cfg.dir_db + os.path.splitext(os.path.basename(grib_path))[0] + '_' + date_init_str + '.bin'
+            shutil.move(grib_path, grib_db)
+            get_download_cache(cfg).moved(grib_path, grib_db)
+
+            # clean up working directory
+            for file in os.listdir(dir_scratch):
+                file_path = dir_scratch + file
+                try:
+                    os.remove(file_path)
+                    logger.info("download_ndfd: removing {}".format(file_path))
+                except:
+                    logger.error("download_ndfd: error removing {}".format(file_path))
+
+def agg_ndfd(cfg, parameter, date_init_str, dir_scratch):
+    """Clip, convert units, and compute zonal statistics of ndfd for a basin
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object for the basin
+        parameter: string
+            ndfd parameter
+        date_init_str: string
+            forecast init time in '%Y%m%d%H%M' format
+        dir_scratch: string
+            scratch directory with reprojected ndfd geotifs
+
+    Returns
+    -------
+        None
+
+    Notes
+    -----
+    called from 'download_ndfd'
+
+    """
+
+    basin_str = os.path.splitext(os.path.basename(cfg.basin_poly_path))[0]
+    dtype_out = 'float64'
+
+    # clip to basin polygon
+    tif_list = glob.glob("{0}/{1}_{2}_*.tif".format(dir_scratch, parameter, date_init_str))
+    for tif in tif_list:
+        date_valid_str = os.path.basename(tif).split("_")[2].split(".")[0]
+        tif_out = dir_scratch + "ndfd_" + parameter + "_" + date_init_str + "_" + date_valid_str + "_" + basin_str + ".tif"
+        try:
+            gdal_raster_clip(cfg.basin_poly_path, tif, tif_out, cfg.proj, cfg.proj, -9999)
+            logger.info("download_ndfd: clipping {} to {}".format(tif, tif_out))
+        except:
+            logger.error("download_ndfd: error clipping {} to {}".format(tif, tif_out))
+    if not tif_list:
+        logger.error("download_ndfd: error finding tifs to clip")
+
+    # convert units
+    ct_flag = False
+    # mm to inches conversion
+    if parameter == 'snow':
+        if cfg.unit_sys == 'english':
+            calc_exp = '(* 39.3701 (read 1))' # inches
+        if cfg.unit_sys == 'metric':
+            calc_exp = '(/ 1000 (read 1))' # mm
+        
+    if parameter == "qpf":
+        if cfg.unit_sys == 'english':
+            calc_exp = '(* 0.04 (read 1))' # convert from kg/m2 to inches of water
+        if cfg.unit_sys == 'metric':
+            calc_exp = '(read 1)' # keep units in percentage
+        
+    if (parameter == 'pop12') or (parameter == "sky") or (parameter == "rhm"):
+        if cfg.unit_sys == 'english':
+            calc_exp = '(read 1)' # keep units in percentage
+        if cfg.unit_sys == 'metric':
+            calc_exp = '(read 1)' # keep units in percentage
+
+    # c to f conversion
+    if parameter == 'mint' or parameter == 'maxt':
+        if cfg.unit_sys == 'english':
+            ct_flag = True
+            calc_exp = '(* 1.8 (read 1))' # deg. F (mult)
+            calc_exp2 = '(+ 32 (read 1))' # deg. F (add)
+
+        if cfg.unit_sys == 'metric':
+            calc_exp = '(read 1)' # keep units in deg. C
+
+    tif_list = glob.glob("{0}/{1}_{2}_{3}_*_{4}.tif".format(dir_scratch, 'ndfd', parameter, date_init_str, basin_str))
+
+    for tif in tif_list:
+        tif_int = os.path.splitext(tif)[0] + "_" + dtype_out + ".tif"
+        if ct_flag == True:
+            tif_int2 = os.path.splitext(tif)[0] + "_mult" + ".tif"
+        tif_out = cfg.dir_db + os.path.splitext(os.path.basename(tif))[0] + "_" + cfg.unit_sys + ".tif"
+        try:
+            rio_dtype_conversion(tif, tif_int, dtype_out)
             if ct_flag == True:
-                tif_int2 = os.path.splitext(tif)[0] + "_mult" + ".tif"
-            tif_out = cfg.dir_db + os.path.splitext(os.path.basename(tif))[0] + "_" + cfg.unit_sys + ".tif"
-            try:
-                rio_dtype_conversion(tif, tif_int, dtype_out)
-                if ct_flag == True:
-                    rio_calc(tif_int, tif_int2, calc_exp)
-                    rio_calc(tif_int2, tif_out, calc_exp2)
-                if ct_flag == False:
-                    rio_calc(tif_int, tif_out, calc_exp)
-                logger.info("download_ndfd: calc {} {} to {}".format(calc_exp, tif, tif_out))
-            except:
-                logger.error("download_ndfd: error calc {} to {}".format(tif, tif_out))
-        if not tif_list:
-            logger.error("download_ndfd: error finding tifs to calc")
+                rio_calc(tif_int, tif_int2, calc_exp)
+                rio_calc(tif_int2, tif_out, calc_exp2)
+            if ct_flag == False:
+                rio_calc(tif_int, tif_out, calc_exp)
+            logger.info("download_ndfd: calc {} {} to {}".format(calc_exp, tif, tif_out))
+        except:
+            logger.error("download_ndfd: error calc {} to {}".format(tif, tif_out))
+    if not tif_list:
+        logger.error("download_ndfd: error finding tifs to calc")
 
-        # end of iflen loop
-        # save grib file for archiving - currently saved to the database directory with init date appended to filename
-        shutil.move(grib_path, cfg.dir_db + os.path.splitext(os.path.basename(grib_path))[0] + '_' + date_init_str + '.bin')
+    # calculate zonal statistics and export data
+    tif_list = glob.glob("{0}/{1}_{2}_{3}_*_{4}_{5}.tif".format(cfg.dir_db, 'ndfd', parameter, date_init_str, basin_str, cfg.unit_sys))
 
-        # calculate zonal statistics and export data
-        tif_list = glob.glob("{0}/{1}*{2}*{3}*{4}*{5}.tif".format(cfg.dir_db, 'ndfd', parameter, date_init_str, basin_str, cfg.unit_sys))
+    for tif in tif_list:
+        file_meta = os.path.basename(tif).replace('.', '_').split('_')
 
-        for tif in tif_list:
-            file_meta = os.path.basename(tif).replace('.', '_').split('_')
+        if 'poly' in cfg.output_type:
+            try:
+                tif_stats = zonal_stats(cfg.basin_poly_path, tif, stats=['min', 'max', 'median', 'mean'], all_touched=True)
+                tif_stats_df = pd.DataFrame(tif_stats)
+                logger.info("download_ndfd: computing zonal statistics")
+            except:
+                logger.error("download_ndfd: error computing poly zonal statistics")
+            try:
+                frames = [cfg.basin_poly, tif_stats_df]
+                basin_poly_stats = pd.concat(frames, axis=1)
+                logger.info("download_ndfd: merging poly zonal statistics")
+            except:
+                logger.error("download_ndfd: error merging zonal statistics")
 
-            if 'poly' in cfg.output_type:
+            if 'geojson' in cfg.output_format:
                 try:
-                    tif_stats = zonal_stats(cfg.basin_poly_path, tif, stats=['min', 'max', 'median', 'mean'], all_touched=True)
-                    tif_stats_df = pd.DataFrame(tif_stats)
-                    logger.info("download_ndfd: computing zonal statistics")
+                    geojson_out = os.path.splitext(tif)[0] + "_poly.geojson"
+                    basin_poly_stats.to_file(geojson_out, driver='GeoJSON')
+                    logger.info("download_ndfd: writing {0}".format(geojson_out))
                 except:
-                    logger.error("download_ndfd: error computing poly zonal statistics")
+                    logger.error("download_ndfd: error writing {0}".format(geojson_out))
+            if 'csv' in cfg.output_format:
                 try:
-                    frames = [cfg.basin_poly, tif_stats_df]
-                    basin_poly_stats = pd.concat(frames, axis=1)
-                    logger.info("download_ndfd: merging poly zonal statistics")
+                    csv_out = os.path.splitext(tif)[0] + "_poly.csv"
+                    basin_poly_stats_df = pd.DataFrame(basin_poly_stats.drop(columns = 'geometry'))
+                    basin_poly_stats_df.insert(0, 'Source', file_meta[0])
+                    basin_poly_stats_df.insert(0, 'Type', file_meta[1])
+                    basin_poly_stats_df.insert(0, 'Date_Init', dt.datetime.strptime(file_meta[2], '%Y%m%d%H%M').strftime('%Y-%m-%d %H:%M'))
+                    basin_poly_stats_df.insert(0, 'Date_Valid', dt.datetime.strptime(file_meta[3], '%Y%m%d%H%M').strftime('%Y-%m-%d %H:%M'))
+                    basin_poly_stats_df.to_csv(csv_out, index=False)
+                    logger.info("download_ndfd: writing {0}".format(csv_out))
                 except:
-                    logger.error("download_ndfd: error merging zonal statistics")
+                    logger.error("download_ndfd: error writing {0}".format(csv_out))
 
-                if 'geojson' in cfg.output_format:
-                    try:
-                        geojson_out = os.path.splitext(tif)[0] + "_poly.geojson"
-                        basin_poly_stats.to_file(geojson_out, driver='GeoJSON')
-                        logger.info("download_ndfd: writing {0}".format(geojson_out))
-                    except:
-                        logger.error("download_ndfd: error writing {0}".format(geojson_out))
-                if 'csv' in cfg.output_format:
-                    try:
-                        csv_out = os.path.splitext(tif)[0] + "_poly.csv"
-                        basin_poly_stats_df = pd.DataFrame(basin_poly_stats.drop(columns = 'geometry'))
-                        basin_poly_stats_df.insert(0, 'Source', file_meta[0])
-                        basin_poly_stats_df.insert(0, 'Type', file_meta[1])
-                        basin_poly_stats_df.insert(0, 'Date_Init', dt.datetime.strptime(file_meta[2], '%Y%m%d%H%M').strftime('%Y-%m-%d %H:%M'))
-                        basin_poly_stats_df.insert(0, 'Date_Valid', dt.datetime.strptime(file_meta[3], '%Y%m%d%H%M').strftime('%Y-%m-%d %H:%M'))
-                        basin_poly_stats_df.to_csv(csv_out, index=False)
-                        logger.info("download_ndfd: writing {0}".format(csv_out))
-                    except:
-                        logger.error("download_ndfd: error writing {0}".format(csv_out))
-
-            if 'points' in cfg.output_type:
+        if 'points' in cfg.output_type:
+            try:
+                tif_stats = zonal_stats(cfg.basin_points_path, tif, stats=['min', 'max', 'median', 'mean'], all_touched=True)
+                tif_stats_df = pd.DataFrame(tif_stats)
+                logger.info("download_ndfd: computing points zonal statistics")
+            except:
+                logger.error("download_ndfd: error computing points zonal statistics")
+            try:
+                frames = [cfg.basin_points, tif_stats_df]
+                basin_points_stats = pd.concat(frames, axis=1)
+                logger.info("download_ndfd: merging zonal statistics")
+            except:
+                logger.error("download_ndfd: error merging zonal statistics")
+            if 'geojson' in cfg.output_format:
                 try:
-                    tif_stats = zonal_stats(cfg.basin_points_path, tif, stats=['min', 'max', 'median', 'mean'], all_touched=True)
-                    tif_stats_df = pd.DataFrame(tif_stats)
-                    logger.info("download_ndfd: computing points zonal statistics")
+                    geojson_out = os.path.splitext(tif)[0] + "_points.geojson"
+                    basin_points_stats.to_file(geojson_out, driver='GeoJSON')
+                    logger.info("download_ndfd: writing {0}".format(geojson_out))
                 except:
-                    logger.error("download_ndfd: error computing points zonal statistics")
+                    logger.error("download_ndfd: error writing {0}".format(geojson_out))
+            if 'csv' in cfg.output_format:
                 try:
-                    frames = [cfg.basin_points, tif_stats_df]
-                    basin_points_stats = pd.concat(frames, axis=1)
-                    logger.info("download_ndfd: merging zonal statistics")
+                    csv_out = os.path.splitext(tif)[0] + "_points.csv"
+                    basin_points_stats_df = pd.DataFrame(basin_points_stats.drop(columns = 'geometry'))
+                    basin_points_stats_df.insert(0, 'Source', file_meta[0])
+                    basin_points_stats_df.insert(0, 'Type', file_meta[1])
+                    basin_points_stats_df.insert(0, 'Date_Init', dt.datetime.strptime(file_meta[2], '%Y%m%d%H%M').strftime('%Y-%m-%d %H:%M'))
+                    basin_points_stats_df.insert(0, 'Date_Valid', dt.datetime.strptime(file_meta[3], '%Y%m%d%H%M').strftime('%Y-%m-%d %H:%M'))
+                    basin_points_stats_df.to_csv(csv_out, index=False)
+                    logger.info("download_ndfd: writing {0}".format(csv_out, index=False))
                 except:
-                    logger.error("download_ndfd: error merging zonal statistics")
-                if 'geojson' in cfg.output_format:
-                    try:
-                        geojson_out = os.path.splitext(tif)[0] + "_points.geojson"
-                        basin_points_stats.to_file(geojson_out, driver='GeoJSON')
-                        logger.info("download_ndfd: writing {0}".format(geojson_out))
-                    except:
-                        logger.error("download_ndfd: error writing {0}".format(geojson_out))
-                if 'csv' in cfg.output_format:
-                    try:
-                        csv_out = os.path.splitext(tif)[0] + "_points.csv"
-                        basin_points_stats_df = pd.DataFrame(basin_points_stats.drop(columns = 'geometry'))
-                        basin_points_stats_df.insert(0, 'Source', file_meta[0])
-                        basin_points_stats_df.insert(0, 'Type', file_meta[1])
-                        basin_points_stats_df.insert(0, 'Date_Init', dt.datetime.strptime(file_meta[2], '%Y%m%d%H%M').strftime('%Y-%m-%d %H:%M'))
-                        basin_points_stats_df.insert(0, 'Date_Valid', dt.datetime.strptime(file_meta[3], '%Y%m%d%H%M').strftime('%Y-%m-%d %H:%M'))
-                        basin_points_stats_df.to_csv(csv_out, index=False)
-                        logger.info("download_ndfd: writing {0}".format(csv_out, index=False))
-                    except:
-                        logger.error("download_ndfd: error writing {0}".format(csv_out))
-
-        # clean up working directory
-        for file in os.listdir(dir_work_ndfd):
-            file_path = dir_work_ndfd + file
-            try:
-                os.remove(file_path)
-                logger.info("download_ndfd: removing {}".format(file_path))
-            except:
-                logger.error("download_ndfd: error removing {}".format(file_path))
-
+                    logger.error("download_ndfd: error writing {0}".format(csv_out))
 
+# bytes read from the network at a time, see 'stream_to_file'
+download_chunk_bytes = 1024**2
 
+def stream_to_file(chunks, path, expected_size = None, expected_sha256 = None, deadline = None, url = None):
+    """Write a stream of chunks to path through a temporary file
 
+    Parameters
+    ---------
+        chunks: iterable
+            bytes objects, e.g. response.iter_content(download_chunk_bytes)
+        path: string
+            local file path
+        expected_size: integer
+            number of bytes the stream should hold, e.g. Content-Length
+                Default - None, not checked
+        expected_sha256: string
+            hex sha256 digest the stream should match
+                Default - None, not checked
+        deadline: float
+            time.time() after which the transfer is abandoned
+                Default - None, no deadline
+        url: string
+            source url for error messages
 
+    Returns
+    -------
+        nbytes: integer
+            number of bytes written
+        sha256: string
+            hex sha256 digest of the bytes written
 
+    Notes
+    -----
+    Chunks are written to a temporary file in the same directory as path
+    while the size and sha256 digest are computed, so memory use is one
+    chunk per transfer and the file is never read back. The temporary file
+    is renamed to path with os.replace only when the stream is complete and
+    the checks pass, otherwise it is removed. A file at path is therefore
+    always a complete download and 'os.path.isfile' checks stay valid after
+    a failed or interrupted transfer.
 
+    """
+    source = url or path
+    dir_path, name = os.path.split(os.path.abspath(path))
+    fd, path_tmp = tempfile.mkstemp(prefix='.' + name + '.', suffix='.part', dir=dir_path)
+    digest = hashlib.sha256()
+    nbytes = 0
+    try:
+        with os.fdopen(fd, 'wb') as rfile:
+            for chunk in chunks:
+                if deadline is not None and time.time() > deadline:
+                    raise TimeoutError("download of {} took too long".format(source))
+                if not chunk:
+                    continue
+                rfile.write(chunk)
+                digest.update(chunk)
+                nbytes += len(chunk)
+        if expected_size is not None and nbytes != int(expected_size):
+            raise IOError("download of {} is {} bytes, expected {}".format(source, nbytes, expected_size))
+        if expected_sha256 is not None and digest.hexdigest() != expected_sha256.lower():
+            raise IOError("download of {} failed sha256 check".format(source))
+        os.replace(path_tmp, path)
+    except BaseException:
+        if os.path.isfile(path_tmp):
+            os.remove(path_tmp)
+        raise
+    logger.debug("stream_to_file: {} bytes sha256 {} to {}".format(nbytes, digest.hexdigest(), path))
+    return nbytes, digest.hexdigest()
+
+def url_download(url, path, timeout = 600, expected_sha256 = None, opener = None, request = None):
+    """Download ftp or http url to path with urllib, streaming to disk
 
-def gdal_raster_reproject(file_in, file_out, crs_out, crs_in = None):
-    """wrapper around gdalwarp for reprojecting rasters
     Parameters
     ---------
-        file_in: string
-            file path of input raster
-        file_out: string
-            file path of output raster
-        crs_out: string
-            EPSG spatial reference for output raster coordinate system in
-                'EPSG:X' format
-        crs_in: string
-            EPSG spatial reference for input raster coordinate system
-                Default - None as gdalwarp can read coordinate system of
-                input raster if available
+        url: string
+            ftp, http or https url
+        path: string
+            local file path
+        timeout: float
+            seconds allowed for the transfer
+        expected_sha256: string
+            hex sha256 digest the file should match
+                Default - None, not checked
+        opener: urllib.request.OpenerDirector
+            opener to use, e.g. with a cookie processor
+                Default - None, urllib.request.urlopen
+        request: urllib.request.Request
+            request to open instead of url, e.g. with auth headers
+
     Returns
     -------
-        None
+        nbytes: integer
+            number of bytes written
+        sha256: string
+            hex sha256 digest of the bytes written
 
     Notes
     -----
-    Requires gdal_path be set in config ini file and gdal be available
+    Replaces urllib.request.urlretrieve, which writes straight to path and
+    leaves a partial file behind when a transfer fails. Content-Length is
+    checked when the server sends it. Throttled requests are retried, see
+    'host_call'.
 
     """
+    deadline = time.time() + timeout
+    open_url = opener.open if opener is not None else urllib.request.urlopen
 
-    if crs_in != None:
-        os.system("gdalwarp -s_srs {0} -t_srs {1} {2} {3}".format(crs_in, crs_out, file_in, file_out))
-    else:
-        os.system("gdalwarp -t_srs {0} {1} {2}".format(crs_out, file_in, file_out))
-    # error handling
+    def transfer():
+        with contextlib.closing(open_url(request or url, timeout=min(timeout, 300))) as response:
+            size = response.headers.get('Content-Length')
+            chunks = iter(functools.partial(response.read, download_chunk_bytes), b'')
+            return stream_to_file(chunks, path, expected_size=size, expected_sha256=expected_sha256,
+                                  deadline=deadline, url=url)
+
+    return host_call(url, transfer)
+
+# bytes written between updates of a '.part.json' offset file, see 'resume_download'
+part_state_bytes = 8 * 1024**2
+
+def read_part_state(path_state):
+    """Read '.part.json' offsets of a partial download, None if missing or unreadable"""
+    try:
+        with open(path_state) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+def write_part_state(path_state, state):
+    """Write '.part.json' offsets of a partial download, replacing the old file"""
+    path_tmp = path_state + '.tmp'
+    with open(path_tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(path_tmp, path_state)
+
+def resume_download(url, path, timeout = 600, segments = 1, segment_min_mb = 64.0, retries = 3, dir_part = None,
+                    session = None, host_limit = 8):
+    """Download ftp or http url to path, resuming partial transfers
+
+    Parameters
+    ---------
+        url: string
+            ftp, http or https url
+        path: string
+            local file path
+        timeout: float
+            seconds allowed for the transfer, including retries
+        segments: integer
+            http byte range segments fetched in parallel for large files
+        segment_min_mb: float
+            smallest segment size, files smaller than two segments are fetched
+            in one stream
+        retries: integer
+            number of times to resume after a dropped connection
+        dir_part: string
+            directory for the '.part' and '.part.json' files
+                Default - None, directory of path
+        session: requests.Session
+            session for http requests
+                Default - None, a new connection is used
+        host_limit: integer
+            largest number of requests in flight to the host, see 'host_call'
+
+    Returns
+    -------
+        nbytes: integer
+            size of the downloaded file
+
+    Notes
+    -----
+    Bytes are written to '<name>.part', and '<name>.part.json' records the
+    url, size, ETag and Last-Modified of the remote file and the offset
+    reached in each segment. When a transfer drops or is throttled, the next
+    attempt, in this call after Retry-After if the server sent one or in a
+    later run, continues from the recorded offsets with an http Range
+    request, or an ftp REST command, as long as the remote size
+    and validators still match. Otherwise the partial file is discarded and
+    the download starts over. http requests send If-Range, so a file that
+    changes between the check and the request is sent whole, not spliced.
+    The complete file is moved to path with os.replace.
+
+    """
+    name = os.path.basename(path)
+    dir_part = dir_part or os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(dir_part):
+        os.makedirs(dir_part)
+    path_part = os.path.join(dir_part, name + '.part')
+    path_state = path_part + '.json'
+    deadline = time.time() + timeout
+    segment_min_bytes = int(segment_min_mb * 1024**2)
+
+    for attempt in range(retries + 1):
+        try:
+            if urlparse(url).scheme == 'ftp':
+                host_call(url, functools.partial(resume_ftp, url, path_part, path_state, deadline),
+                          limit_max=host_limit, retries=0)
+            else:
+                resume_http(url, path_part, path_state, deadline, segments, segment_min_bytes, session, host_limit)
+            break
+        except ftplib.all_errors as e:
+            # missing files and refused requests will not succeed on a retry,
+            # throttled requests (429) will once the server lets them through
+            throttled, retry_after = throttle_info(e)
+            if not throttled and (isinstance(e, ftplib.error_perm) or (isinstance(e, requests.exceptions.HTTPError)
+                                                    and e.response is not None and e.response.status_code < 500)):
+                raise IOError("download of {} failed: {}".format(url, e)) from e
+            state = read_part_state(path_state)
+            offset = sum(seg[1] - seg[0] for seg in state['segments']) if state else 0
+            if attempt == retries or time.time() + (retry_after or 0) > deadline:
+                logger.error("resume_download: giving up on {} at {} bytes".format(url, offset))
+                raise IOError("download of {} failed: {}".format(url, e)) from e
+            logger.warning("resume_download: {} {} at {} bytes, resuming".format(
+                url, 'throttled' if throttled else 'dropped', offset))
+            logger.warning(e)
+            # with Retry-After the host controller holds new requests, otherwise back off
+            if retry_after is None:
+                time.sleep(min(2 ** attempt, 30))
+
+    os.replace(path_part, path)
+    os.remove(path_state)
+    return os.path.getsize(path)
+
+def new_part_state(validator, n_segments, path_part):
+    """Start a partial download over, splitting it into byte range segments"""
+    size = validator['size']
+    if size is None:
+        segs = [[0, 0, None]]
+    else:
+        bounds = [size * i // n_segments for i in range(n_segments + 1)]
+        segs = [[bounds[i], bounds[i], bounds[i + 1]] for i in range(n_segments)]
+    with open(path_part, 'wb') as f:
+        if size is not None:
+            f.truncate(size)
+    return dict(validator, segments=segs)
+
+def resume_http(url, path_part, path_state, deadline, segments, segment_min_bytes, session, host_limit = 8):
+    """Fetch the missing byte ranges of a partial http download, see 'resume_download'"""
+    requester = session if session is not None else requests
+
+    def head():
+        with requester.head(url, allow_redirects=True, timeout=60) as r:
+            r.raise_for_status()
+            return r.headers
+
+    headers = host_call(url, head, limit_max=host_limit, retries=0)
+    size = headers.get('Content-Length')
+    if size is not None and 'Content-Encoding' not in headers:
+        size = int(size)
+    else:
+        size = None
+    validator = {'url': url, 'size': size, 'etag': headers.get('ETag'),
+                 'last_modified': headers.get('Last-Modified')}
+    ranges = size is not None and headers.get('Accept-Ranges', '').lower() == 'bytes'
+    # servers ignore If-Range with a weak ETag and send the whole file
+    if_range = validator['last_modified']
+    if validator['etag'] and not validator['etag'].startswith('W/'):
+        if_range = validator['etag']
+
+    state = read_part_state(path_state)
+    if (state is None or not os.path.isfile(path_part) or not ranges or not if_range
+            or any(state.get(k) != v for k, v in validator.items())):
+        n_segments = 1
+        if ranges:
+            n_segments = max(1, min(segments, size // max(segment_min_bytes, 1)))
+        state = new_part_state(validator, n_segments, path_part)
+        write_part_state(path_state, state)
+    else:
+        logger.info("resume_http: resuming {} at {} of {} bytes".format(
+            url, sum(seg[1] - seg[0] for seg in state['segments']), size))
+    state_lock = threading.Lock()
+
+    def fetch(i):
+        start, pos, end = state['segments'][i]
+        req_headers = {}
+        if ranges:
+            req_headers['Range'] = 'bytes={}-{}'.format(pos, end - 1)
+            req_headers['If-Range'] = if_range
+        with requester.get(url, headers=req_headers, stream=True, timeout=(60, 300)) as r:
+            r.raise_for_status()
+            # bytes of a whole body sent instead of the range that come before pos
+            skip = 0
+            if ranges and r.status_code != 206:
+                unchanged = (r.headers.get('ETag') == validator['etag']
+                             and r.headers.get('Last-Modified') == validator['last_modified'])
+                if pos != 0 and not unchanged:
+                    # file changed on the server, start over on the next attempt
+                    os.remove(path_state)
+                    raise IOError("{} changed during download".format(url))
+                skip = pos
+            with open(path_part, 'r+b' if ranges else 'wb') as f:
+                f.seek(pos)
+                written = 0
+                for chunk in r.iter_content(chunk_size=download_chunk_bytes):
+                    if time.time() > deadline:
+                        raise TimeoutError("download of {} took too long".format(url))
+                    if skip:
+                        chunk, skip = chunk[skip:], max(skip - len(chunk), 0)
+                    if end is not None and pos + len(chunk) >= end:
+                        chunk = chunk[:end - pos]
+                    f.write(chunk)
+                    pos += len(chunk)
+                    written += len(chunk)
+                    if written >= part_state_bytes:
+                        f.flush()
+                        written = 0
+                        with state_lock:
+                            state['segments'][i][1] = pos
+                            write_part_state(path_state, state)
+                    if end is not None and pos >= end:
+                        break
+                f.flush()
+            with state_lock:
+                state['segments'][i][1] = pos
+                write_part_state(path_state, state)
+
+    def fetch_limited(i):
+        host_call(url, functools.partial(fetch, i), limit_max=host_limit, retries=0)
+
+    todo = [i for i, seg in enumerate(state['segments']) if seg[2] is None or seg[1] < seg[2]]
+    if len(todo) > 1:
+        with ThreadPoolExecutor(max_workers=len(todo)) as pool:
+            for future in [pool.submit(fetch_limited, i) for i in todo]:
+                future.result()
+    elif todo:
+        fetch_limited(todo[0])
+
+    if size is not None and os.path.getsize(path_part) != size:
+        os.remove(path_state)
+        raise IOError("download of {} is {} bytes, expected {}".format(url, os.path.getsize(path_part), size))
+
+def resume_ftp(url, path_part, path_state, deadline):
+    """Fetch the rest of a partial ftp download with REST, see 'resume_download'"""
+    u = urlparse(url)
+    ftp = ftplib.FTP(u.hostname, timeout=60)
+    try:
+        ftp.login(u.username or 'anonymous', u.password or '')
+        ftp.voidcmd('TYPE I')
+        size = ftp.size(u.path)
+        try:
+            modified = ftp.sendcmd('MDTM ' + u.path)[4:].strip()
+        except ftplib.error_perm:
+            modified = None
+        validator = {'url': url, 'size': size, 'etag': None, 'last_modified': modified}
+
+        state = read_part_state(path_state)
+        if (state is None or not os.path.isfile(path_part) or size is None or modified is None
+                or any(state.get(k) != v for k, v in validator.items())):
+            state = dict(validator, segments=[[0, 0, size]])
+            open(path_part, 'wb').close()
+            write_part_state(path_state, state)
+        pos = min(state['segments'][0][1], os.path.getsize(path_part))
+        if pos:
+            logger.info("resume_ftp: resuming {} at {} of {} bytes".format(url, pos, size))
+
+        with open(path_part, 'r+b') as f:
+            f.seek(pos)
+            f.truncate()
+            progress = {'pos': pos, 'written': 0}
+
+            def write(chunk):
+                if time.time() > deadline:
+                    raise TimeoutError("download of {} took too long".format(url))
+                f.write(chunk)
+                progress['pos'] += len(chunk)
+                progress['written'] += len(chunk)
+                if progress['written'] >= part_state_bytes:
+                    f.flush()
+                    progress['written'] = 0
+                    state['segments'][0][1] = progress['pos']
+                    write_part_state(path_state, state)
+
+            try:
+                ftp.retrbinary('RETR ' + u.path, write, blocksize=download_chunk_bytes, rest=pos or None)
+            finally:
+                f.flush()
+                state['segments'][0][1] = progress['pos']
+                write_part_state(path_state, state)
+    finally:
+        try:
+            ftp.close()
+        except ftplib.all_errors:
+            pass
+
+    if size is not None and os.path.getsize(path_part) != size:
+        os.remove(path_state)
+        raise IOError("download of {} is {} bytes, expected {}".format(url, os.path.getsize(path_part), size))
+
+class host_controller:
+    """Adaptive concurrency and rate limit for requests to one host
+
+    Attributes
+    ----------
+        host: string
+            host name
+        limit: float
+            number of requests allowed in flight, int(limit) is used
+        limit_max: integer
+            largest limit, 'host_limit' in [performance]
+        limit_min: integer
+            smallest limit
+        stats: dict
+            ok, throttled, errors, increases and decreases counters
+
+    Notes
+    -----
+    AIMD, as in tcp congestion control. Each successful request raises the
+    limit by 1 / limit, about one more request in flight per round of
+    requests, while its duration stays within 'slow_factor' of the
+    running average. Requests answered with 429 or 5xx, timeouts, dropped
+    connections, and ftp 4xx replies halve the limit, at most once per
+    round since requests already in flight report the same congestion. A
+    Retry-After header holds all new requests to the host until it passes.
+    Other errors, e.g. 404 or a failed DNS lookup, leave the limit as it is.
+
+    """
+
+    slow_factor = 2.0
+
+    def __init__(self, host, limit_max = 8, limit_min = 1, limit_start = 2):
+        """ """
+        self.host = host
+        self.limit_max = max(limit_max, limit_min)
+        self.limit_min = limit_min
+        self.limit = float(min(max(limit_start, limit_min), self.limit_max))
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.duration_avg = None
+        self.cond = threading.Condition()
+        self.stats = {'ok': 0, 'throttled': 0, 'errors': 0, 'increases': 0, 'decreases': 0}
+
+    def __str__(self):
+        """ """
+        return '<host_controller {} limit={:.1f} in_flight={}>'.format(self.host, self.limit, self.in_flight)
+
+    def acquire(self):
+        """Wait for a free slot, returns the start time passed to 'release'"""
+        with self.cond:
+            while True:
+                wait_s = self.blocked_until - time.time()
+                if wait_s <= 0 and self.in_flight < int(self.limit):
+                    break
+                self.cond.wait(timeout=wait_s if wait_s > 0 else None)
+            self.in_flight += 1
+            return time.time()
+
+    def release(self, started, throttled = False, retry_after = None, error = False):
+        """Free a slot and adjust the limit from the outcome of the request,
+        only successful requests raise the limit"""
+        now = time.time()
+        duration = now - started
+        with self.cond:
+            self.in_flight -= 1
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            if throttled:
+                self.stats['throttled'] += 1
+                if started >= self.last_decrease:
+                    self.limit = max(self.limit_min, self.limit / 2)
+                    self.last_decrease = now
+                    self.stats['decreases'] += 1
+                    logger.warning("host_controller: {} throttling, limit {:.1f}".format(self.host, self.limit))
+            elif error:
+                self.stats['errors'] += 1
+            else:
+                self.stats['ok'] += 1
+                if self.duration_avg is None or duration <= self.slow_factor * self.duration_avg:
+                    limit_old = int(self.limit)
+                    self.limit = min(self.limit_max, self.limit + 1 / self.limit)
+                    if int(self.limit) > limit_old:
+                        self.stats['increases'] += 1
+                if self.duration_avg is None:
+                    self.duration_avg = duration
+                else:
+                    self.duration_avg = 0.8 * self.duration_avg + 0.2 * duration
+            self.cond.notify_all()
+
+def throttle_info(e):
+    """Return (throttled, retry_after seconds) for a request error"""
+    status = None
+    headers = {}
+    response = getattr(e, 'response', None)
+    if response is not None:
+        status = response.status_code
+        headers = response.headers
+    elif isinstance(e, urllib.error.HTTPError):
+        status = e.code
+        headers = e.headers or {}
+    if status is not None:
+        throttled = status == 429 or status >= 500
+    else:
+        throttled = isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                                   socket.timeout, TimeoutError, ConnectionError, ftplib.error_temp,
+                                   EOFError))
+    return throttled, parse_retry_after(headers.get('Retry-After'))
+
+def parse_retry_after(value):
+    """Return seconds from a Retry-After header value, seconds or http date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_date = email.utils.parsedate_to_datetime(value)
+        return max((retry_date - dt.datetime.now(dt.timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def raise_for_throttle(r):
+    """Raise HTTPError for 429 and 5xx responses, return other responses"""
+    if r.status_code == 429 or r.status_code >= 500:
+        r.raise_for_status()
+    return r
+
+# adaptive limits for each host, shared by threads of a process, see
+# 'get_host_controller'
+host_controllers = {}
+host_controllers_lock = threading.Lock()
+
+def get_host_controller(url, limit_max = 8):
+    """Return the concurrency controller of this process for the host of url"""
+    host = urlparse(url).hostname or url
+    with host_controllers_lock:
+        key = (os.getpid(), host)
+        if key not in host_controllers:
+            host_controllers[key] = host_controller(host, limit_max=limit_max)
+        return host_controllers[key]
+
+def host_call(url, call, limit_max = 8, retries = 4):
+    """Run a request under the adaptive limit of its host, retrying when throttled
+
+    Parameters
+    ---------
+        url: string
+            url of the request, its host selects the controller
+        call: function
+            makes the request with no arguments, must raise on http errors,
+            e.g. with 'raise_for_status'
+        limit_max: integer
+            largest number of requests in flight for the host
+        retries: integer
+            number of times a throttled request is tried again
+
+    Returns
+    -------
+        result of call
+
+    Notes
+    -----
+    See 'host_controller'. Throttled requests wait for Retry-After, or an
+    exponential backoff when the server does not send one, then try again.
+    Errors that are not throttling, e.g. 404, are raised at once.
+    'raise_for_throttle' turns throttling responses into errors for calls
+    that check status codes themselves.
+
+    """
+    controller = get_host_controller(url, limit_max)
+    for attempt in range(retries + 1):
+        started = controller.acquire()
+        try:
+            result = call()
+        except Exception as e:
+            throttled, retry_after = throttle_info(e)
+            controller.release(started, throttled, retry_after, error=True)
+            if not throttled or attempt == retries:
+                raise
+            logger.warning("host_call: {} throttled, retrying".format(url))
+            logger.warning(e)
+            # with Retry-After the controller holds new requests, otherwise back off
+            if retry_after is None:
+                time.sleep(min(2 ** attempt, 60))
+            continue
+        controller.release(started)
+        return result
+
+class download_engine:
+    """asyncio download engine shared by http downloads
+
+    Attributes
+    ----------
+        host_limit: integer
+            number of transfers in flight at once for each host
+        timeout: float
+            seconds allowed for a transfer to finish
+
+    Notes
+    -----
+    Runs an asyncio event loop in a daemon thread. Download functions in any
+    thread submit requests and get a concurrent.futures.Future back, so a
+    product can put all its tiles in flight at once and wait for them while
+    per-host semaphores keep the number of connections to each server
+    bounded across all products, below that each transfer waits for the
+    adaptive limit of its host, see 'host_call'. aiohttp is not a dependency, each transfer
+    is a streamed 'requests' call run in the loop's thread pool and written
+    with 'stream_to_file', so files only appear at their path once complete
+    and size checked. Callbacks get (url, path,
+    error) in the loop thread when a transfer finishes and should return
+    quickly.
+
+    """
+
+    def __init__(self, host_limit = 8, timeout = 600, n_threads = 32):
+        """ """
+        self.host_limit = host_limit
+        self.timeout = timeout
+        self.host_sems = {}
+        self.executor = ThreadPoolExecutor(max_workers=n_threads)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def __str__(self):
+        """ """
+        return '<download_engine host_limit={}>'.format(self.host_limit)
+
+    def submit(self, url, path, auth = None, verify = True, headers = None, session = None, timeout = None, callback = None,
+               expected_sha256 = None):
+        """Queue download of url to path
+
+        Parameters
+        ---------
+            url: string
+                http or https url
+            path: string
+                local file path
+            auth: requests auth object or tuple
+            verify: boolean
+                verify ssl certificates
+            headers: dict
+                extra request headers
+            session: requests.Session
+                session to send the request with
+                    Default - None, a new connection is used
+            timeout: float
+                seconds allowed for the transfer
+                    Default - None, engine timeout
+            callback: function
+                called with (url, path, error) when the transfer finishes,
+                error is None on success
+            expected_sha256: string
+                hex sha256 digest the file should match
+                    Default - None, not checked
+
+        Returns
+        -------
+            future: concurrent.futures.Future
+                result is path, or raises the transfer error
+
+        """
+        get = functools.partial(self.get, url, path, auth, verify, headers, session, timeout or self.timeout,
+                                expected_sha256)
+        return asyncio.run_coroutine_threadsafe(self.fetch(url, path, get, callback), self.loop)
+
+    async def fetch(self, url, path, get, callback):
+        """Run transfer once a slot for its host is free"""
+        host = urlparse(url).netloc
+        if host not in self.host_sems:
+            self.host_sems[host] = asyncio.Semaphore(self.host_limit)
+        error = None
+        async with self.host_sems[host]:
+            try:
+                await self.loop.run_in_executor(self.executor, get)
+            except Exception as e:
+                error = e
+        if callback is not None:
+            try:
+                callback(url, path, error)
+            except Exception as e:
+                logger.error("download_engine: error in callback for {}".format(url))
+                logger.error(e)
+        if error is not None:
+            raise error
+        return path
+
+    def get(self, url, path, auth, verify, headers, session, timeout, expected_sha256 = None):
+        """Stream url to path, raising on http errors, timeouts and failed checks"""
+        deadline = time.time() + timeout
+        requester = session if session is not None else requests
+
+        def transfer():
+            if time.time() > deadline:
+                raise IOError("download of {} took longer than {} s".format(url, timeout))
+            with requester.get(url, auth=auth, verify=verify, headers=headers, stream=True,
+                               timeout=(60, min(timeout, 300))) as r:
+                r.raise_for_status()
+                # requests decodes gzip/deflate, so Content-Length only matches raw bodies
+                size = None
+                if 'Content-Encoding' not in r.headers:
+                    size = r.headers.get('Content-Length')
+                stream_to_file(r.iter_content(chunk_size=download_chunk_bytes), path, expected_size=size,
+                               expected_sha256=expected_sha256, deadline=deadline, url=url)
+
+        host_call(url, transfer, limit_max=self.host_limit)
+        return path
+
+    def close(self):
+        """Stop the event loop and transfer threads"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown()
+
+# one download engine for each process, see 'get_download_engine'
+download_engines = {}
+download_engines_lock = threading.Lock()
+
+def get_download_engine(cfg = None):
+    """Return the download engine of this process, creating it on first use
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object, 'host_limit' and 'download_timeout'
+                are used when the engine is created
+
+    Returns
+    -------
+        engine: download_engine
+
+    """
+    with download_engines_lock:
+        pid = os.getpid()
+        if pid not in download_engines:
+            download_engines[pid] = download_engine(host_limit=getattr(cfg, 'host_limit', 8),
+                                                    timeout=getattr(cfg, 'download_timeout', 600))
+        return download_engines[pid]
+
+def engine_download(cfg, prod):
+    """Return a download function for 'download_cache.fetch' that transfers
+    with the download engine and counts bytes for product"""
+    def download(url, path):
+        get_download_engine(cfg).submit(url, path, callback=download_callback(prod)).result()
+    return download
+
+def wait_downloads(futures, prod):
+    """Wait for download engine futures of product, raising if any transfer
+    failed so the task is not recorded as done, errors are logged by
+    'download_callback'"""
+    wait(futures)
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        raise IOError("download_{}: {} of {} downloads failed, {}".format(prod, len(errors), len(futures), errors[0]))
+
+def download_callback(prod):
+    """Return download engine callback counting downloaded bytes and
+    logging errors for product"""
+    def callback(url, path, error):
+        if error is None:
+            add_download_bytes(prod, path)
+            logger.info("download_{}: downloaded {}".format(prod, path))
+        else:
+            logger.error("download_{}: error downloading {}".format(prod, url))
+            logger.error(error)
+    return callback
+
+class earthdata_session(requests.Session):
+    """requests session keeping credentials on redirects to and from
+    NASA Earthdata login"""
+
+    auth_host = 'urs.earthdata.nasa.gov'
+
+    def rebuild_auth(self, prepared_request, response):
+        """ """
+        headers = prepared_request.headers
+        if 'Authorization' in headers:
+            original = urlparse(response.request.url).hostname
+            redirect = urlparse(prepared_request.url).hostname
+            if original != redirect and redirect != self.auth_host and original != self.auth_host:
+                del headers['Authorization']
+
+class shared_digest_auth(HTTPDigestAuth):
+    """HTTP digest auth sharing the server challenge between threads
+
+    Notes
+    -----
+    requests keeps the digest challenge per thread, so every download
+    thread pays a 401 round trip before its first file. Here the challenge
+    and nonce count are shared under a lock: once any thread has been
+    challenged, all threads send the Authorization header with their first
+    request and reuse the nonce until the server issues a new one.
+    'n_challenges' counts challenges answered.
+
+    """
+
+    def __init__(self, username, password):
+        """ """
+        super().__init__(username, password)
+        self.lock = threading.Lock()
+        self.shared_chal = {}
+        self.shared_last_nonce = ''
+        self.shared_nonce_count = 0
+        self.n_challenges = 0
+
+    def __call__(self, r):
+        """ """
+        self.init_per_thread_state()
+        with self.lock:
+            if self.shared_chal:
+                self._thread_local.chal = self.shared_chal
+                self._thread_local.last_nonce = self.shared_last_nonce
+        return super().__call__(r)
+
+    def build_digest_header(self, method, url):
+        """ """
+        with self.lock:
+            thread_local = self._thread_local
+            if thread_local.chal and thread_local.chal is not self.shared_chal:
+                # new challenge parsed from a 401 by this thread
+                self.shared_chal = thread_local.chal
+                self.shared_last_nonce = ''
+                self.shared_nonce_count = 0
+                self.n_challenges += 1
+            else:
+                thread_local.chal = self.shared_chal
+            thread_local.last_nonce = self.shared_last_nonce
+            thread_local.nonce_count = self.shared_nonce_count
+            header = super().build_digest_header(method, url)
+            self.shared_last_nonce = thread_local.last_nonce
+            self.shared_nonce_count = thread_local.nonce_count
+        return header
+
+# keep-alive sessions for each host, shared by threads of a process, see
+# 'get_session'
+host_sessions = {}
+host_sessions_lock = threading.Lock()
+
+def get_session(host, auth = None, verify = True, pool_size = 8):
+    """Return the pooled keep-alive session for a host
+
+    Parameters
+    ---------
+        host: string
+            host url, e.g. 'https://snow-data.jpl.nasa.gov'
+        auth: requests auth object or tuple
+            set on the session when it is created
+        verify: boolean
+            verify ssl certificates
+        pool_size: integer
+            number of connections kept open to the host
+
+    Returns
+    -------
+        session: requests.Session
+
+    """
+    with host_sessions_lock:
+        key = (os.getpid(), host)
+        if key not in host_sessions:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount(host, adapter)
+            session.auth = auth
+            session.verify = verify
+            host_sessions[key] = session
+        return host_sessions[key]
+
+def get_jpl_session(cfg):
+    """Return the pooled JPL session with shared digest auth"""
+    return get_session(cfg.host_jpl, auth=shared_digest_auth(cfg.username_jpl, cfg.password_jpl),
+                       verify=cfg.ssl_verify, pool_size=getattr(cfg, 'host_limit', 8))
+
+def session_stats(session):
+    """Return connection reuse counters of a session
+
+    Returns
+    -------
+        stats: dict
+            requests: requests sent
+            connections: connections opened
+            reused: requests sent on an already open connection
+            challenges: digest challenges answered, if digest auth is used
+
+    """
+    n_requests = 0
+    n_connections = 0
+    for adapter in session.adapters.values():
+        for pool_key in adapter.poolmanager.pools.keys():
+            pool = adapter.poolmanager.pools[pool_key]
+            n_requests += pool.num_requests
+            n_connections += pool.num_connections
+    return {'requests': n_requests, 'connections': n_connections,
+            'reused': n_requests - n_connections,
+            'challenges': getattr(session.auth, 'n_challenges', None)}
+
+class ftp_pool:
+    """Logged in ftplib connections to one host, reused across downloads
+
+    Attributes
+    ----------
+        host: string
+            ftp host name, e.g. 'sidads.colorado.edu'
+        size: integer
+            number of connections open at once
+        timeout: float
+            socket timeout in seconds
+        stats: dict
+            connects, reconnects, transfers and listings counters
+
+    Notes
+    -----
+    Threads borrow a connection with 'connection' and give it back when
+    done, so each date reuses an open, logged in control connection instead
+    of connecting, logging in and changing directory again. Connections idle
+    for more than 'noop_s' seconds are checked with NOOP before reuse and
+    replaced when the server has dropped them. Directory listings are cached
+    by 'listing' so each SNODAS month directory is listed once.
+
+    """
+
+    noop_s = 15
+
+    def __init__(self, host, user = 'anonymous', passwd = '', size = 4, timeout = 60):
+        """ """
+        self.host = host
+        self.user = user or 'anonymous'
+        self.passwd = passwd or ''
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.listings = {}
+        self.listing_locks = {}
+        self.stats = {'connects': 0, 'reconnects': 0, 'transfers': 0, 'listings': 0}
+
+    def __str__(self):
+        """ """
+        return '<ftp_pool {} size={}>'.format(self.host, self.size)
+
+    def connect(self):
+        """Open and log in a new connection"""
+        ftp = ftplib.FTP(self.host, timeout=self.timeout)
+        ftp.login(self.user, self.passwd)
+        ftp.voidcmd('TYPE I')
+        with self.lock:
+            self.stats['connects'] += 1
+        return ftp
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrow a connection, it is closed instead of returned if an ftp error is raised"""
+        with self.slots:
+            ftp = None
+            while ftp is None:
+                with self.lock:
+                    if not self.idle:
+                        break
+                    ftp, used = self.idle.pop()
+                if time.time() - used > self.noop_s:
+                    try:
+                        ftp.voidcmd('NOOP')
+                    except ftplib.all_errors:
+                        ftp.close()
+                        ftp = None
+                        with self.lock:
+                            self.stats['reconnects'] += 1
+            if ftp is None:
+                ftp = self.connect()
+            try:
+                yield ftp
+            except:
+                ftp.close()
+                raise
+            with self.lock:
+                self.idle.append((ftp, time.time()))
+
+    def listing(self, dir_ftp, max_age = 600):
+        """Return the set of file names in a directory, listing it at most once every max_age seconds
+
+        a missing directory gives an empty set
+        """
+        called = time.time()
+        with self.lock:
+            dir_lock = self.listing_locks.setdefault(dir_ftp, threading.Lock())
+        # threads asking for the same directory wait for one listing
+        with dir_lock:
+            with self.lock:
+                cached = self.listings.get(dir_ftp)
+            if cached is not None and (time.time() - cached[0] <= max_age or cached[0] >= called):
+                return cached[1]
+            def nlst():
+                with self.connection() as ftp:
+                    try:
+                        return set(os.path.basename(f) for f in ftp.nlst(dir_ftp))
+                    except ftplib.error_perm:
+                        return set()
+
+            names = host_call('ftp://' + self.host, nlst, limit_max=self.size)
+            with self.lock:
+                self.stats['listings'] += 1
+                self.listings[dir_ftp] = (time.time(), names)
+        return names
+
+    def download(self, path_ftp, path, timeout = 600):
+        """Stream a file to path over a pooled connection, see 'stream_to_file'
+
+        Returns
+        -------
+            nbytes: integer
+                number of bytes written
+            sha256: string
+                hex sha256 digest of the bytes written
+
+        """
+        deadline = time.time() + timeout
+        url = 'ftp://{}{}'.format(self.host, path_ftp)
+
+        def transfer():
+            with self.connection() as ftp:
+                conn, size = ftp.ntransfercmd('RETR ' + path_ftp)
+                with conn:
+                    chunks = iter(functools.partial(conn.recv, download_chunk_bytes), b'')
+                    result = stream_to_file(chunks, path, expected_size=size, deadline=deadline, url=url)
+                ftp.voidresp()
+            return result
+
+        result = host_call(url, transfer, limit_max=self.size)
+        with self.lock:
+            self.stats['transfers'] += 1
+        return result
+
+# ftp connection pools for each host, see 'get_ftp_pool'
+ftp_pools = {}
+ftp_pools_lock = threading.Lock()
+
+def get_ftp_pool(host, user = None, passwd = None, size = 4):
+    """Return the ftp connection pool of this process for a host
+
+    Parameters
+    ---------
+        host: string
+            host url, e.g. 'ftp://sidads.colorado.edu'
+        user: string
+            Default - None, anonymous
+        passwd: string
+        size: integer
+            number of connections open at once
+
+    Returns
+    -------
+        pool: ftp_pool
+
+    """
+    host_name = urlparse(host).hostname or host
+    with ftp_pools_lock:
+        key = (os.getpid(), host_name, user)
+        if key not in ftp_pools:
+            ftp_pools[key] = ftp_pool(host_name, user, passwd, size=size)
+        return ftp_pools[key]
+
+def get_snodas_pool(cfg):
+    """Return the ftp connection pool for the SNODAS host"""
+    return get_ftp_pool(cfg.host_snodas, cfg.username_snodas, cfg.password_snodas,
+                        size=getattr(cfg, 'host_limit', 4))
+
+class download_cache:
+    """SQLite index of downloaded files by source url and content hash
+
+    Attributes
+    ----------
+        cache_path: string
+            file path of SQLite database
+        stats: dict
+            hits, revalidated and misses counters
+
+    Notes
+    -----
+    One row per (url, location) with the sha256, size, and modification
+    time of the file at location. A url is served from any location still
+    holding its content, e.g. the work directory, the archive directory
+    'dir_arch', or the database directory for ndfd grib files, so hits do
+    not touch the network. Files that changed since they were recorded are
+    hashed again and dropped if the content differs. Mutable resources,
+    e.g. ndfd 'ds.*.bin' or nohrsc kmz, are revalidated with a conditional
+    HEAD request using the recorded ETag and Last-Modified, and fetched
+    again only when the server does not answer 304 Not Modified.
+
+    """
+
+    def __init__(self, cache_path):
+        """ """
+        self.cache_path = cache_path
+        dir_cache = os.path.dirname(cache_path)
+        if dir_cache and not os.path.isdir(dir_cache):
+            os.makedirs(dir_cache)
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(cache_path, timeout=60, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "url TEXT, location TEXT, sha256 TEXT, nbytes INTEGER, mtime REAL, "
+            "etag TEXT, last_modified TEXT, fetched TEXT, "
+            "PRIMARY KEY (url, location))")
+        self.con.commit()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0}
+
+    def __str__(self):
+        """ """
+        return '<download_cache {}>'.format(self.cache_path)
+
+    def lookup(self, url, tiers = ()):
+        """Return a local file holding the content of url and its row, (None, None) if there is none
+
+        tiers are paths checked in addition to recorded locations, an
+        untracked file at a tier path is recorded and used
+        """
+        with self.lock:
+            rows = self.con.execute(
+                "SELECT location, sha256, nbytes, mtime, etag, last_modified FROM files WHERE url = ?",
+                (url,)).fetchall()
+        for location, sha256, nbytes, mtime, etag, last_modified in rows:
+            if not os.path.isfile(location):
+                self.forget(url, location)
+                continue
+            stat = os.stat(location)
+            if stat.st_size == nbytes and stat.st_mtime == mtime:
+                return location, {'sha256': sha256, 'etag': etag, 'last_modified': last_modified}
+            if stat.st_size == nbytes and file_sha256(location) == sha256:
+                self.record(url, location, etag, last_modified, sha256)
+                return location, {'sha256': sha256, 'etag': etag, 'last_modified': last_modified}
+            self.forget(url, location)
+        locations = [row[0] for row in rows]
+        for location in tiers:
+            if location not in locations and os.path.isfile(location):
+                sha256 = self.record(url, location)
+                return location, {'sha256': sha256, 'etag': None, 'last_modified': None}
+        return None, None
+
+    def cached(self, url, tiers = ()):
+        """Return a recorded location or tier path holding url, None if there is none,
+        without hashing or changing the index, used by the planner"""
+        with self.lock:
+            rows = self.con.execute("SELECT location, nbytes FROM files WHERE url = ?", (url,)).fetchall()
+        for location, nbytes in rows:
+            if os.path.isfile(location) and os.path.getsize(location) == nbytes:
+                return location
+        for location in tiers:
+            if os.path.isfile(location):
+                return location
+        return None
+
+    def record(self, url, location, etag = None, last_modified = None, sha256 = None):
+        """Record the file at location as the content of url, returns its sha256
+
+        locations recorded with other content for url are dropped
+        """
+        sha256 = sha256 or file_sha256(location)
+        stat = os.stat(location)
+        with self.lock:
+            self.con.execute("DELETE FROM files WHERE url = ? AND sha256 != ?", (url, sha256))
+            self.con.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, location, sha256, stat.st_size, stat.st_mtime, etag, last_modified,
+                 dt.datetime.now().isoformat(timespec='seconds')))
+            self.con.commit()
+        return sha256
+
+    def forget(self, url, location):
+        """Drop a location of url"""
+        with self.lock:
+            self.con.execute("DELETE FROM files WHERE url = ? AND location = ?", (url, location))
+            self.con.commit()
+
+    def moved(self, location, location_new):
+        """Follow a cached file moved by an organize function"""
+        with self.lock:
+            self.con.execute("UPDATE OR REPLACE files SET location = ? WHERE location = ?",
+                             (location_new, location))
+            self.con.commit()
+
+    def fetch(self, url, path, download, tiers = (), mutable = False, refresh = False, session = None):
+        """Place the content of url at path, from a local copy when possible
+
+        Parameters
+        ---------
+            url: string
+                source url, the cache key
+            path: string
+                local file path
+            download: function
+                called with (url, path) on a miss to download url to path
+            tiers: list of strings
+                other paths that may hold the file, e.g. in 'dir_arch'
+            mutable: boolean
+                True : the resource can change at the same url, revalidate
+                local copies with a conditional request
+            refresh: boolean
+                True : skip local copies, e.g. when overwriting
+            session: requests.Session
+                session for conditional requests
+
+        Returns
+        -------
+            hit: boolean
+                True if no download was needed
+
+        """
+        # other processes fetching url wait, then find the file in the cache
+        lock_path = os.path.join(os.path.dirname(os.path.abspath(self.cache_path)), 'locks',
+                                 hashlib.sha1(url.encode()).hexdigest() + '.lock')
+        with file_lock(lock_path):
+            return self.fetch_locked(url, path, download, tiers, mutable, refresh, session)
+
+    def fetch_locked(self, url, path, download, tiers, mutable, refresh, session):
+        """Fetch while holding the url lock, see 'fetch'"""
+        location, row = (None, None) if refresh else self.lookup(url, [path] + list(tiers))
+        validators = {}
+        if mutable and urlparse(url).scheme in ['http', 'https']:
+            requester = session if session is not None else requests
+            headers = {}
+            if row is not None and row['etag']:
+                headers['If-None-Match'] = row['etag']
+            if row is not None and row['last_modified']:
+                headers['If-Modified-Since'] = row['last_modified']
+            def head():
+                with requester.head(url, headers=headers, allow_redirects=True, timeout=60) as r:
+                    return raise_for_throttle(r)
+
+            try:
+                with host_call(url, head, retries=1) as r:
+                    if r.status_code == 304 and location is not None:
+                        with self.lock:
+                            self.stats['revalidated'] += 1
+                    else:
+                        location = None
+                        validators = {'etag': r.headers.get('ETag'),
+                                      'last_modified': r.headers.get('Last-Modified')}
+            except requests.exceptions.RequestException as e:
+                logger.warning("download_cache: could not revalidate {}".format(url))
+                logger.warning(e)
+                location = None
+
+        if location is not None:
+            if location != path:
+                place_file(location, path)
+                self.record(url, path, row['etag'], row['last_modified'], row['sha256'])
+            with self.lock:
+                self.stats['hits'] += 1
+            logger.info("download_cache: using {} for {}".format(location, url))
+            return True
+
+        download(url, path)
+        self.record(url, path, validators.get('etag'), validators.get('last_modified'))
+        with self.lock:
+            self.stats['misses'] += 1
+        return False
+
+    def close(self):
+        """Close connection"""
+        self.con.close()
+
+def file_sha256(path):
+    """Return hex sha256 digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(functools.partial(f.read, download_chunk_bytes), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def place_file(src, dst):
+    """Hard link or copy src to dst, replacing dst atomically"""
+    dir_dst, name = os.path.split(os.path.abspath(dst))
+    fd, dst_tmp = tempfile.mkstemp(prefix='.' + name + '.', suffix='.part', dir=dir_dst)
+    os.close(fd)
+    os.remove(dst_tmp)
+    try:
+        try:
+            os.link(src, dst_tmp)
+        except OSError:
+            shutil.copyfile(src, dst_tmp)
+        os.replace(dst_tmp, dst)
+    except BaseException:
+        if os.path.isfile(dst_tmp):
+            os.remove(dst_tmp)
+        raise
+
+# one download cache connection for each process, see 'get_download_cache'
+download_caches = {}
+download_caches_lock = threading.Lock()
+
+def get_download_cache(cfg):
+    """Return the download cache of this process for 'cfg.cache_path'"""
+    cache_path = getattr(cfg, 'cache_path', None) or cfg.dir_work + 'shread_cache.sqlite'
+    with download_caches_lock:
+        key = (os.getpid(), cache_path)
+        if key not in download_caches:
+            download_caches[key] = download_cache(cache_path)
+        return download_caches[key]
+
+# products downloaded and organized one date at a time
+# product : [download function, organize function]
+prod_funcs = {
+    'snodas': [download_snodas, org_snodas],
+    'srpt': [download_srpt, org_srpt],
+    'modscag': [download_modscag, org_modscag],
+    'moddrfs': [download_moddrfs, org_moddrfs],
+    'modis': [download_modis, None], # org_modis not yet supported
+}
+
+# organized outputs of each product for one date and basin, used by the run
+# ledger to check an organize task wrote all of its outputs, {var} is
+# repeated for each variable in 'snodas_vars', see 'task_outputs'
+prod_outputs = {
+    'snodas': ['snodas_{var}_{date}_{basin}_{unit_sys}.tif'],
+    'srpt': ['snowreporters_obs_{date}_{basin}.geojson', 'snowreporters_obs_{date}_{basin}.csv'],
+    'modscag': ['modscag_fsca_{date}_{basin}.tif', 'modscag_vfrac_{date}_{basin}.tif',
+                'modscag_fscavegcor_{date}_{basin}.tif'],
+    'moddrfs': ['moddrfs_forc_{date}_{basin}.tif', 'moddrfs_grnsz_{date}_{basin}.tif'],
+    'swann': ['swann_swe_{date}_{basin}_{unit_sys}.tif', 'swann_snowdepth_{date}_{basin}_{unit_sys}.tif'],
+}
+
+def task_outputs(cfg, prod, date_str, basin_cfg):
+    """Return paths of every output an organize task writes for one basin
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        prod: string
+            product in 'prod_outputs'
+        date_str: string
+            date in %Y%m%d format
+        basin_cfg ():
+            config_params Class object for the basin
+
+    Returns
+    -------
+        paths: list of strings
+            each 'prod_outputs' file, and for tifs the zonal statistics
+                files of each output type and format
+
+    """
+    basin_str = os.path.splitext(os.path.basename(basin_cfg.basin_poly_path))[0]
+    var_list = list(getattr(cfg, 'snodas_vars', {})) if prod == 'snodas' else [None]
+    paths = []
+    for name in prod_outputs[prod]:
+        for var in var_list:
+            path = basin_cfg.dir_db + name.format(var=var, date=date_str, basin=basin_str, unit_sys=cfg.unit_sys)
+            paths.append(path)
+            if not path.endswith('.tif'):
+                continue
+            for output_type in ['poly', 'points']:
+                for output_format in ['geojson', 'csv']:
+                    if output_type in cfg.output_type and output_format in cfg.output_format:
+                        paths.append(os.path.splitext(path)[0] + '_' + output_type + '.' + output_format)
+    return paths
+
+# default number of tasks allowed to run at once for each product in each
+# stage, overridden by 'jobs' in the [performance] section
+prod_jobs = {
+    'snodas': 6,
+    'srpt': 4,
+    'modscag': 4,
+    'moddrfs': 4,
+    'ndfd': 6,
+}
+
+# pool used for each task stage
+# io : thread pool for downloads
+# cpu : process pool for reprojecting, clipping, and zonal statistics, or a
+#   thread pool for products with a 'thread' backend
+stage_pools = {
+    'download': 'io',
+    'batch': 'io',
+    'org': 'cpu',
+}
+
+# wall-clock limit in seconds for tasks of a stage, (None, stage) applies to
+# all products, (product, stage) to one product, see 'parse_timeouts'
+stage_timeouts = {
+    (None, 'download'): 3600,
+    (None, 'org'): 3600,
+}
+
+# bytes downloaded for each product by this process, used for throughput
+# reporting, downloads run in threads so updates are locked
+download_bytes = {}
+download_bytes_lock = threading.Lock()
+
+def add_download_bytes(prod, path):
+    """Add size of a downloaded file to the 'download_bytes' counter"""
+    try:
+        nbytes = os.path.getsize(path)
+    except OSError:
+        return
+    with download_bytes_lock:
+        download_bytes[prod] = download_bytes.get(prod, 0) + nbytes
+
+def default_workers(mem_per_worker_gb = 2.0):
+    """Derive default worker counts from cpu count and available memory
+
+    Parameters
+    ---------
+        mem_per_worker_gb: float
+            memory in GB used by one organize worker
+
+    Returns
+    -------
+        n_io: integer
+            number of download threads
+        n_cpu: integer
+            number of organize processes
+
+    Notes
+    -----
+    Organize workers hold full grids in memory and shell out to gdalwarp,
+    so their number is limited by available memory as well as cpu count.
+    Available memory is not checked where 'os.sysconf' is unavailable
+    (Windows). Downloads are network bound and get twice the cpu count,
+    between 4 and 16 threads.
+
+    """
+    n_cpus = os.cpu_count() or 1
+    n_cpu = n_cpus
+    try:
+        mem_gb = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 1024**3
+        n_cpu = max(1, min(n_cpus, int(mem_gb // mem_per_worker_gb)))
+    except (AttributeError, ValueError, OSError):
+        pass
+    n_io = min(16, max(4, 2 * n_cpus))
+    return n_io, n_cpu
+
+def parse_jobs(jobs_str):
+    """Parse per-product and per-stage task limits
+
+    Parameters
+    ---------
+        jobs_str: string
+            comma separated list of 'product=n' or 'product:stage=n',
+                e.g. 'snodas=4,snodas:org=2,ndfd=6'
+
+    Returns
+    -------
+        jobs: dict
+            (product, stage) mapped to integer, stage is None for limits
+                applying to all stages of a product
+
+    """
+    jobs = {}
+    for item in [i.strip() for i in jobs_str.split(',') if i.strip()]:
+        name, n = item.split('=')
+        prod, sep, stage = name.strip().partition(':')
+        if sep and stage not in stage_pools:
+            raise ValueError("stage '{}' not supported".format(stage))
+        jobs[(prod, stage or None)] = max(int(n), 1)
+    return jobs
+
+def parse_timeouts(timeouts_str):
+    """Parse per-stage and per-product task wall-clock limits
+
+    Parameters
+    ---------
+        timeouts_str: string
+            comma separated list of 'stage=s' or 'product:stage=s',
+                e.g. 'download=1800,org=3600,swann:batch=14400', 0 for no
+                limit
+
+    Returns
+    -------
+        timeouts: dict
+            (product, stage) mapped to seconds or None, product is None for
+                limits applying to all products
+
+    """
+    timeouts = {}
+    for item in [i.strip() for i in timeouts_str.split(',') if i.strip()]:
+        name, secs = item.split('=')
+        prod, sep, stage = name.strip().partition(':')
+        if not sep:
+            prod, stage = None, prod
+        if stage not in stage_pools:
+            raise ValueError("stage '{}' not supported".format(stage))
+        timeouts[(prod, stage)] = float(secs) if float(secs) > 0 else None
+    return timeouts
+
+def parse_backends(backend_str):
+    """Parse per-product organize backend
+
+    Parameters
+    ---------
+        backend_str: string
+            comma separated list of 'product=thread' or 'product=process'
+
+    Returns
+    -------
+        backends: dict
+            product mapped to 'thread' or 'process'
+
+    """
+    backends = {}
+    for item in [i.strip() for i in backend_str.split(',') if i.strip()]:
+        prod, backend = [s.strip() for s in item.split('=')]
+        if backend not in ('thread', 'process'):
+            raise ValueError("backend '{}' not supported".format(backend))
+        backends[prod] = backend
+    return backends
+
+def build_task_graph(cfg, date_list, prod_list, time_int):
+    """Build dependency graph of (product, date, stage) tasks
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        date_list: list of datetime dates
+            dates to retrieve data
+        prod_list: list of strings
+            products to retrieve
+        time_int: string
+            time interval, passed through to 'batch_swann'
+
+    Returns
+    -------
+        graph: dict
+            task key (product, date or parameter, stage) mapped to dict with
+                func: function to call
+                args: tuple of function arguments
+                deps: list of task keys that must finish first
+                basins: basin name mapped to dict with fingerprint, hash of
+                    task function, arguments, and config of the basin, and
+                    outputs, paths of the task outputs for the basin, '' for
+                    tasks that do not depend on the basins
+                unit_sys: unit system
+                outputs: list of paths of every task output, see
+                    'task_outputs', or None
+                ledger: True if task is tracked by the run ledger
+
+    Notes
+    -----
+    download -> org for daily products, organize functions compute zonal
+    statistics and write outputs. swann is added as a single batch task and
+    ndfd as one task per parameter as both download and organize in one call.
+    The swann batch is tracked by the run ledger with the outputs of every
+    date. ndfd and modis tasks always run as they are not tracked: ndfd
+    outputs are named by a forecast issue time not known before the
+    download and are replaced by each new forecast, and modis has no
+    organize step to check. Each organize task decodes its inputs once and writes outputs
+    for every basin in 'cfg.basin_cfgs'. Organize tasks are recorded in the
+    run ledger for each basin, so adding a basin only organizes the new
+    basin, see 'prune_task_graph'. Downloads are recorded once for all basins
+    and their fingerprint does not include the basins.
+
+    """
+    graph = {}
+    basin_fingerprints = [config_fingerprint(cfg, basin_cfg) for basin_cfg in cfg.basin_cfgs]
+
+    def add_task(key, func, args, deps = [], ledger_flag = True, date_strs = None):
+        args_str = json.dumps([a for a in args if a is not cfg], default=str)
+        basins = {}
+        outputs = None
+        if key[0] in prod_outputs and key[2] in ('org', 'batch'):
+            outputs = []
+            for basin_cfg, basin_fingerprint in zip(cfg.basin_cfgs, basin_fingerprints):
+                basin_str = os.path.splitext(os.path.basename(basin_cfg.basin_poly_path))[0]
+                basin_outputs = [path for date_str in date_strs or [key[1]]
+                                 for path in task_outputs(cfg, key[0], date_str, basin_cfg)]
+                basins[basin_str] = {'fingerprint': hashlib.sha1((basin_fingerprint + func.__name__ + args_str).encode()).hexdigest(),
+                                     'outputs': basin_outputs}
+                outputs.extend(basin_outputs)
+        else:
+            basins[''] = {'fingerprint': hashlib.sha1((func.__name__ + args_str).encode()).hexdigest(),
+                          'outputs': None}
+        graph[key] = {'func': func, 'args': args, 'deps': list(deps),
+                      'basins': basins, 'unit_sys': cfg.unit_sys,
+                      'outputs': outputs, 'ledger': ledger_flag}
+
+    for prod in prod_list:
+        if prod in prod_funcs:
+            download_func, org_func = prod_funcs[prod]
+            for date_dn in date_list:
+                date_str = date_dn.strftime('%Y%m%d')
+                # streamed snodas is downloaded and organized by one task
+                if prod == 'snodas' and getattr(cfg, 'snodas_stream', False):
+                    add_task((prod, date_str, 'org'), ingest_snodas, (cfg, date_dn))
+                    continue
+                key_dn = (prod, date_str, 'download')
+                add_task(key_dn, download_func, (cfg, date_dn), ledger_flag = org_func is not None)
+                if org_func is not None:
+                    add_task((prod, date_str, 'org'), org_func, (cfg, date_dn), [key_dn])
+        elif prod == 'swann':
+            # keyed by first date so batches for different date ranges can
+            # share a graph
+            if date_list:
+                add_task(('swann', date_list[0].strftime('%Y%m%d'), 'batch'), batch_swann, (cfg, date_list, time_int),
+                         date_strs = [date_dn.strftime('%Y%m%d') for date_dn in date_list])
+        elif prod == 'ndfd':
+            # forecast length hard-coded to 3 for now
+            for parameter in cfg.ndfd_parameters:
+                add_task(('ndfd', parameter, 'download'), download_ndfd, (parameter, 3, cfg.proj, cfg), ledger_flag = False)
+        else:
+            logger.error("build_task_graph: product '{}' not supported".format(prod))
+
+    logger.info("build_task_graph: {} tasks".format(len(graph)))
+    return graph
+
+class worker_lost(RuntimeError):
+    """Worker process of a 'supervised_pool' exited while running a task"""
+
+def supervised_worker(conn):
+    """Run tasks sent over a pipe until None is received, see 'supervised_pool'"""
+    while True:
+        try:
+            item = conn.recv()
+        except EOFError:
+            return
+        if item is None:
+            return
+        func, args = item
+        try:
+            result = (True, func(*args))
+        except BaseException as e:
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception as e:
+            # unpicklable result or exception
+            conn.send((False, RuntimeError(repr(result[1]))))
+
+class supervised_pool:
+    """Process pool whose stuck workers can be killed and replaced
+
+    Attributes
+    ----------
+        max_workers: integer
+            number of worker processes
+        stats: dict
+            tasks, killed and died counters
+
+    Notes
+    -----
+    Works like concurrent.futures.ProcessPoolExecutor for 'submit' and
+    'shutdown', but each worker runs one task at a time over its own pipe,
+    so 'kill' can end the worker running a given task without breaking the
+    pool. A replacement worker is started when the next task is dispatched.
+    A worker that dies, e.g. from a segfault in gdal, fails only its own
+    task. Workers are started with 'forkserver', or 'spawn' where it
+    is not available, never forked from the threads of the calling process,
+    so tasks and their arguments must be picklable.
+
+    """
+
+    def __init__(self, max_workers):
+        """ """
+        self.max_workers = max(max_workers, 1)
+        # workers are started while download threads hold locks, e.g. logging,
+        # sqlite, and requests pools, forked children could inherit them held
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            self.ctx = multiprocessing.get_context('forkserver')
+        else:
+            self.ctx = multiprocessing.get_context('spawn')
+        self.queue = collections.deque()
+        self.workers = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closing = False
+        self.stats = {'tasks': 0, 'killed': 0, 'died': 0}
+        self.thread = threading.Thread(target=self.dispatch, daemon=True)
+        self.thread.start()
+
+    def __str__(self):
+        """ """
+        return '<supervised_pool max_workers={}>'.format(self.max_workers)
+
+    def submit(self, func, *args):
+        """Queue func(*args), returns a concurrent.futures.Future"""
+        future = Future()
+        with self.lock:
+            self.queue.append((future, func, args))
+        self.wake.set()
+        return future
+
+    def kill(self, future):
+        """Kill the worker running the task of future, returns True if it was running"""
+        with self.lock:
+            for worker in self.workers:
+                if worker['future'] is future:
+                    worker['process'].kill()
+                    self.stats['killed'] += 1
+                    worker['killed'] = True
+                    return True
+            for item in list(self.queue):
+                if item[0] is future:
+                    self.queue.remove(item)
+                    future.cancel()
+        return False
+
+    def start_worker(self):
+        """Start a worker process"""
+        conn, conn_worker = self.ctx.Pipe()
+        process = self.ctx.Process(target=supervised_worker, args=(conn_worker,), daemon=True)
+        process.start()
+        conn_worker.close()
+        worker = {'process': process, 'conn': conn, 'future': None, 'killed': False}
+        self.workers.append(worker)
+        return worker
+
+    def dispatch(self):
+        """Hand queued tasks to idle workers and collect results"""
+        while True:
+            with self.lock:
+                if self.closing and not self.queue and all(w['future'] is None for w in self.workers):
+                    break
+                for worker in self.workers:
+                    if worker['future'] is None and self.queue:
+                        future, func, args = self.queue.popleft()
+                        if future.set_running_or_notify_cancel():
+                            worker['future'] = future
+                            worker['conn'].send((func, args))
+                            self.stats['tasks'] += 1
+                while self.queue and len(self.workers) < self.max_workers:
+                    future, func, args = self.queue.popleft()
+                    if future.set_running_or_notify_cancel():
+                        worker = self.start_worker()
+                        worker['future'] = future
+                        worker['conn'].send((func, args))
+                        self.stats['tasks'] += 1
+                busy = [w for w in self.workers if w['future'] is not None]
+            if not busy:
+                self.wake.wait(0.5)
+                self.wake.clear()
+                continue
+            ready = multiprocessing.connection.wait([w['conn'] for w in busy], timeout=0.2)
+            with self.lock:
+                for worker in busy:
+                    if worker['conn'] not in ready and worker['process'].is_alive():
+                        continue
+                    future = worker['future']
+                    try:
+                        ok, result = worker['conn'].recv()
+                    except (EOFError, OSError):
+                        if worker['killed']:
+                            error = TimeoutError("worker killed by supervisor")
+                        else:
+                            self.stats['died'] += 1
+                            worker['process'].join(5)
+                            error = worker_lost("worker process exited with code {}".format(
+                                worker['process'].exitcode))
+                        ok, result = False, error
+                        worker['conn'].close()
+                        self.workers.remove(worker)
+                    worker['future'] = None
+                    if ok:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(result)
+        for worker in self.workers:
+            try:
+                worker['conn'].send(None)
+            except OSError:
+                pass
+            worker['process'].join(5)
+
+    def shutdown(self, wait = True, cancel_futures = False):
+        """Finish queued tasks and stop the workers, queued tasks are dropped with cancel_futures"""
+        if cancel_futures:
+            with self.lock:
+                while self.queue:
+                    self.queue.popleft()[0].cancel()
+        self.closing = True
+        self.wake.set()
+        if wait:
+            self.thread.join()
+
+def shutdown_pool(pool):
+    """Shut down an executor, without waiting for tasks abandoned by 'run_task_graph'
+
+    a thread running an abandoned task can not be stopped, waiting for it
+    would hold the caller until the task's own timeouts expire
+    """
+    if getattr(pool, 'abandoned', False):
+        pool.shutdown(wait=False, cancel_futures=True)
+    else:
+        pool.shutdown()
+
+def renew_pools(pools, n_io, n_cpu):
+    """Replace long lived pools holding tasks abandoned by 'run_task_graph', see 'shutdown_pool'"""
+    for name, pool in list(pools.items()):
+        if getattr(pool, 'abandoned', False):
+            logger.warning("renew_pools: replacing {} pool with abandoned tasks".format(name))
+            shutdown_pool(pool)
+            if isinstance(pool, supervised_pool):
+                pools[name] = supervised_pool(max(n_cpu, 1))
+            else:
+                pools[name] = ThreadPoolExecutor(max_workers=max(n_io, 1))
+
+def run_task_graph(graph, n_io = 6, n_cpu = None, max_prefetch = 4, dir_work = None, min_free_gb = 1.0, ledger = None, pools = None, jobs = None, backends = None,
+                   timeouts = None, attempts = 1, backoff_s = 60.0):
+    """Run tasks in graph as soon as their dependencies finish
+
+    Parameters
+    ---------
+        graph: dict
+            task graph from 'build_task_graph'
+        n_io: integer
+            number of threads for download tasks
+        n_cpu: integer
+            number of processes for organize tasks
+                Default - None, number of cpus
+        max_prefetch: integer
+            maximum number of downloads per product that are running or
+                waiting to be organized
+        dir_work: string
+            working directory, downloads are held while free space is below
+                'min_free_gb'
+                Default - None, free space not checked
+        min_free_gb: float
+            free space in GB required in 'dir_work' to start a download
+        ledger: run_ledger
+            ledger to record task status in
+                Default - None, status not recorded
+        pools: dict
+            'io' and 'cpu' executors to reuse, left running on return
+                Default - None, pools sized by 'n_io' and 'n_cpu' are created
+                and shut down on return
+        jobs: dict
+            (product, stage) or (product, None) mapped to number of tasks
+                allowed to run at once, see 'parse_jobs'
+                Default - None, 'prod_jobs' used
+        backends: dict
+            product mapped to 'thread' or 'process', backend used for its
+                organize tasks
+                Default - None, 'process'
+        timeouts: dict
+            (product, stage) or (None, stage) mapped to wall-clock limit in
+                seconds, see 'parse_timeouts'
+                Default - None, no limits
+        attempts: integer
+            times a task that timed out or lost its worker is run before it
+                fails
+        backoff_s: float
+            seconds before a timed out task is run again, doubled for each
+                attempt
+
+    Returns
+    -------
+        status: dict
+            task key mapped to 'done', 'failed', or 'skipped'
+
+    Notes
+    -----
+    Downloads run in a thread pool while organize tasks run in a process
+    pool so the network and cpu are kept busy at the same time. Products
+    with a 'thread' backend organize in a separate thread pool of 'n_cpu'
+    threads instead. Tasks from different products run concurrently, the
+    number of tasks running at once for a single product and stage is
+    limited by 'jobs', then 'prod_jobs' (1 if not listed). Tasks depending
+    on a failed task are skipped. A task that
+    finishes without writing every one of its outputs has failed. When 'dir_work' is given, tasks hold a lock file in
+    'dir_work/locks/' while running, see 'run_single_flight'.
+
+    Tasks running longer than their stage limit in 'timeouts' are stopped.
+    Organize processes run in a 'supervised_pool', so the stuck worker is
+    killed and replaced. Threads cannot be killed, so a stuck download is
+    abandoned and its thread ends when its own transfer timeouts expire,
+    pools holding abandoned tasks are not waited for, see 'shutdown_pool'.
+    Stopped tasks, and tasks whose worker process died, are queued again
+    after 'backoff_s' until 'attempts' runs are used.
+
+    """
+    if n_cpu is None:
+        n_cpu = os.cpu_count() or 1
+    jobs = jobs or {}
+    backends = backends or {}
+    timeouts = timeouts or {}
+
+    def task_timeout(key):
+        if (key[0], key[2]) in timeouts:
+            return timeouts[(key[0], key[2])]
+        return timeouts.get((None, key[2]))
+
+    def task_limit(key):
+        if (key[0], key[2]) in jobs:
+            return jobs[(key[0], key[2])]
+        return jobs.get((key[0], None), prod_jobs.get(key[0], 1))
+
+    def task_pool(key):
+        pool = stage_pools.get(key[2], 'io')
+        if pool == 'cpu' and backends.get(key[0]) == 'thread':
+            pool = 'cpu_thread'
+        return pool
+
+    status = {}
+    pending = dict(graph)
+    running = {}
+    prod_running = {}
+    started = {}
+    abandoned = set()
+    n_attempts = {}
+    not_before = {}
+
+    # downloads hold a prefetch slot until the tasks depending on them finish
+    dependents = {}
+    for key, task in graph.items():
+        for dep in task['deps']:
+            dependents.setdefault(dep, []).append(key)
+    held = {}
+
+    def release_held():
+        for key in list(held):
+            if key in status and all(d in status for d in dependents[key]):
+                del held[key]
+
+    def disk_full():
+        if dir_work is None or not os.path.isdir(dir_work):
+            return False
+        free_gb = shutil.disk_usage(dir_work).free / 1024**3
+        return free_gb < min_free_gb
+
+    # pools are created when first needed, only pools created here are
+    # shut down on return
+    pools = dict(pools or {})
+    own_pools = {}
+
+    def get_pool(pool):
+        if pool not in pools:
+            if pool == 'cpu':
+                pools[pool] = supervised_pool(max(n_cpu, 1))
+            elif pool == 'cpu_thread':
+                pools[pool] = ThreadPoolExecutor(max_workers=max(n_cpu, 1))
+            else:
+                pools[pool] = ThreadPoolExecutor(max_workers=max(n_io, 1))
+            own_pools[pool] = pools[pool]
+        return pools[pool]
+
+    try:
+        while pending or running:
+            # skip tasks that depend on failed tasks
+            skip_flag = True
+            while skip_flag:
+                skip_flag = False
+                for key in list(pending):
+                    if any(status.get(dep) in ('failed', 'skipped') for dep in pending[key]['deps']):
+                        status[key] = 'skipped'
+                        del pending[key]
+                        skip_flag = True
+                        logger.info("run_task_graph: skipping {}".format(key))
+            release_held()
+
+            # launch tasks with all dependencies done
+            disk_flag = None
+            for key in list(pending):
+                task = pending[key]
+                prod = key[0]
+                if prod_running.get((prod, key[2]), 0) >= task_limit(key):
+                    continue
+                if not_before.get(key, 0) > time.time():
+                    continue
+                if not all(status.get(dep) == 'done' for dep in task['deps']):
+                    continue
+                # back-pressure on downloads
+                if key in dependents:
+                    if sum(1 for k in held if k[0] == prod) >= max_prefetch:
+                        continue
+                    if disk_flag is None:
+                        disk_flag = disk_full()
+                    if disk_flag and running:
+                        continue
+                    held[key] = prod
+                logger.info("run_task_graph: starting {}".format(key))
+                if ledger is not None and task['ledger']:
+                    ledger.start(key, task)
+                if dir_work is not None:
+                    # other shread processes running the same task wait for this one
+                    future = get_pool(task_pool(key)).submit(run_single_flight, task_lock_path(dir_work, key),
+                                                             task['outputs'], task['func'], *task['args'])
+                else:
+                    future = get_pool(task_pool(key)).submit(task['func'], *task['args'])
+                running[future] = key
+                started[future] = time.time()
+                n_attempts[key] = n_attempts.get(key, 0) + 1
+                prod_running[(prod, key[2])] = prod_running.get((prod, key[2]), 0) + 1
+                del pending[key]
+
+            if not running:
+                # wait out the backoff of queued again tasks
+                retry_times = [not_before[key] for key in pending if not_before.get(key, 0) > time.time()]
+                if retry_times:
+                    time.sleep(max(min(retry_times) - time.time(), 0))
+                    continue
+                for key in pending:
+                    status[key] = 'skipped'
+                    logger.error("run_task_graph: unable to start {}".format(key))
+                break
+
+            # wait for a task to finish, a time limit to pass, or a backoff to end
+            now = time.time()
+            wake_times = [t for t in not_before.values() if t > now]
+            for future, key in running.items():
+                # time limits count from when a worker picks the task up
+                if not future.running() and not future.done():
+                    started[future] = now
+                if task_timeout(key) is not None:
+                    wake_times.append(started[future] + task_timeout(key))
+            wait_s = max(min(wake_times) - now, 0.1) if wake_times else None
+            done, not_done = wait(list(running), timeout=wait_s, return_when=FIRST_COMPLETED)
+            done = set(done)
+
+            # stop tasks over their time limit
+            now = time.time()
+            for future in not_done:
+                key = running[future]
+                limit = task_timeout(key)
+                if limit is None or now - started[future] < limit or future in abandoned:
+                    continue
+                if not future.running():
+                    started[future] = now
+                    continue
+                logger.error("run_task_graph: {} running longer than {} s, stopping".format(key, limit))
+                pool = pools[task_pool(key)]
+                if isinstance(pool, supervised_pool) and pool.kill(future):
+                    # future finishes with TimeoutError once the worker is gone
+                    continue
+                abandoned.add(future)
+                # the pool is not waited for on shutdown, see 'shutdown_pool'
+                pool.abandoned = True
+                done.add(future)
+
+            for future in done:
+                key = running.pop(future)
+                started.pop(future)
+                prod_running[(key[0], key[2])] -= 1
+                task = graph[key]
+                outputs = []
+                error = None
+                retry_flag = False
+                try:
+                    if future in abandoned:
+                        raise TimeoutError("abandoned after {} s".format(task_timeout(key)))
+                    future.result()
+                    outputs = [path for path in task['outputs'] or [] if os.path.isfile(path)]
+                    missing = [path for path in task['outputs'] or [] if not os.path.isfile(path)]
+                    if missing:
+                        error = "{} of {} outputs missing, {}".format(len(missing), len(task['outputs']), missing[0])
+                except (TimeoutError, worker_lost) as e:
+                    error = str(e)
+                    retry_flag = True
+                except Exception as e:
+                    error = str(e)
+                if retry_flag and n_attempts[key] < attempts:
+                    backoff = backoff_s * 2 ** (n_attempts[key] - 1)
+                    not_before[key] = time.time() + backoff
+                    pending[key] = task
+                    held.pop(key, None)
+                    logger.warning("run_task_graph: {} {}, running again in {:.0f} s".format(key, error, backoff))
+                    if ledger is not None and task['ledger']:
+                        ledger.finish(key, task, 'failed', outputs, error)
+                    continue
+                if error is None:
+                    status[key] = 'done'
+                    logger.info("run_task_graph: finished {}".format(key))
+                else:
+                    status[key] = 'failed'
+                    logger.error("run_task_graph: error running {}".format(key))
+                    logger.error(error)
+                if ledger is not None and task['ledger']:
+                    ledger.finish(key, task, status[key], outputs, error)
+    finally:
+        for pool in own_pools.values():
+            shutdown_pool(pool)
+
+    return status
+
+@contextlib.contextmanager
+def task_scratch_dir(cfg, prod, tag):
+    """Create a scratch directory used by a single task, removed on exit
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        prod: string
+            product name
+        tag: string
+            task identifier, date or parameter
+
+    Returns
+    -------
+        dir_scratch: string
+            scratch directory path, ending in '/'
+
+    Notes
+    -----
+    Scratch directories are created in 'dir_work/scratch/' so tasks running
+    at the same time never see or remove each other's intermediate files.
+
+    """
+    dir_work_scratch = cfg.dir_work + 'scratch/'
+    os.makedirs(dir_work_scratch, exist_ok=True)
+    dir_scratch = tempfile.mkdtemp(prefix=prod + '_' + tag + '_', dir=dir_work_scratch) + '/'
+    logger.info("task_scratch_dir: creating {}".format(dir_scratch))
+    try:
+        yield dir_scratch
+    finally:
+        shutil.rmtree(dir_scratch, ignore_errors=True)
+        logger.info("task_scratch_dir: removing {}".format(dir_scratch))
+
+class file_lock:
+    """Cross-process lock held by creating a lock file
+
+    Attributes
+    ----------
+        lock_path: string
+            lock file path
+        stale_s: float
+            seconds without a heartbeat after which a lock is broken
+        poll_s: float
+            seconds between attempts while waiting
+        waited: boolean
+            True if the lock was held by someone else when first tried
+
+    Notes
+    -----
+    The lock file is created with os.O_CREAT | os.O_EXCL, which is atomic on
+    local and network filesystems and on Windows, and holds the host, pid,
+    and time of the holder. A heartbeat thread touches the file every
+    'stale_s' / 3 seconds while the lock is held, so long decodes are not
+    mistaken for crashed holders. A lock is broken when its file has not
+    been touched for 'stale_s' seconds, or when the holder was on this host
+    and its pid is gone (pids are not checked on Windows, where os.kill
+    would end the process). A stale lock is broken by renaming it to a
+    name unique to the waiter, so only one waiter can break it. The renamed
+    file is checked again and put back if it was touched or replaced after
+    it was found stale. A holder only removes its own lock file on release.
+
+    """
+
+    def __init__(self, lock_path, stale_s = 300, poll_s = 1.0):
+        """ """
+        self.lock_path = lock_path
+        self.stale_s = stale_s
+        self.poll_s = poll_s
+        self.waited = False
+        self.stop = None
+        self.inode = None
+
+    def __str__(self):
+        """ """
+        return '<file_lock {}>'.format(self.lock_path)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self):
+        """Wait for and take the lock"""
+        dir_lock = os.path.dirname(self.lock_path)
+        if dir_lock and not os.path.isdir(dir_lock):
+            os.makedirs(dir_lock, exist_ok=True)
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except (FileExistsError, PermissionError):
+                if not self.waited:
+                    logger.info("file_lock: waiting for {}".format(self.lock_path))
+                self.waited = True
+                stale_id = self.is_stale()
+                if stale_id is not None:
+                    self.break_stale(stale_id)
+                    continue
+                time.sleep(self.poll_s)
+        self.inode = os.fstat(fd).st_ino
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'host': socket.gethostname(), 'pid': os.getpid(),
+                       'acquired': dt.datetime.now().isoformat(timespec='seconds')}, f)
+        self.stop = threading.Event()
+        threading.Thread(target=self.heartbeat, args=(self.stop,), daemon=True).start()
+
+    def heartbeat(self, stop):
+        """Touch the lock file until released"""
+        while not stop.wait(self.stale_s / 3):
+            try:
+                os.utime(self.lock_path)
+            except OSError:
+                return
+
+    def file_id(self, path):
+        """Return (inode, mtime) identifying a lock file and its last heartbeat"""
+        stat = os.stat(path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def is_stale(self):
+        """Return the 'file_id' of the lock file if it was left by a holder that is gone, else None"""
+        try:
+            stale_id = self.file_id(self.lock_path)
+        except OSError:
+            return None
+        # checked first so a file left empty by a holder that died before
+        # writing it is still broken
+        if time.time() - stale_id[1] / 1e9 > self.stale_s:
+            return stale_id
+        try:
+            with open(self.lock_path) as f:
+                holder = json.load(f)
+        except (OSError, ValueError):
+            # holder is still writing the file
+            return None
+        if os.name == 'posix' and holder.get('host') == socket.gethostname():
+            try:
+                os.kill(holder['pid'], 0)
+            except ProcessLookupError:
+                return stale_id
+            except (OSError, KeyError, TypeError):
+                pass
+        return None
+
+    def break_stale(self, stale_id):
+        """Remove the stale lock file identified by stale_id, see 'is_stale'"""
+        broken_path = '{}.{}.{}.{}.broken'.format(self.lock_path, socket.gethostname(), os.getpid(),
+                                                  threading.get_ident())
+        try:
+            os.rename(self.lock_path, broken_path)
+        except OSError:
+            # another waiter broke it first
+            return
+        try:
+            broken_flag = self.file_id(broken_path) == stale_id
+        except OSError:
+            return
+        if broken_flag:
+            logger.warning("file_lock: breaking stale lock {}".format(self.lock_path))
+        else:
+            # touched or taken again since it was found stale, put it back
+            # unless a new lock was created meanwhile
+            try:
+                os.link(broken_path, self.lock_path)
+            except OSError:
+                pass
+        try:
+            os.remove(broken_path)
+        except OSError:
+            pass
+
+    def release(self):
+        """Remove the lock file, unless it was broken and is now held by someone else"""
+        if self.stop is not None:
+            self.stop.set()
+            self.stop = None
+        try:
+            if os.stat(self.lock_path).st_ino == self.inode:
+                os.remove(self.lock_path)
+            else:
+                logger.warning("file_lock: {} was broken while held".format(self.lock_path))
+        except FileNotFoundError:
+            pass
+        self.inode = None
+
+def task_lock_path(dir_work, key):
+    """Return lock file path shared by all processes running task key, see 'run_single_flight'"""
+    name = '_'.join(str(k) for k in key[:3])
+    name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+    return os.path.join(dir_work, 'locks', name + '.lock')
+
+def run_single_flight(lock_path, outputs, func, *args):
+    """Run a task while holding its lock file
+
+    Parameters
+    ---------
+        lock_path: string
+            lock file shared by processes running the same task
+        outputs: list of strings
+            output paths of the task, or None
+        func: function
+            task function
+        *args:
+            task function arguments
+
+    Returns
+    -------
+        result of func, None if outputs written by another process were reused
+
+    Notes
+    -----
+    Lets overlapping runs against the same working directory share work.
+    A second process starting the same download or organize task waits for
+    the first. Downloads then find the files already in place, and organize
+    tasks with every output written while waiting are not run again.
+
+    """
+    waiting = time.time()
+    with file_lock(lock_path) as lock:
+        if lock.waited and outputs:
+            reuse_flag = True
+            for path in outputs:
+                if not os.path.isfile(path) or os.path.getmtime(path) < waiting - 1:
+                    reuse_flag = False
+            if reuse_flag:
+                logger.info("run_single_flight: reusing outputs written while waiting for {}".format(lock_path))
+                return None
+        return func(*args)
+
+def config_fingerprint(cfg, basin_cfg = None):
+    """Hash config settings that change organized outputs
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        basin_cfg ():
+            config_params Class object of one basin
+                Default - None, all basins in 'cfg.basin_cfgs'
+
+    Returns
+    -------
+        fingerprint: string
+            sha1 hex digest
+
+    Notes
+    -----
+    Includes size and modification time of basin files so editing a basin
+    makes previous outputs stale. With basin_cfg only that basin is included,
+    so adding or editing other basins does not change the fingerprint.
+
+    """
+    basin_files = []
+    basin_paths = []
+    for basin_cfg_i in [basin_cfg] if basin_cfg is not None else getattr(cfg, 'basin_cfgs', [cfg]):
+        basin_paths.extend([basin_cfg_i.basin_poly_path, basin_cfg_i.basin_points_path])
+    for path in basin_paths:
+        try:
+            path_stat = os.stat(path)
+            basin_files.append([path, path_stat.st_size, int(path_stat.st_mtime)])
+        except OSError:
+            basin_files.append([path, None, None])
+    dir_db = basin_cfg.dir_db if basin_cfg is not None else cfg.dir_db
+    items = [cfg.proj, cfg.unit_sys, cfg.output_type, cfg.output_format, dir_db, basin_files]
+    # only added when changed so outputs from before 'vars_snodas' stay current
+    snodas_vars_cfg = getattr(cfg, 'snodas_vars', None)
+    if snodas_vars_cfg is not None and snodas_vars_cfg != parse_snodas_vars(snodas_vars_default):
+        items.append(snodas_vars_cfg)
+    return hashlib.sha1(json.dumps(items, default=str).encode()).hexdigest()
+
+class run_ledger:
+    """SQLite ledger of task status for incremental reruns
+
+    Attributes
+    ----------
+        ledger_path: string
+            file path of SQLite database
+
+    Notes
+    -----
+    One row per (product, date, stage, basin, unit_sys) with status
+    'running', 'done', or 'failed', task fingerprint, and output paths.
+    Organize tasks have a row for each basin, downloads a single row with
+    basin ''. Rows
+    left 'running' by a crashed run are rerun. Backfill chunks are recorded
+    in a separate table with days processed, bytes downloaded, and elapsed
+    seconds.
+
+    """
+
+    def __init__(self, ledger_path):
+        """ """
+        self.ledger_path = ledger_path
+        dir_ledger = os.path.dirname(ledger_path)
+        if dir_ledger and not os.path.isdir(dir_ledger):
+            os.makedirs(dir_ledger)
+        self.con = sqlite3.connect(ledger_path, timeout=60)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "product TEXT, date TEXT, stage TEXT, basin TEXT, unit_sys TEXT, "
+            "status TEXT, fingerprint TEXT, outputs TEXT, error TEXT, "
+            "started TEXT, finished TEXT, elapsed REAL, "
+            "PRIMARY KEY (product, date, stage, basin, unit_sys))")
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "product TEXT, chunk_start TEXT, chunk_end TEXT, basin TEXT, unit_sys TEXT, "
+            "status TEXT, days INTEGER, nbytes INTEGER, elapsed REAL, finished TEXT, "
+            "PRIMARY KEY (product, chunk_start, chunk_end, basin, unit_sys))")
+        self.con.commit()
+        self.started = {}
+
+    def __str__(self):
+        """ """
+        return '<run_ledger {}>'.format(self.ledger_path)
+
+    def load(self, prod_list):
+        """Read ledger rows for products
+
+        Parameters
+        ---------
+            prod_list: list of strings
+                products to read
+
+        Returns
+        -------
+            rows: dict
+                (product, date, stage, basin, unit_sys) mapped to dict with
+                    status, fingerprint, outputs
+
+        """
+        rows = {}
+        for prod in set(prod_list):
+            cur = self.con.execute(
+                "SELECT product, date, stage, basin, unit_sys, status, fingerprint, outputs "
+                "FROM tasks WHERE product = ?", (prod,))
+            for row in cur:
+                rows[row[0:5]] = {'status': row[5], 'fingerprint': row[6],
+                                  'outputs': json.loads(row[7] or '[]')}
+        return rows
+
+    def start(self, key, task):
+        """Record task as running for each of its basins"""
+        started = dt.datetime.now()
+        self.started[key] = started
+        self.con.executemany(
+            "INSERT OR REPLACE INTO tasks (product, date, stage, basin, unit_sys, "
+            "status, fingerprint, outputs, error, started, finished, elapsed) "
+            "VALUES (?, ?, ?, ?, ?, 'running', ?, NULL, NULL, ?, NULL, NULL)",
+            [key + (basin, task['unit_sys'], item['fingerprint'], started.isoformat())
+             for basin, item in task['basins'].items()])
+        self.con.commit()
+
+    def finish(self, key, task, status, outputs, error = None):
+        """Record task as done or failed with the outputs of each of its basins"""
+        finished = dt.datetime.now()
+        started = self.started.pop(key, finished)
+        rows = []
+        for basin, item in task['basins'].items():
+            basin_outputs = outputs if item['outputs'] is None else [p for p in outputs if p in item['outputs']]
+            rows.append((status, json.dumps(basin_outputs), error, finished.isoformat(),
+                         (finished - started).total_seconds()) + key + (basin, task['unit_sys']))
+        self.con.executemany(
+            "UPDATE tasks SET status = ?, outputs = ?, error = ?, finished = ?, elapsed = ? "
+            "WHERE product = ? AND date = ? AND stage = ? AND basin = ? AND unit_sys = ?", rows)
+        self.con.commit()
+
+    def chunk_status(self, prod, chunk_start, chunk_end, basin, unit_sys):
+        """Return status of a backfill chunk, None if not run"""
+        row = self.con.execute(
+            "SELECT status FROM chunks WHERE product = ? AND chunk_start = ? "
+            "AND chunk_end = ? AND basin = ? AND unit_sys = ?",
+            (prod, chunk_start, chunk_end, basin, unit_sys)).fetchone()
+        return row[0] if row else None
+
+    def finish_chunk(self, prod, chunk_start, chunk_end, basin, unit_sys, status, days, nbytes, elapsed):
+        """Record backfill chunk as done or failed, adding to its throughput
+        from previous attempts"""
+        self.con.execute(
+            "INSERT INTO chunks (product, chunk_start, chunk_end, basin, unit_sys, "
+            "status, days, nbytes, elapsed, finished) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (product, chunk_start, chunk_end, basin, unit_sys) DO UPDATE SET "
+            "status = excluded.status, days = days + excluded.days, nbytes = nbytes + excluded.nbytes, "
+            "elapsed = elapsed + excluded.elapsed, finished = excluded.finished",
+            (prod, chunk_start, chunk_end, basin, unit_sys, status, days, nbytes,
+             elapsed, dt.datetime.now().isoformat()))
+        self.con.commit()
+
+    def throughput(self, prod):
+        """Return total days, bytes, and elapsed seconds of backfill chunks
+        for product"""
+        row = self.con.execute(
+            "SELECT SUM(days), SUM(nbytes), SUM(elapsed) FROM chunks "
+            "WHERE product = ? AND days > 0", (prod,)).fetchone()
+        return tuple(v or 0 for v in row)
+
+    def task_elapsed(self, prod):
+        """Return mean elapsed seconds of done tasks for product by stage"""
+        cur = self.con.execute(
+            "SELECT stage, AVG(elapsed) FROM tasks WHERE product = ? AND status = 'done' "
+            "GROUP BY stage", (prod,))
+        return dict(cur.fetchall())
+
+    def close(self):
+        """ """
+        self.con.close()
+
+class work_queue:
+    """SQLite work queue of (product, date) items shared by workers
+
+    Attributes
+    ----------
+        queue_path: string
+            file path of SQLite database, on a filesystem shared by all
+            worker hosts
+        lease_s: integer
+            seconds a claimed item is leased to a worker before it can be
+            reclaimed
+        max_attempts: integer
+            number of claims before a failing item is marked 'failed'
+
+    Notes
+    -----
+    One row per (product, tag) with status 'queued', 'claimed', 'done', or
+    'failed', where tag is the date for daily products, the water year for
+    swann, and the parameter for ndfd. Claims are made in an immediate
+    transaction so each item goes to one worker. Workers renew the lease
+    of items they are working on, items with an expired lease were claimed
+    by a crashed worker and are claimed again. A rollback journal is used
+    instead of WAL as WAL does not work on network filesystems. Each call
+    opens its own connection so the queue can be used from several threads.
+
+    """
+
+    def __init__(self, queue_path, lease_s = 900, max_attempts = 3):
+        """ """
+        self.queue_path = queue_path
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        dir_queue = os.path.dirname(queue_path)
+        if dir_queue and not os.path.isdir(dir_queue):
+            os.makedirs(dir_queue)
+        with contextlib.closing(self.connect()) as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS queue ("
+                "product TEXT, tag TEXT, dates TEXT, status TEXT, worker TEXT, "
+                "lease_expires REAL, attempts INTEGER, error TEXT, updated TEXT, "
+                "PRIMARY KEY (product, tag))")
+            con.commit()
+
+    def __str__(self):
+        """ """
+        return '<work_queue {}>'.format(self.queue_path)
+
+    def connect(self):
+        """Open a connection to the queue database"""
+        con = sqlite3.connect(self.queue_path, timeout=120, isolation_level=None)
+        con.execute("PRAGMA journal_mode=DELETE")
+        return con
+
+    def publish(self, items, force_flag = False):
+        """Add (product, tag, dates) items, items already queued are kept
+        unless force_flag is True
+
+        Returns
+        -------
+            n_new: integer
+                number of items added or requeued
+
+        """
+        verb = "INSERT OR REPLACE" if force_flag else "INSERT OR IGNORE"
+        n_new = 0
+        with contextlib.closing(self.connect()) as con:
+            con.execute("BEGIN IMMEDIATE")
+            for prod, tag, dates in items:
+                cur = con.execute(
+                    verb + " INTO queue (product, tag, dates, status, worker, lease_expires, "
+                    "attempts, error, updated) VALUES (?, ?, ?, 'queued', NULL, NULL, 0, NULL, ?)",
+                    (prod, tag, json.dumps(dates), dt.datetime.now().isoformat()))
+                n_new += cur.rowcount
+            con.execute("COMMIT")
+        return n_new
+
+    def claim(self, worker_id, n = 1):
+        """Claim up to n queued items or items with expired leases
+
+        Returns
+        -------
+            items: list of (product, tag, dates)
+
+        """
+        now = time.time()
+        with contextlib.closing(self.connect()) as con:
+            con.execute("BEGIN IMMEDIATE")
+            rows = con.execute(
+                "SELECT product, tag, dates FROM queue WHERE status = 'queued' "
+                "OR (status = 'claimed' AND lease_expires < ?) "
+                "ORDER BY tag, product LIMIT ?", (now, n)).fetchall()
+            for prod, tag, dates in rows:
+                con.execute(
+                    "UPDATE queue SET status = 'claimed', worker = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated = ? WHERE product = ? AND tag = ?",
+                    (worker_id, now + self.lease_s, dt.datetime.now().isoformat(), prod, tag))
+            con.execute("COMMIT")
+        return [(prod, tag, json.loads(dates)) for prod, tag, dates in rows]
+
+    def renew(self, worker_id, items):
+        """Extend the lease on items claimed by worker"""
+        with contextlib.closing(self.connect()) as con:
+            for prod, tag, dates in items:
+                con.execute(
+                    "UPDATE queue SET lease_expires = ? WHERE product = ? AND tag = ? "
+                    "AND worker = ? AND status = 'claimed'",
+                    (time.time() + self.lease_s, prod, tag, worker_id))
+
+    def ack(self, worker_id, item, status, error = None):
+        """Mark item done, or failed, requeuing it if it has attempts left"""
+        prod, tag, dates = item
+        with contextlib.closing(self.connect()) as con:
+            if status != 'done':
+                attempts = con.execute(
+                    "SELECT attempts FROM queue WHERE product = ? AND tag = ?", (prod, tag)).fetchone()
+                if attempts and attempts[0] < self.max_attempts:
+                    status = 'queued'
+            con.execute(
+                "UPDATE queue SET status = ?, error = ?, lease_expires = NULL, updated = ? "
+                "WHERE product = ? AND tag = ? AND worker = ?",
+                (status, error, dt.datetime.now().isoformat(), prod, tag, worker_id))
+
+    def counts(self):
+        """Return number of items for each status"""
+        with contextlib.closing(self.connect()) as con:
+            return dict(con.execute("SELECT status, COUNT(*) FROM queue GROUP BY status").fetchall())
+
+def prune_task_graph(graph, ledger):
+    """Remove tasks already completed according to the run ledger
+
+    Parameters
+    ---------
+        graph: dict
+            task graph from 'build_task_graph'
+        ledger: run_ledger
+            run ledger
+
+    Returns
+    -------
+        graph: dict
+            task graph with completed tasks removed
+
+    Notes
+    -----
+    A task with no dependents is complete if the ledger row of each of its
+    basins is 'done', its fingerprint matches, and its outputs still exist.
+    Organize tasks complete for some basins are kept for the other basins
+    only, see 'restrict_basins'. A task with dependents, such as a download,
+    is complete if all its dependents are complete. Failed, stale, and
+    interrupted ('running') tasks are kept.
+
+    """
+    rows = ledger.load([key[0] for key in graph])
+    dependents = {}
+    for key, task in graph.items():
+        for dep in task['deps']:
+            dependents.setdefault(dep, []).append(key)
+
+    checked = {}
+    basins_todo = {}
+
+    def is_complete(key):
+        if key in checked:
+            return checked[key]
+        task = graph[key]
+        if not task['ledger']:
+            checked[key] = False
+        elif key in dependents:
+            checked[key] = all(is_complete(d) for d in dependents[key])
+        else:
+            basins_todo[key] = []
+            for basin, item in task['basins'].items():
+                row = rows.get(key + (basin, task['unit_sys']))
+                if not (row is not None and row['status'] == 'done'
+                        and row['fingerprint'] == item['fingerprint']
+                        and all(os.path.isfile(path) for path in row['outputs'])):
+                    basins_todo[key].append(basin)
+            checked[key] = not basins_todo[key]
+        return checked[key]
+
+    complete = set(key for key in graph if is_complete(key))
+
+    graph_out = {}
+    for key, task in graph.items():
+        if key not in complete:
+            if len(basins_todo.get(key, task['basins'])) < len(task['basins']):
+                task = restrict_basins(task, basins_todo[key])
+            else:
+                task = dict(task)
+            task['deps'] = [d for d in task['deps'] if d not in complete]
+            graph_out[key] = task
+    logger.info("prune_task_graph: skipping {} completed tasks, {} tasks to run".format(len(complete), len(graph_out)))
+    return graph_out
+
+def restrict_basins(task, basin_list):
+    """Return a copy of an organize task that only writes outputs for the basins in basin_list"""
+    task = dict(task)
+    task['basins'] = {basin: item for basin, item in task['basins'].items() if basin in basin_list}
+    task['outputs'] = [path for item in task['basins'].values() for path in item['outputs']]
+    args = []
+    for arg in task['args']:
+        if isinstance(arg, config_params):
+            arg = copy.copy(arg)
+            arg.basin_cfgs = [basin_cfg for basin_cfg in arg.basin_cfgs
+                              if os.path.splitext(os.path.basename(basin_cfg.basin_poly_path))[0] in basin_list]
+        args.append(arg)
+    task['args'] = tuple(args)
+    logger.info("restrict_basins: organizing {}".format(','.join(basin_list)))
+    return task
+
+def split_date_list(date_list, chunk_str):
+    """Split sorted date list into water year or month chunks
+
+    Parameters
+    ---------
+        date_list: list of datetime dates
+            dates to retrieve data
+        chunk_str: string
+            Accepted:
+                - wy: water year (October - September)
+                - month: calendar month
+
+    Returns
+    -------
+        chunks: list of lists of datetime dates
+
+    """
+    if chunk_str == 'wy':
+        chunk_key = wyear_dt
+    elif chunk_str == 'month':
+        chunk_key = lambda date_dn: (date_dn.year, date_dn.month)
+    else:
+        raise ValueError("chunk '{}' not supported, use 'wy' or 'month'".format(chunk_str))
+    return [list(g) for k, g in itertools.groupby(date_list, key=chunk_key)]
+
+def format_throughput(days, nbytes, elapsed):
+    """Format days and bytes processed in elapsed seconds as rates per hour"""
+    hours = max(elapsed, 1.0) / 3600
+    return "{0} days, {1:.1f} MB in {2:.2f} h ({3:.1f} days/hour, {4:.1f} MB/hour)".format(
+        days, nbytes / 1024**2, hours, days / hours, nbytes / 1024**2 / hours)
+
+def run_backfill(cfg, date_list, prod_list, time_int, chunk_str, ledger, force_flag = False):
+    """Run a long date range as a sequence of checkpointed chunks
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        date_list: list of datetime dates
+            dates to retrieve data
+        prod_list: list of strings
+            products to retrieve
+        time_int: string
+            time interval, passed through to 'batch_swann'
+        chunk_str: string
+            chunk size, 'wy' or 'month', see 'split_date_list'
+        ledger: run_ledger
+            ledger used to checkpoint tasks and chunks
+        force_flag: boolean
+            True : rerun chunks and tasks completed by previous runs
+
+    Returns
+    -------
+        totals: dict
+            product mapped to [days, bytes] processed
+
+    Notes
+    -----
+    Each chunk is built into its own task graph and run with the bounded
+    pools of 'run_task_graph', so memory use and the tasks affected by a
+    failure are limited to one chunk. A product's chunk is checkpointed in
+    the ledger once all of its tasks finish, chunks already done are skipped
+    on rerun. A chunk with dates not yet posted, see 'prune_unavailable', is
+    recorded 'unavailable' and run again for those dates. Days/hour and MB/hour are logged for each product after each
+    chunk and for the whole backfill. ndfd is skipped as only the latest
+    forecast is available.
+
+    """
+    if 'ndfd' in prod_list:
+        logger.error("run_backfill: ndfd only provides the latest forecast, skipping")
+        prod_list = [prod for prod in prod_list if prod != 'ndfd']
+
+    basin_str = ','.join(os.path.splitext(os.path.basename(basin_cfg.basin_poly_path))[0] for basin_cfg in cfg.basin_cfgs)
+    chunks = split_date_list(date_list, chunk_str)
+    totals = {prod: [0, 0] for prod in prod_list}
+    backfill_start = time.time()
+
+    for chunk_num, chunk_dates in enumerate(chunks, 1):
+        chunk_start = chunk_dates[0].strftime('%Y%m%d')
+        chunk_end = chunk_dates[-1].strftime('%Y%m%d')
+
+        # skip products already completed for this chunk
+        chunk_prods = [prod for prod in prod_list if force_flag or
+                       ledger.chunk_status(prod, chunk_start, chunk_end, basin_str, cfg.unit_sys) != 'done']
+        if not chunk_prods:
+            logger.info("run_backfill: chunk {}/{} {}-{} already done".format(chunk_num, len(chunks), chunk_start, chunk_end))
+            continue
+        logger.info("run_backfill: chunk {}/{} {}-{} {}".format(chunk_num, len(chunks), chunk_start, chunk_end, ','.join(chunk_prods)))
+
+        graph = build_task_graph(cfg, chunk_dates, chunk_prods, time_int)
+        if not force_flag:
+            graph = prune_task_graph(graph, ledger)
+        graph_listed = graph
+        graph = prune_unavailable(cfg, graph)
+        pruned_prods = set(key[0] for key in graph_listed if key not in graph)
+        with download_bytes_lock:
+            bytes_start = dict(download_bytes)
+        chunk_time = time.time()
+        status = run_task_graph(graph, n_io=cfg.n_io, n_cpu=cfg.n_cpu, max_prefetch=cfg.max_prefetch,
+                                dir_work=cfg.dir_work, min_free_gb=cfg.min_free_gb, ledger=ledger,
+                                jobs=cfg.prod_jobs, backends=cfg.prod_backends,
+                                timeouts=cfg.stage_timeouts, attempts=cfg.task_attempts, backoff_s=cfg.retry_backoff_s)
+        elapsed = time.time() - chunk_time
+
+        # days are counted from the last task of each date, tasks pruned by
+        # the ledger were counted by the run that completed them
+        dep_keys = set(dep for task in graph.values() for dep in task['deps'])
+        for prod in chunk_prods:
+            days = 0
+            failed_flag = False
+            for key in graph:
+                if key[0] != prod:
+                    continue
+                if status.get(key) != 'done':
+                    failed_flag = True
+                elif key not in dep_keys:
+                    days += len(chunk_dates) if key[2] == 'batch' else 1
+            with download_bytes_lock:
+                nbytes = download_bytes.get(prod, 0) - bytes_start.get(prod, 0)
+            if failed_flag:
+                chunk_status = 'failed'
+            elif prod in pruned_prods:
+                # dates not posted yet, leave the chunk open so they are checked again
+                chunk_status = 'unavailable'
+            else:
+                chunk_status = 'done'
+            ledger.finish_chunk(prod, chunk_start, chunk_end, basin_str, cfg.unit_sys, chunk_status, days, nbytes, elapsed)
+            totals[prod][0] += days
+            totals[prod][1] += nbytes
+            logger.info("run_backfill: {} {}-{} {}: {}".format(prod, chunk_start, chunk_end, chunk_status,
+                        format_throughput(days, nbytes, elapsed)))
+
+    elapsed = time.time() - backfill_start
+    for prod in prod_list:
+        logger.info("run_backfill: {} total: {}".format(prod, format_throughput(totals[prod][0], totals[prod][1], elapsed)))
+    return totals
+
+def avail_snodas(cfg, date_dn):
+    """Check if snodas tar for date is posted on the FTP site"""
+    dir_ftp = urlparse(cfg.host_snodas).path.rstrip('/') + cfg.dir_ftp_snodas + date_dn.strftime('%Y') + "/" \
+    + date_dn.strftime('%m') + "_" + date_dn.strftime('%b') + '/'
+    zip_name = "SNODAS_" + ("{}.tar".format(date_dn.strftime('%Y%m%d')))
+    # always list again, the cached listing is what is being polled
+    if zip_name in get_snodas_pool(cfg).listing(dir_ftp, max_age=0):
+        return True
+    return None
+
+def avail_srpt(cfg, date_dn):
+    """Check if snow reporters kmz for date is posted on NOHRSC"""
+    kmz_srpt_url = cfg.host_nohrsc + cfg.dir_http_srpt + date_dn.strftime('%Y%m%d') + "/snow_reporters_" + date_dn.strftime('%Y%m%d') + ".kmz"
+    r = host_call(kmz_srpt_url, lambda: raise_for_throttle(requests.head(kmz_srpt_url, timeout=60)))
+    return True if r.status_code == 200 else None
+
+def avail_modscag(cfg, date_dn):
+    """Check if modscag directory for date is posted on JPL"""
+    site_url = cfg.host_jpl + cfg.dir_http_modscag + date_dn.strftime('%Y') + "/" + date_dn.strftime('%j')
+    session = get_jpl_session(cfg)
+    r = host_call(site_url, lambda: raise_for_throttle(session.get(site_url, timeout=60)), limit_max=cfg.host_limit)
+    return True if r.status_code == 200 else None
+
+def avail_moddrfs(cfg, date_dn):
+    """Check if moddrfs directory for date is posted on JPL"""
+    site_url = cfg.host_jpl + cfg.dir_http_moddrfs + date_dn.strftime('%Y') + "/" + date_dn.strftime('%j')
+    session = get_jpl_session(cfg)
+    r = host_call(site_url, lambda: raise_for_throttle(session.get(site_url, timeout=60)), limit_max=cfg.host_limit)
+    return True if r.status_code == 200 else None
+
+def avail_ndfd(cfg, parameter):
+    """Return Last-Modified header of the latest ndfd forecast for parameter,
+    a new value means a new forecast has been issued"""
+    grib_url = cfg.host_ndfd + 'VP.001-003/ds.' + parameter + '.bin'
+    r = host_call(grib_url, lambda: raise_for_throttle(requests.head(grib_url, timeout=60)))
+    if r.status_code != 200:
+        return None
+    return r.headers.get('Last-Modified', True)
+
+def list_snodas(cfg, scope):
+    """Return dates of snodas tars posted for a month scope 'YYYYMM'"""
+    month_dn = dt.datetime.strptime(scope, '%Y%m')
+    dir_ftp = urlparse(cfg.host_snodas).path.rstrip('/') + cfg.dir_ftp_snodas + month_dn.strftime('%Y') + "/" \
+    + month_dn.strftime('%m') + "_" + month_dn.strftime('%b') + '/'
+    names = get_snodas_pool(cfg).listing(dir_ftp, max_age=0)
+    return set(m.group(1) for m in [re.match(r'SNODAS_(\d{8})\.tar$', n) for n in names] if m)
+
+def list_http(url, pattern, cfg = None, session = None):
+    """Return first groups of pattern matches in an http directory listing, empty if not found,
+    other errors are raised so a failed listing is not indexed as empty"""
+    requester = session if session is not None else requests
+    r = host_call(url, lambda: raise_for_throttle(requester.get(url, timeout=60)),
+                  limit_max=getattr(cfg, 'host_limit', 8))
+    if r.status_code == 404:
+        return set()
+    r.raise_for_status()
+    return set(re.findall(pattern, r.text))
+
+def list_srpt(cfg, scope):
+    """Return dates of snow reporter directories posted on NOHRSC for a month scope 'YYYYMM'"""
+    dates = list_http(cfg.host_nohrsc + cfg.dir_http_srpt, r'href="(\d{8})/?"', cfg)
+    return set(d for d in dates if d.startswith(scope))
+
+def list_nsa(cfg, scope):
+    """Return dates of national snow analysis 24hr tifs posted for a month scope 'YYYYMM'"""
+    return list_http(cfg.host_nohrsc + cfg.dir_http_nsa + scope + '/', r'sfav2_CONUS_24h_(\d{8})00\.tif', cfg)
+
+def list_modscag(cfg, scope):
+    """Return dates of modscag day directories posted on JPL for a year scope 'YYYY'"""
+    days = list_http(cfg.host_jpl + cfg.dir_http_modscag + scope + '/', r'href="(\d{3})/?"', cfg,
+                     session=get_jpl_session(cfg))
+    return set(dt.datetime.strptime(scope + d, '%Y%j').strftime('%Y%m%d') for d in days)
+
+def list_moddrfs(cfg, scope):
+    """Return dates of moddrfs day directories posted on JPL for a year scope 'YYYY'"""
+    days = list_http(cfg.host_jpl + cfg.dir_http_moddrfs + scope + '/', r'href="(\d{3})/?"', cfg,
+                     session=get_jpl_session(cfg))
+    return set(dt.datetime.strptime(scope + d, '%Y%j').strftime('%Y%m%d') for d in days)
+
+def list_swann(cfg, scope):
+    """Return dates of swann data for a month scope 'YYYYMM', from the NSIDC
+    archive range in CMR and the real-time daily files posted by UA"""
+    month_start = dt.datetime.strptime(scope, '%Y%m')
+    month_end = (month_start + dt.timedelta(days=32)).replace(day=1) - dt.timedelta(days=1)
+    arc_start, arc_end = get_avail_index(cfg).collection_range('NSIDC-0719')
+    dates = set(d.strftime('%Y%m%d') for d in pd.date_range(max(month_start, arc_start), min(month_end, arc_end)))
+    if month_end > arc_end:
+        days = list_http(cfg.host_ua + cfg.dir_ftp_swann_rt + month_start.strftime('%Y/%m') + '/',
+                         r'href="(\d{2})\.nc"', cfg)
+        dates.update(scope + d for d in days)
+    return dates
+
+def scope_month(date_dn):
+    """Return month listing scope 'YYYYMM' and its last day"""
+    month_start = dt.datetime(date_dn.year, date_dn.month, 1)
+    return month_start.strftime('%Y%m'), (month_start + dt.timedelta(days=32)).replace(day=1) - dt.timedelta(days=1)
+
+def scope_year(date_dn):
+    """Return year listing scope 'YYYY' and its last day"""
+    return date_dn.strftime('%Y'), dt.datetime(date_dn.year, 12, 31)
+
+# bulk listings used by the availability index
+# product : [scope function, listing function]
+# a scope is one directory listing or query, the listing function returns
+# the 'YYYYMMDD' dates available in it
+prod_listings = {
+    'snodas': [scope_month, list_snodas],
+    'srpt': [scope_month, list_srpt],
+    'nsa': [scope_month, list_nsa],
+    'modscag': [scope_year, list_modscag],
+    'moddrfs': [scope_year, list_moddrfs],
+    'swann': [scope_month, list_swann],
+}
+
+class avail_index:
+    """SQLite index of dates available on the remote sources
+
+    Attributes
+    ----------
+        index_path: string
+            file path of SQLite database, shared with 'download_cache'
+        recent_days: integer
+            scopes ending fewer than this many days ago are listed again
+                after 'recent_ttl_s', older scopes are listed once
+        recent_ttl_s: float
+            seconds a listing of a recent scope is trusted
+        gap_ttl_s: float
+            seconds a listing of an older scope is trusted for dates it
+                does not contain
+
+    Notes
+    -----
+    Built from one bulk listing per scope, see 'prod_listings': a SNODAS
+    month directory, a JPL year directory, the NOHRSC listings, or the CMR
+    collection range plus UA real-time directory for SWANN. Dates missing
+    from a listed scope are gaps, so the scheduler can skip them without
+    probing each date. An older scope is listed again when a requested date
+    is missing from it and its listing is older than 'gap_ttl_s', so data
+    posted late is picked up. Failed listings are not indexed. CMR
+    collection ranges are kept for a day.
+
+    """
+
+    recent_days = 7
+    recent_ttl_s = 3600
+    gap_ttl_s = 86400
+
+    def __init__(self, index_path):
+        """ """
+        self.index_path = index_path
+        dir_index = os.path.dirname(index_path)
+        if dir_index and not os.path.isdir(dir_index):
+            os.makedirs(dir_index)
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(index_path, timeout=60, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS avail_scopes ("
+            "product TEXT, scope TEXT, checked REAL, PRIMARY KEY (product, scope))")
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS avail_dates ("
+            "product TEXT, date TEXT, scope TEXT, PRIMARY KEY (product, date))")
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS avail_ranges ("
+            "name TEXT PRIMARY KEY, time_start TEXT, time_end TEXT, checked REAL)")
+        self.con.commit()
+
+    def __str__(self):
+        """ """
+        return '<avail_index {}>'.format(self.index_path)
+
+    def scan(self, cfg, prod, scope, scope_end, refresh = False, wanted = None):
+        """List a scope if it is not indexed or its listing is out of date, returns its available dates
+
+        Dates in wanted that the indexed listing does not contain list the
+        scope again once the listing is older than 'gap_ttl_s'.
+        """
+        with self.lock:
+            row = self.con.execute("SELECT checked FROM avail_scopes WHERE product = ? AND scope = ?",
+                                   (prod, scope)).fetchone()
+        recent_flag = scope_end >= dt.datetime.today() - dt.timedelta(days=self.recent_days)
+        if row is not None and not refresh and wanted and time.time() - row[0] > self.gap_ttl_s:
+            with self.lock:
+                listed = set(r[0] for r in self.con.execute(
+                    "SELECT date FROM avail_dates WHERE product = ? AND scope = ?", (prod, scope)))
+            refresh = not set(wanted) <= listed
+            if not refresh:
+                return listed
+        if row is None or refresh or (recent_flag and time.time() - row[0] > self.recent_ttl_s):
+            dates = prod_listings[prod][1](cfg, scope)
+            logger.info("avail_index: {} {} lists {} dates".format(prod, scope, len(dates)))
+            with self.lock:
+                self.con.execute("DELETE FROM avail_dates WHERE product = ? AND scope = ?", (prod, scope))
+                self.con.executemany("INSERT OR REPLACE INTO avail_dates VALUES (?, ?, ?)",
+                                     [(prod, d, scope) for d in dates])
+                self.con.execute("INSERT OR REPLACE INTO avail_scopes VALUES (?, ?, ?)", (prod, scope, time.time()))
+                self.con.commit()
+            return dates
+        with self.lock:
+            return set(r[0] for r in self.con.execute(
+                "SELECT date FROM avail_dates WHERE product = ? AND scope = ?", (prod, scope)))
+
+    def available(self, cfg, prod, date_list, refresh = False):
+        """Return the 'YYYYMMDD' dates of date_list available for a product
+
+        Returns
+        -------
+            dates: set of strings, or None if the product has no listing
+
+        """
+        if prod not in prod_listings:
+            return None
+        scope_func = prod_listings[prod][0]
+        scopes = {}
+        for date_dn in date_list:
+            scope, scope_end = scope_func(date_dn)
+            scopes.setdefault(scope, [scope_end, set()])[1].add(date_dn.strftime('%Y%m%d'))
+        dates = set()
+        for scope, (scope_end, wanted) in sorted(scopes.items()):
+            dates.update(self.scan(cfg, prod, scope, scope_end, refresh, wanted) & wanted)
+        return dates
+
+    def latest(self, cfg, prod, lookback = 62):
+        """Return newest date available for a product within lookback days, or None"""
+        date_today = dt.datetime.combine(dt.date.today(), dt.time())
+        date_dn = date_today
+        while date_dn > date_today - dt.timedelta(days=lookback):
+            scope, scope_end = prod_listings[prod][0](date_dn)
+            scope_start = dt.datetime.strptime(scope, '%Y%m' if len(scope) == 6 else '%Y')
+            dates = [d for d in self.scan(cfg, prod, scope, scope_end) if d <= date_today.strftime('%Y%m%d')]
+            if dates:
+                return dt.datetime.strptime(max(dates), '%Y%m%d')
+            date_dn = scope_start - dt.timedelta(days=1)
+        return None
+
+    def collection_range(self, short_name, ttl_s = 86400):
+        """Return (start, end) datetimes of a CMR collection, queried at most once every ttl_s seconds"""
+        with self.lock:
+            row = self.con.execute("SELECT time_start, time_end, checked FROM avail_ranges WHERE name = ?",
+                                   (short_name,)).fetchone()
+        if row is not None and time.time() - row[2] < ttl_s:
+            return dt.datetime.strptime(row[0], '%Y-%m-%d'), dt.datetime.strptime(row[1], '%Y-%m-%d')
+        cmr_collections_url = 'https://cmr.earthdata.nasa.gov/search/collections.json'
+        params = {'short_name': short_name}
+        response = host_call(cmr_collections_url,
+                             lambda: raise_for_throttle(requests.get(cmr_collections_url, params=params, timeout=60)))
+        entry = json.loads(response.content)['feed']['entry'][0]
+        time_start = entry['time_start'][0:10]
+        time_end = entry['time_end'][0:10]
+        with self.lock:
+            self.con.execute("INSERT OR REPLACE INTO avail_ranges VALUES (?, ?, ?, ?)",
+                             (short_name, time_start, time_end, time.time()))
+            self.con.commit()
+        return dt.datetime.strptime(time_start, '%Y-%m-%d'), dt.datetime.strptime(time_end, '%Y-%m-%d')
+
+    def close(self):
+        """Close connection"""
+        self.con.close()
+
+# one availability index connection for each process, see 'get_avail_index'
+avail_indexes = {}
+avail_indexes_lock = threading.Lock()
+
+def get_avail_index(cfg):
+    """Return the availability index of this process, kept in 'cfg.cache_path'"""
+    index_path = getattr(cfg, 'cache_path', None) or cfg.dir_work + 'shread_cache.sqlite'
+    with avail_indexes_lock:
+        key = (os.getpid(), index_path)
+        if key not in avail_indexes:
+            avail_indexes[key] = avail_index(index_path)
+        return avail_indexes[key]
+
+def prune_unavailable(cfg, graph):
+    """Remove tasks for dates known to be missing on the remote sources
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        graph: dict
+            task graph from 'build_task_graph'
+
+    Returns
+    -------
+        graph: dict
+            task graph without the download and organize tasks of dates
+            missing from the availability index, see 'avail_index'
+
+    Notes
+    -----
+    Products without a listing in 'prod_listings', and products whose
+    listing fails, are left as they are. Pruned dates are not recorded in
+    the ledger, they are checked again on the next run.
+
+    """
+    index = get_avail_index(cfg)
+    remove = set()
+    for prod in sorted(set(key[0] for key in graph)):
+        keys = [key for key in graph if key[0] == prod and key[2] != 'batch']
+        if not keys:
+            continue
+        try:
+            dates = index.available(cfg, prod, [dt.datetime.strptime(key[1], '%Y%m%d') for key in keys])
+        except Exception as e:
+            logger.warning("prune_unavailable: could not list {}".format(prod))
+            logger.warning(e)
+            continue
+        if dates is None:
+            continue
+        missing = sorted(set(key[1] for key in keys) - dates)
+        if missing:
+            logger.info("prune_unavailable: {} not posted for {}".format(prod, ','.join(missing)))
+        remove.update(key for key in keys if key[1] not in dates)
+    return {key: task for key, task in graph.items() if key not in remove}
+
+def latest_dates(cfg, prod_list):
+    """Return the newest available date of each product, see 'avail_index.latest'
+
+    Returns
+    -------
+        latest: dict
+            product mapped to datetime, ndfd is always the latest forecast
+            and maps to today, products without a listing or with nothing
+            posted are left out
+
+    """
+    index = get_avail_index(cfg)
+    latest = {}
+    for prod in prod_list:
+        if prod == 'ndfd':
+            latest[prod] = dt.datetime.combine(dt.date.today(), dt.time())
+            continue
+        if prod not in prod_listings:
+            logger.error("latest_dates: no availability listing for '{}'".format(prod))
+            continue
+        try:
+            date_dn = index.latest(cfg, prod)
+        except Exception as e:
+            logger.error("latest_dates: error listing {}".format(prod))
+            logger.error(e)
+            continue
+        if date_dn is None:
+            logger.error("latest_dates: no {} data posted recently".format(prod))
+            continue
+        latest[prod] = date_dn
+        logger.info("latest_dates: latest {} is {}".format(prod, date_dn.strftime('%Y-%m-%d')))
+    return latest
+
+# availability checks used by daemon mode
+# product : [check function, minimum poll interval (s), maximum poll interval (s)]
+# the poll interval doubles from the minimum while data is late and resets
+# when new data is processed, products in 'prod_listings' are checked with
+# one listing of each scope per poll instead of the check function
+prod_avail = {
+    'snodas': [avail_snodas, 600, 3600],
+    'srpt': [avail_srpt, 600, 3600],
+    'modscag': [avail_modscag, 900, 7200],
+    'moddrfs': [avail_moddrfs, 900, 7200],
+    'ndfd': [avail_ndfd, 300, 3600],
+}
+
+# times daemon mode runs a date or ndfd parameter that keeps failing before
+# giving up on it until the daemon is restarted, each failure doubles the
+# wait before the next run starting from the minimum poll interval
+daemon_max_failures = 5
+
+def run_daemon(cfg, prod_list, ledger, lookback = 3):
+    """Poll sources for new data and process it as soon as it is posted
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        prod_list: list of strings
+            products to poll, must be in 'prod_avail'
+        ledger: run_ledger
+            ledger used to find dates still to be processed
+        lookback: integer
+            number of days, ending today, checked for missing data
+
+    Returns
+    -------
+        None
+
+    Notes
+    -----
+    Runs until interrupted. Config, basin geometries, and the worker pools
+    are created once and reused, so the imports and setup paid by each cron
+    run are paid once. Each product is polled on its own schedule from
+    'prod_avail', dates in the lookback window not yet done in the ledger
+    are checked and processed once posted. Products with a listing are
+    checked through the availability index, each scope is listed once per
+    poll, see 'avail_index'. ndfd parameters are processed whenever a new
+    forecast is issued. Dates that fail wait longer after each failure and
+    are given up after 'daemon_max_failures' runs.
+
+    """
+    for prod in prod_list:
+        if prod not in prod_avail:
+            logger.error("run_daemon: product '{}' not supported in daemon mode".format(prod))
+    prod_list = [prod for prod in prod_list if prod in prod_avail]
+
+    next_poll = {prod: 0.0 for prod in prod_list}
+    interval = {prod: prod_avail[prod][1] for prod in prod_list}
+    ndfd_issued = {}
+    # (product, tag) mapped to [failed runs, time of next run]
+    failures = {}
+
+    # worker pools are kept for the life of the daemon
+    pools = {
+        'io': ThreadPoolExecutor(max_workers=max(cfg.n_io, 1)),
+        'cpu': supervised_pool(max(cfg.n_cpu, 1)),
+    }
+    logger.info("run_daemon: polling {}".format(','.join(prod_list)))
+    try:
+        while prod_list:
+            for prod in prod_list:
+                if time.time() < next_poll[prod]:
+                    continue
+                avail_func, poll_min, poll_max = prod_avail[prod]
+                date_today = dt.datetime.combine(dt.date.today(), dt.time())
+                date_list = [date_today - dt.timedelta(days=i) for i in reversed(range(lookback))]
+                graph = build_task_graph(cfg, date_list, [prod], 'D')
+                if prod != 'ndfd':
+                    graph = prune_task_graph(graph, ledger)
+
+                # skip dates given up on or waiting after a failure
+                pending_flag = False
+                tags = []
+                for tag in sorted(set(key[1] for key in graph)):
+                    n_failed, retry_time = failures.get((prod, tag), [0, 0.0])
+                    if n_failed >= daemon_max_failures:
+                        continue
+                    if time.time() < retry_time:
+                        pending_flag = True
+                        continue
+                    tags.append(tag)
+
+                # one listing of each scope for all dates checked
+                listed = None
+                if prod in prod_listings and tags:
+                    try:
+                        listed = get_avail_index(cfg).available(
+                            cfg, prod, [dt.datetime.strptime(tag, '%Y%m%d') for tag in tags], refresh=True)
+                    except Exception as e:
+                        logger.error("run_daemon: error listing {}".format(prod))
+                        logger.error(e)
+                        listed = set()
+
+                # find tasks with new data posted
+                run_keys = []
+                for tag in tags:
+                    pending_flag = True
+                    try:
+                        if listed is not None:
+                            avail_flag = tag in listed
+                        elif prod == 'ndfd':
+                            issued = avail_func(cfg, tag)
+                            avail_flag = issued is not None and issued != ndfd_issued.get(tag)
+                        else:
+                            avail_flag = avail_func(cfg, dt.datetime.strptime(tag, '%Y%m%d')) is not None
+                    except Exception as e:
+                        logger.error("run_daemon: error checking {} {}".format(prod, tag))
+                        logger.error(e)
+                        avail_flag = False
+                    if avail_flag:
+                        run_keys.extend(key for key in graph if key[1] == tag)
+                        if prod == 'ndfd':
+                            ndfd_issued[tag] = issued
+
+                if run_keys:
+                    logger.info("run_daemon: new {} data for {}".format(prod, ','.join(sorted(set(key[1] for key in run_keys)))))
+                    run_graph = {key: graph[key] for key in run_keys}
+                    status = run_task_graph(run_graph, n_io=cfg.n_io, n_cpu=cfg.n_cpu, max_prefetch=cfg.max_prefetch,
+                                            dir_work=cfg.dir_work, min_free_gb=cfg.min_free_gb, ledger=ledger,
+                                            jobs=cfg.prod_jobs, backends=cfg.prod_backends, pools=pools,
+                                            timeouts=cfg.stage_timeouts, attempts=cfg.task_attempts, backoff_s=cfg.retry_backoff_s)
+                    renew_pools(pools, cfg.n_io, cfg.n_cpu)
+                    for tag in sorted(set(key[1] for key in run_keys)):
+                        if all(status.get(key) == 'done' for key in run_keys if key[1] == tag):
+                            failures.pop((prod, tag), None)
+                            continue
+                        n_failed = failures.get((prod, tag), [0, 0.0])[0] + 1
+                        failures[(prod, tag)] = [n_failed, time.time() + poll_min * 2 ** n_failed]
+                        if prod == 'ndfd':
+                            # run the forecast again even if no new one is issued
+                            ndfd_issued.pop(tag, None)
+                        if n_failed >= daemon_max_failures:
+                            logger.error("run_daemon: giving up on {} {} after {} failed runs".format(prod, tag, n_failed))
+                        else:
+                            logger.warning("run_daemon: {} {} failed, running again in {} s".format(
+                                prod, tag, poll_min * 2 ** n_failed))
+                    interval[prod] = poll_min
+                elif pending_flag:
+                    # data late, back off
+                    interval[prod] = min(interval[prod] * 2, poll_max)
+                else:
+                    interval[prod] = poll_max
+                next_poll[prod] = time.time() + interval[prod]
+                logger.info("run_daemon: next {} poll in {} s".format(prod, interval[prod]))
+
+            time.sleep(max(1.0, min(next_poll.values()) - time.time()))
+    except KeyboardInterrupt:
+        logger.info("run_daemon: stopping")
+    finally:
+        for pool in pools.values():
+            shutdown_pool(pool)
+
+def queue_items(cfg, date_list, prod_list):
+    """Split products and dates into work queue items
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        date_list: list of datetime dates
+            dates to retrieve data
+        prod_list: list of strings
+            products to retrieve
+
+    Returns
+    -------
+        items: list of (product, tag, dates)
+            one item per date for daily products, per water year for swann,
+            and per parameter for ndfd, dates in '%Y%m%d' format
+
+    """
+    items = []
+    for prod in prod_list:
+        if prod in prod_funcs:
+            for date_dn in date_list:
+                date_str = date_dn.strftime('%Y%m%d')
+                items.append((prod, date_str, [date_str]))
+        elif prod == 'swann':
+            for chunk_dates in split_date_list(date_list, 'wy'):
+                items.append((prod, 'WY{}'.format(wyear_dt(chunk_dates[0])),
+                              [date_dn.strftime('%Y%m%d') for date_dn in chunk_dates]))
+        elif prod == 'ndfd':
+            for parameter in cfg.ndfd_parameters:
+                items.append((prod, parameter, []))
+        else:
+            logger.error("queue_items: product '{}' not supported".format(prod))
+    return items
+
+def run_worker(cfg, queue, ledger, time_int, poll_s = 60):
+    """Claim and process work queue items until the queue is finished
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        queue: work_queue
+            shared work queue
+        ledger: run_ledger
+            ledger used to skip and record tasks
+        time_int: string
+            time interval, passed through to 'batch_swann'
+        poll_s: integer
+            seconds to wait when no items can be claimed
+
+    Returns
+    -------
+        None
+
+    Notes
+    -----
+    Any number of workers on any number of hosts can run against the same
+    queue. Each round claims up to 'cfg.n_cpu' items and runs them as one
+    task graph on pools kept for the life of the worker, renewing their
+    leases from a heartbeat thread. A worker exits once no items are queued
+    or claimed; while other workers hold claims it waits, as their leases
+    may expire and the items be reclaimed.
+
+    """
+    worker_id = "{}:{}".format(socket.gethostname(), os.getpid())
+    pools = {
+        'io': ThreadPoolExecutor(max_workers=max(cfg.n_io, 1)),
+        'cpu': supervised_pool(max(cfg.n_cpu, 1)),
+    }
+    logger.info("run_worker: {} working on {}".format(worker_id, queue.queue_path))
+    try:
+        while True:
+            items = queue.claim(worker_id, max(cfg.n_cpu, 1))
+            if not items:
+                counts = queue.counts()
+                if counts.get('queued', 0) + counts.get('claimed', 0) == 0:
+                    logger.info("run_worker: queue finished {}".format(counts))
+                    break
+                time.sleep(poll_s)
+                continue
+            logger.info("run_worker: claimed {}".format(', '.join("{} {}".format(i[0], i[1]) for i in items)))
+
+            # renew leases while the items are processed
+            stop_event = threading.Event()
+            def heartbeat():
+                while not stop_event.wait(queue.lease_s / 3):
+                    try:
+                        queue.renew(worker_id, items)
+                    except sqlite3.Error as e:
+                        logger.error("run_worker: error renewing lease")
+                        logger.error(e)
+            heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+            heartbeat_thread.start()
+
+            # one graph for all claimed items, keeping only each item's tasks
+            graph = {}
+            item_keys = []
+            for prod, tag, dates in items:
+                date_list = [dt.datetime.strptime(d, '%Y%m%d') for d in dates]
+                tags = set(dates + [tag])
+                item_graph = {key: task for key, task in build_task_graph(cfg, date_list, [prod], time_int).items()
+                              if key[1] in tags}
+                graph.update(item_graph)
+                item_keys.append(list(item_graph))
+            graph = prune_task_graph(graph, ledger)
+            try:
+                status = run_task_graph(graph, n_io=cfg.n_io, n_cpu=cfg.n_cpu, max_prefetch=cfg.max_prefetch,
+                                        dir_work=cfg.dir_work, min_free_gb=cfg.min_free_gb, ledger=ledger,
+                                        jobs=cfg.prod_jobs, backends=cfg.prod_backends, pools=pools,
+                                        timeouts=cfg.stage_timeouts, attempts=cfg.task_attempts, backoff_s=cfg.retry_backoff_s)
+            finally:
+                stop_event.set()
+                heartbeat_thread.join()
+                renew_pools(pools, cfg.n_io, cfg.n_cpu)
+
+            # tasks pruned by the ledger were done by a previous run
+            for item, keys in zip(items, item_keys):
+                failed_keys = [key for key in keys if key in graph and status.get(key) != 'done']
+                if failed_keys:
+                    queue.ack(worker_id, item, 'failed', "tasks not done: {}".format(failed_keys))
+                else:
+                    queue.ack(worker_id, item, 'done')
+    finally:
+        for pool in pools.values():
+            shutdown_pool(pool)
+
+# approximate size in bytes of one downloaded file, and of the scratch
+# directory of one organize task, used by the planner when the run ledger has
+# no throughput recorded for a product, snodas is decoded in memory and
+# writes no scratch files, see 'org_snodas'
+prod_file_bytes = {
+    'snodas': 12e6,
+    'srpt': 0.3e6,
+    'modscag': 3e6,
+    'moddrfs': 3e6,
+    'swann': 1.5e9,
+    'ndfd': 30e6,
+}
+prod_scratch_bytes = {
+    'snodas': 0,
+    'srpt': 5e6,
+    'modscag': 150e6,
+    'moddrfs': 150e6,
+    'swann': 100e6,
+    'ndfd': 200e6,
+}
+
+def remote_files(cfg, prod, date_list):
+    """List remote files downloaded for a product
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        prod: string
+            product
+        date_list: list of datetime dates
+            dates to retrieve data, not used for ndfd
+
+    Returns
+    -------
+        files: list of [tag, days, url, path]
+            tag is the date, year, or ndfd parameter the file is for, days
+            the number of requested dates it covers, and path the local
+            download path
+
+    Notes
+    -----
+    Mirrors the paths built by the download functions. modis is not
+    listed as its files are found by a CMR search. swann files are listed
+    from the archive, real-time files are used for dates past the archive.
+
+    """
+    files = []
+    if prod == 'snodas':
+        for date_dn in date_list:
+            zip_name = "SNODAS_" + ("{}.tar".format(date_dn.strftime('%Y%m%d')))
+            # same url as the download cache key of 'download_snodas'
+            zip_url = cfg.host_snodas.rstrip('/') + urlparse(cfg.host_snodas).path.rstrip('/') + cfg.dir_ftp_snodas \
+            + date_dn.strftime('%Y') + "/" + date_dn.strftime('%m') + "_" + date_dn.strftime('%b') + '/' + zip_name
+            files.append([date_dn.strftime('%Y%m%d'), 1, zip_url, cfg.dir_work + 'snodas/' + zip_name])
+    elif prod == 'srpt':
+        for date_dn in date_list:
+            kmz_srpt_name = "snow_reporters_" + date_dn.strftime('%Y%m%d') + ".kmz"
+            kmz_srpt_url = cfg.host_nohrsc + cfg.dir_http_srpt + date_dn.strftime('%Y%m%d') + "/" + kmz_srpt_name
+            files.append([date_dn.strftime('%Y%m%d'), 1, kmz_srpt_url, cfg.dir_work + 'srpt/' + kmz_srpt_name])
+    elif prod in ('modscag', 'moddrfs'):
+        dir_http = cfg.dir_http_modscag if prod == 'modscag' else cfg.dir_http_moddrfs
+        var_list = ['snow_fraction', 'vegetation_fraction'] if prod == 'modscag' else ['forcing', 'drfs.grnsz']
+        for date_dn in date_list:
+            site_url = cfg.host_jpl + dir_http + date_dn.strftime('%Y') + "/" + date_dn.strftime('%j')
+            for tile in cfg.singrd_tile_list:
+                for var in var_list:
+                    tif_name = "MOD09GA.A" + date_dn.strftime('%Y') + date_dn.strftime('%j') + "." + tile + ".006.NRT." + var + ".tif"
+                    files.append([date_dn.strftime('%Y%m%d'), 1, site_url + "/" + tif_name, cfg.dir_work + prod + '/' + tif_name])
+    elif prod == 'swann':
+        # archive files are downloaded for each calendar year, see 'batch_swann'
+        for year_dn in sorted(set(date_dn.strftime('%Y') for date_dn in date_list)):
+            nc_name = "4km_SWE_Depth_WY" + ("{}_v01.nc".format(year_dn))
+            days = len([date_dn for date_dn in date_list if wyear_dt(date_dn) == int(year_dn)])
+            files.append([year_dn, days, cfg.host_snodas + cfg.dir_ftp_swann_arc + nc_name, cfg.dir_work + 'swann/' + nc_name])
+    elif prod == 'ndfd':
+        # forecast length hard-coded to 3 days, one file per parameter
+        for parameter in cfg.ndfd_parameters:
+            files.append([parameter, 0, cfg.host_ndfd + 'VP.001-003/ds.' + parameter + '.bin', None])
+    return files
+
+def local_copy(cfg, prod, remote_file):
+    """Return the local path holding a remote file listed by 'remote_files', None if it has to be downloaded
+
+    Looks in the working directory, the download cache, and 'dir_arch'. A
+    snodas tar is not needed when its grids are kept in 'dir_dat_snodas'.
+    """
+    tag, days, url, path = remote_file
+    if path is None:
+        return None
+    if os.path.isfile(path):
+        return path
+    if prod == 'snodas' and getattr(cfg, 'dir_dat_snodas', None):
+        if len(snodas_dat_paths(cfg.dir_dat_snodas, tag, snodas_codes(cfg))) == len(cfg.snodas_vars):
+            return cfg.dir_dat_snodas
+    return get_download_cache(cfg).cached(url, [cfg.dir_arch + prod + '/' + os.path.basename(path)])
+
+def plan_run(cfg, date_list, prod_list, time_int, ledger, force_flag = False, plan_path = None):
+    """Report the files a run would download with byte, disk, and time estimates
+
+    Parameters
+    ---------
+        cfg ():
+            config_params Class object
+        date_list: list of datetime dates
+            dates to retrieve data
+        prod_list: list of strings
+            products to retrieve
+        time_int: string
+            time interval, passed through to 'build_task_graph'
+        ledger: run_ledger
+            ledger with completed tasks and recorded throughput
+        force_flag: boolean
+            True : plan as if no tasks were completed
+        plan_path: string
+            csv file listing every remote file to download
+                Default - None, 'shread_plan.csv' in 'cfg.dir_work'
+
+    Returns
+    -------
+        plan: dict
+            product mapped to dict with dates, files, nbytes, hours,
+            scratch bytes, and kept bytes written to 'dir_dat_snodas'
+
+    Notes
+    -----
+    Nothing is downloaded or processed. Dates completed in the ledger and
+    files already local are skipped: in the working directory, the download
+    cache, 'dir_arch', or for snodas decompressed grids kept in
+    'dir_dat_snodas', see 'local_copy'. Bytes and hours
+    are estimated from backfill chunks recorded in the ledger, hours falling
+    back to mean task times, and bytes to 'prod_file_bytes'. Scratch peak
+    is organize tasks running at once times 'prod_scratch_bytes' plus
+    prefetched downloads, streamed snodas tars are not written to the working
+    directory. Grids newly kept in 'dir_dat_snodas' are reported separately
+    as they stay on disk. Products run concurrently so wall time is between
+    the longest product and the sum of all products.
+
+    """
+    if plan_path is None:
+        plan_path = cfg.dir_work + 'shread_plan.csv'
+    graph = build_task_graph(cfg, date_list, prod_list, time_int)
+    if not force_flag:
+        graph = prune_task_graph(graph, ledger)
+
+    plan = {}
+    plan_rows = []
+    for prod in prod_list:
+        if prod == 'modis':
+            print("plan: {} files are found by CMR search, not planned".format(prod))
+            continue
+        tags = set(key[1] for key in graph if key[0] == prod)
+        if prod == 'swann':
+            prod_dates = date_list if tags else []
+        elif prod == 'ndfd':
+            prod_dates = []
+        else:
+            prod_dates = [date_dn for date_dn in date_list if date_dn.strftime('%Y%m%d') in tags]
+        files = remote_files(cfg, prod, prod_dates)
+        files_new = [f for f in files if local_copy(cfg, prod, f) is None]
+        days_new = sum(dict((f[0], f[1]) for f in files_new).values())
+        n_days = len(prod_dates)
+        plan_rows.extend([prod] + f for f in files_new)
+
+        # bytes, history in bytes per day or default bytes per file
+        hist_days, hist_bytes, hist_elapsed = ledger.throughput(prod)
+        if hist_days > 0 and hist_bytes > 0 and prod != 'ndfd':
+            nbytes = days_new * hist_bytes / hist_days
+            bytes_per_date = hist_bytes / hist_days
+        else:
+            nbytes = len(files_new) * prod_file_bytes.get(prod, 0)
+            bytes_per_date = nbytes / max(len(set(f[0] for f in files_new)), 1)
+
+        # wall time, history in days per hour or mean task times
+        org_jobs = cfg.prod_jobs.get((prod, 'org'), cfg.prod_jobs.get((prod, None), prod_jobs.get(prod, 1)))
+        n_parallel = max(min(org_jobs, cfg.n_cpu), 1)
+        hours = None
+        if hist_days > 0 and hist_elapsed > 0 and prod != 'ndfd':
+            hours = n_days / (hist_days / hist_elapsed * 3600)
+        else:
+            task_elapsed = ledger.task_elapsed(prod)
+            if task_elapsed:
+                n_tasks = n_days if prod not in ('ndfd', 'swann') else len(tags)
+                hours = n_tasks * sum(task_elapsed.values()) / n_parallel / 3600
+
+        scratch = n_parallel * prod_scratch_bytes.get(prod, 0)
+        if prod == 'snodas' and getattr(cfg, 'snodas_stream', False):
+            pass
+        elif prod in prod_funcs and prod_funcs[prod][1] is not None:
+            scratch += cfg.max_prefetch * bytes_per_date
+        else:
+            scratch += bytes_per_date
+        # decompressed snodas grids are kept, int16 full grids
+        kept = 0
+        if prod == 'snodas' and getattr(cfg, 'dir_dat_snodas', None):
+            kept = len(set(f[0] for f in files_new)) * len(cfg.snodas_vars) * snodas_nrows * snodas_ncols * 2
+        plan[prod] = {'dates': n_days, 'files': len(files_new), 'files_local': len(files) - len(files_new),
+                      'nbytes': nbytes, 'hours': hours, 'scratch': scratch, 'kept': kept}
+
+    # report
+    print("plan: {} to {}, {} dates, modis tiles {}, ndfd parameters {}".format(
+        date_list[0].strftime('%Y-%m-%d') if date_list else '-', date_list[-1].strftime('%Y-%m-%d') if date_list else '-',
+        len(date_list), ','.join(cfg.singrd_tile_list), ','.join(getattr(cfg, 'ndfd_parameters', []))))
+    for prod, p in plan.items():
+        print("plan: {0}: {1} dates to process, {2} files to download ({3} already local), {4:.2f} GB, {5}, scratch {6:.2f} GB".format(
+            prod, p['dates'], p['files'], p['files_local'], p['nbytes'] / 1024**3,
+            "{:.1f} h".format(p['hours']) if p['hours'] is not None else "time unknown (no history)",
+            p['scratch'] / 1024**3))
+        if p['kept']:
+            print("plan: {0}: {1:.2f} GB of decompressed grids kept in {2}".format(prod, p['kept'] / 1024**3, cfg.dir_dat_snodas))
+    hours_list = [p['hours'] for p in plan.values() if p['hours'] is not None]
+    total_gb = sum(p['nbytes'] for p in plan.values()) / 1024**3
+    scratch_gb = sum(p['scratch'] for p in plan.values()) / 1024**3
+    print("plan: total {0:.2f} GB to download, scratch peak {1:.2f} GB".format(total_gb, scratch_gb))
+    if os.path.isdir(cfg.dir_work):
+        free_gb = shutil.disk_usage(cfg.dir_work).free / 1024**3
+        print("plan: {0:.2f} GB free in {1}{2}".format(free_gb, cfg.dir_work, ", NOT ENOUGH" if free_gb < scratch_gb + cfg.min_free_gb else ""))
+    if hours_list:
+        print("plan: wall time {0:.1f} - {1:.1f} h".format(max(hours_list), sum(hours_list)))
+
+    # list of every remote file
+    dir_plan = os.path.dirname(plan_path)
+    if dir_plan and not os.path.isdir(dir_plan):
+        os.makedirs(dir_plan)
+    with open(plan_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['product', 'tag', 'days', 'url', 'path'])
+        writer.writerows(plan_rows)
+    print("plan: file list written to {}".format(plan_path))
+    return plan
+
+# seconds an external gdal or rio command may run, see 'run_command'
+command_timeout = 1800
+
+def run_command(cmd_list, timeout = None):
+    """Run an external command with a wall-clock limit
+
+    Parameters
+    ---------
+        cmd_list: list of strings
+            command and arguments, run without a shell
+        timeout: float
+            seconds before the command is killed
+                Default - None, 'command_timeout'
+
+    Returns
+    -------
+        None
+
+    Notes
+    -----
+    Replaces os.system, which waits forever on a hung gdalwarp and ignores
+    failures. Raises subprocess.TimeoutExpired after killing the command,
+    or subprocess.CalledProcessError when it exits with an error.
+
+    """
+    logger.info("run_command: {}".format(subprocess.list2cmdline(cmd_list)))
+    subprocess.run(cmd_list, check=True, timeout=timeout or command_timeout)
+
+def gdal_raster_reproject(file_in, file_out, crs_out, crs_in = None):
+    """wrapper around gdalwarp for reprojecting rasters
+    Parameters
+    ---------
+        file_in: string
+            file path of input raster
+        file_out: string
+            file path of output raster
+        crs_out: string
+            EPSG spatial reference for output raster coordinate system in
+                'EPSG:X' format
+        crs_in: string
+            EPSG spatial reference for input raster coordinate system
+                Default - None as gdalwarp can read coordinate system of
+                input raster if available
+    Returns
+    -------
+        None
+
+    Notes
+    -----
+    Requires gdal_path be set in config ini file and gdal be available
+
+    """
+
+    if crs_in != None:
+        run_command(["gdalwarp", "-s_srs", crs_in, "-t_srs", crs_out, file_in, file_out])
+    else:
+        run_command(["gdalwarp", "-t_srs", crs_out, file_in, file_out])
 
 def rasterio_raster_reproject(file_in, file_out, crs_out, nodata = None):
     """wrapper around rasterio for reprojecting rasters
@@ -2674,6 +7331,8 @@ def rasterio_raster_reproject(file_in, file_out, crs_out, nodata = None):
         requires methods from rasterio.warp
         import rasterio
         from rasterio.warp import calculate_default_transform, reproject, Resampling
+from rasterio.transform import from_origin, Affine
+from rasterio.features import geometry_mask
     """
     if nodata != None:
         with rasterio.open(file_in) as src:
@@ -2743,8 +7402,7 @@ def gdal_raster_merge(file_list_in, file_out):
 
     gdal_merge = os.path.join(cfg.gdal_path, 'gdal_merge.py')
     cmd_list = ["python", gdal_merge, "-o", file_out] + file_list_in
-    cmd_string = " ".join(cmd_list)
-    os.system(cmd_string)
+    run_command(cmd_list)
 
 def rasterio_raster_merge(file_list_in, file_out):
     """wrapper around rasterio for merging rasters
@@ -2801,7 +7459,7 @@ def rio_calc(rast_in, rast_out, calc_exp):
     -----
     Requires rasterio
     """
-    os.system('rio calc "{0}" {1} {2}'.format(calc_exp, rast_in, rast_out))
+    run_command(["rio", "calc", calc_exp, rast_in, rast_out])
 
 def rio_dtype_conversion(rast_in, rast_out, dtype_out):
     """wrapper around rio calc from rasterio package for raster math
@@ -2822,7 +7480,7 @@ def rio_dtype_conversion(rast_in, rast_out, dtype_out):
     -----
     Requires rasterio
     """
-    os.system('rio convert -t "{0}" {1} {2}'.format(dtype_out, rast_in, rast_out))
+    run_command(["rio", "convert", "-t", dtype_out, rast_in, rast_out])
 
 def gdal_raster_clip(poly_in, rast_in, rast_out, crs_in, crs_out, nodata):
     """wrapper around gdalwarp for clipping rasters with polygon
@@ -2856,7 +7514,8 @@ def gdal_raster_clip(poly_in, rast_in, rast_out, crs_in, crs_out, nodata):
 
     """
 
-    os.system("gdalwarp -s_srs {0} -t_srs {1} -of GTiff -cutline {2} -crop_to_cutline -dstnodata {3} {4} {5}".format(crs_in, crs_out, poly_in, nodata, rast_in, rast_out))
+    run_command(["gdalwarp", "-s_srs", crs_in, "-t_srs", crs_out, "-of", "GTiff", "-cutline", poly_in,
+                 "-crop_to_cutline", "-dstnodata", str(nodata), rast_in, rast_out])
     # error handling
 
 def gdal_raster_singleband(rast_in, rast_out, band = 1):
@@ -2882,7 +7541,7 @@ def gdal_raster_singleband(rast_in, rast_out, band = 1):
 
 
     """
-    os.system("gdal_translate -b {0} {1} {2}".format(band, rast_in, rast_out))
+    run_command(["gdal_translate", "-b", str(band), rast_in, rast_out])
 
 # MODIS tile definition
 tiles = [
@@ -3778,15 +8437,13 @@ def cmr_download(urls):
                                     filename))
 
         try:
-            # In Python 3 we could eliminate the opener and just do 2 lines:
-            # resp = requests.get(url, auth=(username, password))
-            # open(filename, 'wb').write(resp.content)
+            # stream to a temporary file so granules are never held in memory
+            # and a failed transfer does not leave a partial file
             req = Request(url)
             if credentials:
                 req.add_header('Authorization', 'Basic {0}'.format(credentials))
             opener = build_opener(HTTPCookieProcessor())
-            data = opener.open(req).read()
-            open(filename, 'wb').write(data)
+            url_download(url, filename, opener=opener, request=req)
         except HTTPError as e:
             print('HTTP error {0}, {1}'.format(e.code, e.reason))
         except URLError as e:
@@ -3902,7 +8559,8 @@ def cmr_search(short_name, version, time_start, time_end,
             req = Request(cmr_query_url)
             if cmr_scroll_id:
                 req.add_header('cmr-scroll-id', cmr_scroll_id)
-            response = urlopen(req, context=ctx)
+            # throttled pages are retried, see 'host_call'
+            response = host_call(cmr_query_url, functools.partial(urlopen, req, context=ctx, timeout=60))
             if not cmr_scroll_id:
                 # Python 2 and 3 have different case for the http headers
                 headers = {k.lower(): v for k, v in dict(response.info()).items()}
@@ -3954,4 +8612,5 @@ def wyear_dt(date):
 
 if __name__ == '__main__':
     args = parse_args()
-    main(args.ini, args.start, args.end, args.time, args.prod)
+    main(args.ini, args.start, args.end, args.time, args.prod, args.force, args.backfill, args.daemon,
+         args.n_io, args.n_cpu, args.jobs, args.backends, args.queue, args.worker, args.plan, args.latest)
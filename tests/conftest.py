@@ -0,0 +1,107 @@
+"""Shared fixtures for the SHREAD checks, a local http.server stand-in for
+the remote data hosts"""
+
+import http.server
+import os
+import socketserver
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shread
+
+
+class local_server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """http server answering GET and HEAD requests from a replies function
+
+    Attributes
+    ----------
+        replies: function
+            called with the request path, returns (status, headers, body,
+                delay seconds before the reply)
+        paths: list of strings
+            paths requested, in order, 'HEAD ' before HEAD requests
+        in_flight: integer
+            requests being answered
+        max_in_flight: integer
+            most requests answered at once
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        """ """
+        super().__init__(('127.0.0.1', 0), local_handler)
+        self.replies = lambda path: (200, {}, b'', 0)
+        self.paths = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        """ """
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+
+class local_handler(http.server.BaseHTTPRequestHandler):
+    """ """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        """ """
+        pass
+
+    def do_GET(self):
+        """ """
+        self.reply(True)
+
+    def do_HEAD(self):
+        """ """
+        self.reply(False)
+
+    def reply(self, body_flag):
+        """Answer from 'local_server.replies', HEAD requests get headers only"""
+        server = self.server
+        with server.lock:
+            server.paths.append(self.path if body_flag else 'HEAD ' + self.path)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            status, headers, body, delay = server.replies(self.path)
+            time.sleep(delay)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if body_flag:
+                self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # client gave up, e.g. a timed out transfer
+            pass
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Local http server, with fresh per-process host controllers, sessions
+    and download engines so tests do not share limits"""
+    monkeypatch.setattr(shread, 'host_controllers', {})
+    monkeypatch.setattr(shread, 'host_sessions', {})
+    monkeypatch.setattr(shread, 'download_engines', {})
+    srv = local_server()
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+    for engine in shread.download_engines.values():
+        engine.close()
@@ -0,0 +1,104 @@
+"""Checks of the download engine against a local stand-in for JPL, see
+'download_engine' and 'download_modscag'"""
+
+import datetime as dt
+import os
+import threading
+import time
+
+import pytest
+
+import shread
+
+
+class config:
+    """Settings used by 'download_modscag' and 'get_download_engine'"""
+
+    def __init__(self, host, dir_work):
+        """ """
+        self.host_jpl = host
+        self.dir_http_modscag = '/modscag/'
+        self.username_jpl = 'user'
+        self.password_jpl = 'password'
+        self.ssl_verify = False
+        self.host_limit = 3
+        self.download_timeout = 60
+        self.dir_work = dir_work
+        self.singrd_tile_list = ['h08v04', 'h08v05', 'h09v04', 'h09v05', 'h10v04', 'h10v05']
+
+
+def test_modscag_tiles_transfer_concurrently(server, tmp_path):
+    body = b'tif' * 1000
+
+    def replies(path):
+        if path.endswith('.tif'):
+            return 200, {}, body, 0.3
+        return 200, {}, b'<a href="MOD09GA.tif">', 0
+    server.replies = replies
+    cfg = config(server.url, str(tmp_path) + '/')
+    bytes_start = shread.download_bytes.get('modscag', 0)
+
+    shread.download_modscag(cfg, dt.datetime(2021, 3, 1))
+
+    # all 12 tiles downloaded, up to host_limit in flight at once
+    tifs = sorted(os.listdir(str(tmp_path / 'modscag')))
+    assert len(tifs) == 12
+    assert all(os.path.getsize(str(tmp_path / 'modscag' / tif)) == len(body) for tif in tifs)
+    assert 1 < server.max_in_flight <= cfg.host_limit
+    assert shread.download_bytes['modscag'] - bytes_start == 12 * len(body)
+
+
+def test_callbacks_report_each_transfer(server, tmp_path):
+    def replies(path):
+        if path.startswith('/missing'):
+            return 404, {}, b'', 0
+        return 200, {}, b'data', 0.1
+    server.replies = replies
+    engine = shread.get_download_engine(config(server.url, str(tmp_path) + '/'))
+    done = []
+    lock = threading.Lock()
+
+    def callback(url, path, error):
+        with lock:
+            done.append((url, path, error, os.path.isfile(path)))
+
+    futures = []
+    for i in range(6):
+        url = server.url + '/file{}.tif'.format(i)
+        futures.append(engine.submit(url, str(tmp_path / 'file{}.tif'.format(i)), callback=callback))
+    missing = engine.submit(server.url + '/missing.tif', str(tmp_path / 'missing.tif'), callback=callback)
+
+    for i, future in enumerate(futures):
+        assert future.result(timeout=30) == str(tmp_path / 'file{}.tif'.format(i))
+    with pytest.raises(Exception):
+        missing.result(timeout=30)
+
+    # one callback for every transfer, the file is in place when it is called
+    assert len(done) == 7
+    for url, path, error, exists in done:
+        if url.endswith('/missing.tif'):
+            assert error is not None and not exists
+        else:
+            assert error is None and exists
+
+
+def test_transfer_timeout(server, tmp_path):
+    def replies(path):
+        if path.startswith('/slow'):
+            return 200, {}, b'late', 5
+        return 200, {}, b'data', 0
+    server.replies = replies
+    engine = shread.get_download_engine(config(server.url, str(tmp_path) + '/'))
+    errors = []
+
+    # a transfer past its own timeout fails without holding up the others
+    started = time.time()
+    slow = engine.submit(server.url + '/slow.tif', str(tmp_path / 'slow.tif'), timeout=1,
+                         callback=lambda url, path, error: errors.append(error))
+    fast = engine.submit(server.url + '/fast.tif', str(tmp_path / 'fast.tif'))
+    assert fast.result(timeout=30) == str(tmp_path / 'fast.tif')
+    with pytest.raises(Exception):
+        slow.result(timeout=30)
+    assert time.time() - started < 5
+    assert len(errors) == 1 and errors[0] is not None
+    assert not os.path.isfile(str(tmp_path / 'slow.tif'))
@@ -0,0 +1,132 @@
+"""Checks of the adaptive host limits, see 'host_controller' and 'host_call'"""
+
+import threading
+import time
+
+import requests
+
+import shread
+
+
+def get_url(url):
+    """ """
+    return shread.host_call(url, lambda: shread.raise_for_throttle(requests.get(url, timeout=10)).content,
+                            limit_max=4)
+
+
+def run_calls(url, n, n_threads = 8):
+    """Send n requests from n_threads threads through 'host_call'"""
+    def call():
+        for i in range(n // n_threads):
+            get_url(url)
+    threads = [threading.Thread(target=call) for i in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_throttling_drops_and_recovers_limit(server):
+    server.replies = lambda path: (200, {}, b'ok', 0.02)
+    url = server.url + '/data'
+    controller = shread.get_host_controller(url, limit_max=4)
+
+    # successful requests raise the limit to its maximum, never exceeding it
+    run_calls(url, 40)
+    assert controller.limit == 4
+    assert server.max_in_flight <= 4
+
+    # 429 with Retry-After for the next requests, then 200 again
+    n_throttled = [3]
+
+    def replies(path):
+        with server.lock:
+            n_throttled[0] -= 1
+            throttled = n_throttled[0] >= 0
+        if throttled:
+            return 429, {'Retry-After': '1'}, b'slow down', 0
+        return 200, {}, b'ok', 0.02
+    server.replies = replies
+
+    started = time.time()
+    assert get_url(url) == b'ok'
+    elapsed = time.time() - started
+
+    # each retry waited for Retry-After and the limit was halved to its
+    # minimum, the request that got through then raised it by one
+    assert elapsed >= 3
+    assert controller.limit == 2
+    assert controller.stats['throttled'] == 3
+    assert controller.stats['decreases'] == 3
+
+    # the limit climbs back once requests succeed
+    server.max_in_flight = 0
+    run_calls(url, 40)
+    assert controller.limit == 4
+    assert controller.stats['increases'] >= 3
+    assert server.max_in_flight <= 4
+
+
+def test_retry_after_holds_other_requests(server):
+    server.replies = lambda path: (200, {}, b'ok', 0)
+    url = server.url + '/data'
+    controller = shread.get_host_controller(url, limit_max=4)
+
+    # a throttled reply holds every new request to the host, not only its retry
+    controller.release(controller.acquire(), throttled=True, retry_after=1)
+    started = time.time()
+    assert get_url(url) == b'ok'
+    assert time.time() - started >= 0.9
+
+
+def test_errors_are_not_retried(server):
+    server.replies = lambda path: (404, {}, b'missing', 0)
+    url = server.url + '/missing'
+    controller = shread.get_host_controller(url, limit_max=4)
+
+    try:
+        shread.host_call(url, lambda: requests.get(url, timeout=10).raise_for_status(), limit_max=4)
+    except requests.exceptions.HTTPError as e:
+        assert e.response.status_code == 404
+    else:
+        raise AssertionError('404 was not raised')
+    assert len(server.paths) == 1
+    assert controller.stats['throttled'] == 0
+
+
+def test_errors_do_not_raise_limit(server):
+    server.replies = lambda path: (404, {}, b'missing', 0)
+    url = server.url + '/missing'
+    controller = shread.get_host_controller(url, limit_max=4)
+    limit = controller.limit
+
+    for i in range(10):
+        try:
+            shread.host_call(url, lambda: requests.get(url, timeout=10).raise_for_status(), limit_max=4)
+        except requests.exceptions.HTTPError:
+            pass
+    assert controller.limit == limit
+    assert controller.stats['errors'] == 10
+    assert controller.stats['ok'] == 0
+
+
+def test_resume_download_waits_out_throttling(server, tmp_path):
+    body = b'snow' * 1000
+    n_throttled = [1]
+
+    def replies(path):
+        with server.lock:
+            n_throttled[0] -= 1
+            throttled = n_throttled[0] >= 0
+        if throttled:
+            return 429, {'Retry-After': '1'}, b'', 0
+        return 200, {}, body, 0
+    server.replies = replies
+    path = str(tmp_path / 'swann.nc')
+
+    # a 429 is retried after Retry-After instead of failing the download
+    started = time.time()
+    assert shread.resume_download(server.url + '/swann.nc', path, timeout=60) == len(body)
+    assert time.time() - started >= 0.9
+    with open(path, 'rb') as f:
+        assert f.read() == body